@@ -0,0 +1,253 @@
+"""
+Admission control for Wonder of U's upstream AI calls
+Caps concurrent and per-second calls across every worker on the host and
+rate-limits each game, so a traffic spike queues briefly or falls back
+instead of exhausting workers and hitting the provider's rate limit for
+everyone at once
+"""
+import asyncio
+import os
+import random
+import secrets
+import sqlite3
+import threading
+import time
+from asgiref.sync import sync_to_async
+
+class Ticket:
+    """Outcome of an admission request; release it once the call is done
+
+    ``outcome`` is one of ``admitted``, ``queued`` (admitted after waiting),
+    ``session_limited``, ``queue_full``, ``shed`` (pushed out of the queue
+    by a more urgent game) or ``timed_out``.
+    """
+
+    __slots__ = ('token', 'priority', 'outcome', 'waited')
+
+    def __init__(self, token, priority):
+        self.token = token
+        self.priority = priority
+        self.outcome = None
+        self.waited = 0.0
+
+    @property
+    def admitted(self):
+        return self.outcome in ('admitted', 'queued')
+
+class AdmissionController:
+    """Host-wide upstream call limiter backed by SQLite
+
+    A call needs one of ``max_concurrent`` slots and, when ``rate`` is set,
+    a token from a bucket refilled at ``rate`` per second (up to ``burst``).
+    Each player also has a bucket of ``session_burst`` calls refilled at
+    ``session_rate`` per second. Calls that find no slot wait in a queue of
+    ``queue_size`` for up to ``queue_timeout`` seconds, higher ``priority``
+    first; when the queue is full a new call pushes out the least urgent
+    waiter, or is refused if there is none. Slots of crashed workers expire
+    after ``slot_ttl``.
+    """
+
+    def __init__(self, path, max_concurrent=16, rate=0.0, burst=10, queue_size=32,
+                 queue_timeout=2.0, session_rate=0.5, session_burst=5, slot_ttl=45.0,
+                 poll_interval=0.05, enabled=True):
+        self.path = str(path)
+        self.max_concurrent = max_concurrent
+        self.rate = rate
+        self.burst = burst
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.session_rate = session_rate
+        self.session_burst = session_burst
+        self.slot_ttl = slot_ttl
+        self.poll_interval = poll_interval
+        self.enabled = enabled
+        self._local = threading.local()
+
+    def _connect(self):
+        """Return this thread's connection, reopening it after a fork"""
+
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS in_flight (
+                    token TEXT PRIMARY KEY,
+                    priority INTEGER NOT NULL,
+                    expires REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS waiting (
+                    token TEXT PRIMARY KEY,
+                    priority INTEGER NOT NULL,
+                    enqueued REAL NOT NULL,
+                    expires REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS buckets (
+                    key TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    updated REAL NOT NULL
+                );
+            ''')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def acquire(self, player=None, priority=0):
+        """Wait for an upstream slot; returns a Ticket (check ``admitted``)"""
+
+        ticket = Ticket(secrets.token_hex(8), priority)
+        if not self.enabled:
+            ticket.outcome = 'admitted'
+            return ticket
+
+        started = time.monotonic()
+        outcome = self._step(ticket, player, entering=True)
+        while outcome == 'wait':
+            if time.monotonic() - started >= self.queue_timeout:
+                outcome = self._leave(ticket)
+                break
+            time.sleep(self.poll_interval)
+            outcome = self._step(ticket, player, entering=False)
+        return self._settle(ticket, outcome, started)
+
+    async def aacquire(self, player=None, priority=0):
+        """Async ``acquire``: waits on the event loop instead of parking a thread"""
+
+        ticket = Ticket(secrets.token_hex(8), priority)
+        if not self.enabled:
+            ticket.outcome = 'admitted'
+            return ticket
+
+        step = sync_to_async(self._step, thread_sensitive=False)
+        started = time.monotonic()
+        outcome = await step(ticket, player, entering=True)
+        while outcome == 'wait':
+            if time.monotonic() - started >= self.queue_timeout:
+                outcome = await sync_to_async(self._leave, thread_sensitive=False)(ticket)
+                break
+            await asyncio.sleep(self.poll_interval)
+            outcome = await step(ticket, player, entering=False)
+        return self._settle(ticket, outcome, started)
+
+    def _settle(self, ticket, outcome, started):
+        ticket.waited = time.monotonic() - started
+        if outcome == 'admitted' and ticket.waited > self.poll_interval:
+            outcome = 'queued'
+        ticket.outcome = outcome
+        return ticket
+
+    def _step(self, ticket, player, entering):
+        """One admission attempt; returns an outcome or 'wait'"""
+
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('DELETE FROM in_flight WHERE expires < ?', (now,))
+            conn.execute('DELETE FROM waiting WHERE expires < ?', (now,))
+
+            if entering:
+                if player is not None and self.session_rate > 0:
+                    if not self._take_token(conn, f'session:{player}', self.session_rate, self.session_burst, now):
+                        return 'session_limited'
+                ahead = conn.execute(
+                    'SELECT COUNT(*) FROM waiting WHERE priority >= ?', (ticket.priority,)
+                ).fetchone()[0]
+            else:
+                row = conn.execute('SELECT enqueued FROM waiting WHERE token = ?', (ticket.token,)).fetchone()
+                if row is None:
+                    return 'shed'
+                ahead = conn.execute(
+                    'SELECT COUNT(*) FROM waiting WHERE priority > ? OR (priority = ? AND enqueued < ?)',
+                    (ticket.priority, ticket.priority, row[0])
+                ).fetchone()[0]
+
+            busy = conn.execute('SELECT COUNT(*) FROM in_flight').fetchone()[0]
+            if (self.max_concurrent <= 0 or busy + ahead < self.max_concurrent) and (
+                    self.rate <= 0 or self._take_token(conn, '', self.rate, self.burst, now)):
+                conn.execute('DELETE FROM waiting WHERE token = ?', (ticket.token,))
+                conn.execute(
+                    'INSERT INTO in_flight (token, priority, expires) VALUES (?, ?, ?)',
+                    (ticket.token, ticket.priority, now + self.slot_ttl)
+                )
+                return 'admitted'
+
+            if entering:
+                waiting = conn.execute('SELECT COUNT(*) FROM waiting').fetchone()[0]
+                if waiting >= self.queue_size:
+                    victim = conn.execute(
+                        'SELECT token FROM waiting WHERE priority < ? ORDER BY priority, enqueued DESC LIMIT 1',
+                        (ticket.priority,)
+                    ).fetchone()
+                    if victim is None:
+                        return 'queue_full'
+                    conn.execute('DELETE FROM waiting WHERE token = ?', victim)
+                conn.execute(
+                    'INSERT INTO waiting (token, priority, enqueued, expires) VALUES (?, ?, ?, ?)',
+                    (ticket.token, ticket.priority, now, now + self.queue_timeout + 5)
+                )
+
+            # Forget idle players' buckets now and then
+            if random.random() < 0.01:
+                conn.execute(
+                    "DELETE FROM buckets WHERE key LIKE 'session:%' AND updated < ?",
+                    (now - 2 * self.session_burst / max(self.session_rate, 1e-6),)
+                )
+            return 'wait'
+
+    def take_token(self, key, rate, burst):
+        """Take a token from a named host-wide bucket; False if it is empty
+
+        Lets other limits share the host-wide state, e.g. an upstream
+        endpoint's own request rate (see llm_router.py).
+        """
+
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            return self._take_token(conn, key, rate, burst, time.time())
+
+    def _take_token(self, conn, key, rate, burst, now):
+        """Take one token from a bucket; False if it is empty"""
+
+        row = conn.execute('SELECT tokens, updated FROM buckets WHERE key = ?', (key,)).fetchone()
+        tokens = burst if row is None else min(burst, row[0] + (now - row[1]) * rate)
+        if tokens < 1:
+            return False
+        conn.execute(
+            'INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)',
+            (key, tokens - 1, now)
+        )
+        return True
+
+    def _leave(self, ticket):
+        """Give up waiting (only the ticket's own ``_step`` ever admits it)"""
+
+        conn = self._connect()
+        with conn:
+            conn.execute('DELETE FROM waiting WHERE token = ?', (ticket.token,))
+        return 'timed_out'
+
+    def release(self, ticket):
+        """Free the ticket's slot; safe to call for tickets that were refused"""
+
+        if ticket is None or ticket.token is None or not ticket.admitted or not self.enabled:
+            return
+        conn = self._connect()
+        with conn:
+            conn.execute('DELETE FROM in_flight WHERE token = ?', (ticket.token,))
+
+    def snapshot(self):
+        if not self.enabled:
+            return {'enabled': False}
+        now = time.time()
+        conn = self._connect()
+        return {
+            'enabled': True,
+            'in_flight': conn.execute('SELECT COUNT(*) FROM in_flight WHERE expires >= ?', (now,)).fetchone()[0],
+            'waiting': conn.execute('SELECT COUNT(*) FROM waiting WHERE expires >= ?', (now,)).fetchone()[0],
+            'max_concurrent': self.max_concurrent,
+            'queue_size': self.queue_size,
+        }
@@ -2,72 +2,1061 @@
 AI Service for Wonder of U - Mistral-7B Integration
 Handles AI responses that create challenging scenarios like Wonder of U from JoJo Part 8
 """
-import json
+import asyncio
+import contextvars
+import logging
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from functools import lru_cache
+from urllib.parse import urlsplit
+import httpx
 import requests
+from asgiref.sync import sync_to_async
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
 from django.conf import settings
-import random
+import instrumentation
+import intent
+import keywords
+from admission import AdmissionController, Ticket
+from calamity_pool import CalamityPool, CalamityRefiller
+from context_window import ContextWindow
+from engine import GameEngine, Rules
+from instrumentation import metrics, span
+from llm_router import Endpoint, Router, build_endpoints
+from response_cache import ResponseCache
+from resilience import LatencyTracker, parse_retry_after
+
+logger = logging.getLogger(__name__)
+
+# Where the last answer in this context came from: 'ai', 'cache', 'local' or 'fallback'
+response_source = contextvars.ContextVar('wonderofu_response_source', default=None)
+# The backend:model of the endpoint the last upstream call went to
+response_backend = contextvars.ContextVar('wonderofu_response_backend', default=None)
+
+class _TimedConnect:
+    """Reports each new upstream connection (TCP, plus TLS for https) as a stage"""
+    
+    def connect(self):
+        started = time.perf_counter()
+        super().connect()
+        instrumentation.record('upstream_connect', time.perf_counter() - started)
+
+class TimedHTTPConnection(_TimedConnect, HTTPConnection):
+    pass
+
+class TimedHTTPSConnection(_TimedConnect, HTTPSConnection):
+    pass
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+class KeepAliveAdapter(HTTPAdapter):
+    """HTTPAdapter whose pooled sockets use TCP keep-alive probes
+    
+    Idle pooled connections are otherwise silently dropped by NATs and load
+    balancers, and the next request pays for a failed send plus a reconnect.
+    """
+    
+    def __init__(self, keep_alive=True, **kwargs):
+        self.keep_alive = keep_alive
+        super().__init__(**kwargs)
+    
+    def init_poolmanager(self, *args, **kwargs):
+        if self.keep_alive:
+            socket_options = [
+                (socket.IPPROTO_TCP, socket.TCP_NODELAY, 1),
+                (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+            ]
+            # Linux-only knobs: start probing after 30s idle, every 10s
+            for name, value in (('TCP_KEEPIDLE', 30), ('TCP_KEEPINTVL', 10), ('TCP_KEEPCNT', 3)):
+                if hasattr(socket, name):
+                    socket_options.append((socket.IPPROTO_TCP, getattr(socket, name), value))
+            kwargs['socket_options'] = socket_options
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': TimedHTTPConnectionPool,
+            'https': TimedHTTPSConnectionPool,
+        }
 
 class MistralAI:
-    def __init__(self):
-        self.api_key = settings.MISTRAL_API_KEY
-        self.base_url = "https://api.mistral.ai/v1/chat/completions"
-        # Updated model name for 2025
-        self.model = "mistral-small-latest"  # Use latest stable model
+    def __init__(self, backend=None):
+        # The endpoints calls are routed between (LLM_ENDPOINTS), each with
+        # its own backend: the Mistral API or the local stand-in server.
+        # A ``backend`` given here is the only endpoint.
+        if backend is not None:
+            endpoints = [Endpoint(
+                backend.name, backend,
+                failure_threshold=settings.MISTRAL_BREAKER_FAILURES,
+                reset_timeout=settings.MISTRAL_BREAKER_RESET,
+            )] if backend.available else []
+        else:
+            endpoints = build_endpoints(
+                settings.LLM_ENDPOINTS,
+                api_key=settings.MISTRAL_API_KEY,
+                failure_threshold=settings.MISTRAL_BREAKER_FAILURES,
+                reset_timeout=settings.MISTRAL_BREAKER_RESET,
+            )
+        
+        # One connection pool per upstream host shared by every thread in
+        # the worker; each thread gets its own Session (Sessions are not
+        # thread-safe) mounted on the same adapter, so connections are
+        # reused across requests. One worker may hold every admission slot
+        # on the host, so it gets at least that many connections and
+        # threads: an admitted call never waits for one.
+        self.pool_size = max(settings.MISTRAL_POOL_SIZE,
+                             settings.ADMISSION_MAX_CONCURRENT if settings.ADMISSION_ENABLED else 0)
+        self.keep_alive = settings.MISTRAL_KEEP_ALIVE
+        self.timeout = (settings.MISTRAL_CONNECT_TIMEOUT, settings.MISTRAL_READ_TIMEOUT)
+        self._adapter = KeepAliveAdapter(
+            keep_alive=self.keep_alive,
+            pool_connections=max(1, len({urlsplit(endpoint.backend.url).netloc for endpoint in endpoints})),
+            pool_maxsize=self.pool_size,
+            pool_block=False,
+        )
+        self._local = threading.local()
+        
+        # Upstream calls run on their own threads so a request can stop
+        # waiting at its latency budget while the call finishes (and is
+        # cached) in the background (see _await_call)
+        self._executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix='mistral')
+        self._background = set()
+        
+        # Deadlines follow observed latency: full completions, and time to
+        # first token for streams
+        budget = dict(
+            percentile=settings.MISTRAL_BUDGET_PERCENTILE,
+            multiplier=settings.MISTRAL_BUDGET_MULTIPLIER,
+            floor=settings.MISTRAL_BUDGET_MIN,
+            ceiling=settings.MISTRAL_BUDGET_MAX,
+        )
+        self.latency = LatencyTracker(**budget)
+        self.first_token_latency = LatencyTracker(**budget)
+        self.stats = {'calls': 0, 'hedged': 0, 'short_circuited': 0, 'late_cached': 0, 'shed': 0}
+        
+        # Host-wide cap on upstream calls, with a short priority queue
+        self.admission = AdmissionController(
+            settings.ADMISSION_PATH,
+            max_concurrent=settings.ADMISSION_MAX_CONCURRENT,
+            rate=settings.ADMISSION_RATE,
+            burst=settings.ADMISSION_BURST,
+            queue_size=settings.ADMISSION_QUEUE_SIZE,
+            queue_timeout=settings.ADMISSION_QUEUE_TIMEOUT,
+            session_rate=settings.ADMISSION_SESSION_RATE,
+            session_burst=settings.ADMISSION_SESSION_BURST,
+            slot_ttl=sum(self.timeout) + 5,
+            enabled=settings.ADMISSION_ENABLED,
+        )
+        
+        # Each call goes to the endpoint expected to answer fastest; every
+        # endpoint has its own breaker, and its rate limit is shared host-wide
+        self.router = Router(
+            endpoints,
+            limiter=self.admission.take_token,
+            slow_after=settings.LLM_ROUTER_SLOW_AFTER,
+            explore=settings.LLM_ROUTER_EXPLORE,
+        )
+        namespace = self.router.primary.label if endpoints else 'none'
+        
+        # Async client for the ASGI path, created lazily on the serving loop
+        self._async_client = None
+        self._async_client_loop = None
+        
+        # Raw AI responses shared between workers, keyed on command + state
+        self.response_cache = ResponseCache(
+            settings.RESPONSE_CACHE_PATH,
+            ttl=settings.RESPONSE_CACHE_TTL,
+            max_bytes=settings.RESPONSE_CACHE_MAX_BYTES,
+            variants=settings.RESPONSE_CACHE_VARIANTS,
+            escape_bucket_size=settings.RESPONSE_CACHE_ESCAPE_BUCKET,
+            enabled=settings.RESPONSE_CACHE_ENABLED,
+            namespace=namespace,
+        )
+        
+        # Pre-generated fallback responses, topped up in the background
+        # whenever players leave the upstream idle
+        self._last_call = 0.0
+        self.calamities = CalamityPool(
+            settings.CALAMITY_POOL_PATH,
+            size=settings.CALAMITY_POOL_SIZE,
+            low_water=settings.CALAMITY_POOL_LOW_WATER,
+            max_uses=settings.CALAMITY_POOL_MAX_USES,
+            escape_bucket_size=settings.RESPONSE_CACHE_ESCAPE_BUCKET,
+            max_escape_attempts=settings.MAX_ESCAPE_ATTEMPTS,
+            enabled=settings.CALAMITY_POOL_ENABLED,
+            namespace=namespace,
+        )
+        self.calamity_refiller = CalamityRefiller(
+            self.calamities,
+            self._generate_calamity,
+            self._upstream_idle,
+            refill_rate=settings.CALAMITY_POOL_REFILL_RATE,
+            enabled=bool(endpoints),
+        )
+        
+        # Routine commands (going north, looking around) are answered from
+        # the pool without asking the LLM when the intent classifier is sure
+        self.intents = None
+        if settings.INTENT_ROUTING_ENABLED:
+            self.intents = intent.load_or_train(settings.INTENT_MODEL_PATH)
+            self._classify_intent = lru_cache(maxsize=1024)(self.intents.predict)
+        self.intent_threshold = settings.INTENT_BYPASS_THRESHOLD
+        self.local_intents = frozenset(settings.INTENT_LOCAL_INTENTS) & set(intent.POOL_CATEGORIES)
+        
+        # What the forest remembers of each game, in a fixed token budget.
+        # The system prompt holds no game state, so it is built once and
+        # every call sends the same prefix.
+        self.context = ContextWindow(
+            budget=settings.CONTEXT_TOKEN_BUDGET,
+            summary_tokens=settings.CONTEXT_SUMMARY_TOKENS,
+            turn_tokens=settings.CONTEXT_TURN_TOKENS,
+            input_tokens=settings.CONTEXT_INPUT_TOKENS,
+        )
+        self._system_prompt = self._build_system_prompt()
+        
+        # The rules that judge each answer (engine.py), shared with the views
+        self.engine = GameEngine(rules=Rules(max_escape_attempts=settings.MAX_ESCAPE_ATTEMPTS), context=self.context)
+    
+    def _http(self):
+        """Return this thread's Session, bound to the shared connection pool"""
+        
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.mount('https://', self._adapter)
+            session.mount('http://', self._adapter)
+            if not self.keep_alive:
+                session.headers['Connection'] = 'close'
+            self._local.session = session
+        return session
+    
+    def warm_up(self, connections=None):
+        """Open pooled connections to the API before the first player arrives
+        
+        Performs the DNS lookup, TCP connect and TLS handshake for up to
+        ``connections`` sockets per endpoint URL (default: the pool size) in
+        parallel and leaves them idle in the pool. Returns the number of
+        connections that were established; failures are logged and never
+        raised.
+        """
+        
+        connections = min(connections or self.pool_size, self.pool_size)
+        urls = list(dict.fromkeys(endpoint.backend.url for endpoint in self.router.endpoints))
+        opened = []
         
-    def generate_response(self, user_input, game_state):
-        """Generate AI response that actively opposes player escape attempts"""
+        def open_connection(url):
+            try:
+                # HEAD is rejected by the endpoint, but the connection it
+                # opens is returned to the pool all the same
+                self._http().head(url, timeout=self.timeout, allow_redirects=False).close()
+                opened.append(True)
+            except Exception as e:
+                logger.warning("Connection warm-up failed: %s", e)
+        
+        threads = [threading.Thread(target=open_connection, args=(url,), daemon=True)
+                   for url in urls for _ in range(connections)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(self.timeout[0] + self.timeout[1])
+        
+        logger.info("Warmed up %d/%d connections to %s", len(opened), len(threads), ', '.join(urls))
+        return len(opened)
+        
+    def generate_response(self, user_input, game_state, player=None):
+        """Generate AI response that actively opposes player escape attempts
+        
+        ``player`` (the game ID) is rate-limited on its own by admission control.
+        """
         
         # Check if API key is available
-        if not self.api_key:
-            print("ERROR: MISTRAL_API_KEY not found in environment variables")
+        if not self.router.endpoints:
+            logger.error("MISTRAL_API_KEY not found in environment variables")
+            return self._fallback_response(user_input, game_state)
+        
+        cache_key = self.response_cache.make_key(user_input, game_state)
+        cached = self._cached_response(cache_key)
+        if cached is not None:
+            logger.debug("Response cache hit for input: %s", user_input)
+            return self._respond(cached, game_state, 'cache')
+        
+        local = self._local_response(user_input, game_state)
+        if local is not None:
+            return local
+        
+        if not self.router.available():
+            self.stats['short_circuited'] += 1
+            logger.info("Circuit breakers open, using fallback response")
             return self._fallback_response(user_input, game_state)
         
         # Build the game context for the AI
-        system_prompt = self._build_system_prompt(game_state)
-        user_prompt = self._build_user_prompt(user_input, game_state)
-        
-        try:
-            print(f"Making API call to Mistral for input: {user_input}")
-            response = requests.post(
-                self.base_url,
-                headers={
-                    "Authorization": f"Bearer {self.api_key}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": self.model,
-                    "messages": [
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": user_prompt}
-                    ],
-                    "temperature": 0.7,
-                    "max_tokens": 80,
-                    "top_p": 0.9
-                },
-                timeout=30
+        with span('prompt'):
+            system_prompt = self._system_prompt
+            user_prompt = self._build_user_prompt(user_input, game_state)
+        
+        ticket = self._admit(player, game_state)
+        if ticket is None:
+            return self._fallback_response(user_input, game_state, refused=True)
+        endpoint = self._route(ticket)
+        if endpoint is None:
+            self._release(ticket)
+            return self._fallback_response(user_input, game_state)
+        
+        logger.debug("Making API call for input: %s", user_input)
+        budget = self.latency.budget()
+        # The call's timings belong to this request, even from the executor
+        context = contextvars.copy_context()
+        self._count_call()
+        started = []
+        
+        def call():
+            started.append(time.monotonic())
+            return self._complete_admitted(ticket, endpoint, cache_key, system_prompt, user_prompt)
+        future = self._executor.submit(context.run, call)
+        
+        try:
+            with span('upstream'):
+                content = self._await_call(future, started, budget)
+        except FutureTimeoutError:
+            if future.cancel():
+                # Never got a thread: drop it before it reaches the upstream
+                self.router.release(endpoint)
+                self._release(ticket)
+                self.stats['shed'] += 1
+                logger.warning("AI call waited %.1fs for a thread, using fallback response", budget)
+                return self._fallback_response(user_input, game_state, refused=True)
+            # Answer the player now; the call carries on and caches its result
+            self._count_hedged()
+            future.add_done_callback(self._count_late_result)
+            logger.warning("AI call exceeded its %.1fs budget, using fallback response", budget)
+            return self._fallback_response(user_input, game_state)
+        except Exception as e:
+            logger.warning("AI Error: %s", e)
+            return self._fallback_response(user_input, game_state)
+        
+        if content is None:
+            return self._fallback_response(user_input, game_state)
+        return self._respond(content, game_state, 'ai')
+    
+    def _await_call(self, future, started, budget):
+        """``future.result`` with ``budget`` counted from when the call started
+        
+        ``started`` gets the call's start time once a thread picks it up.
+        Raises FutureTimeoutError when the call has run for ``budget``
+        seconds, or has waited that long without starting.
+        """
+        
+        deadline = time.monotonic() + budget
+        while True:
+            try:
+                return future.result(timeout=max(0.0, deadline - time.monotonic()))
+            except FutureTimeoutError:
+                # Time spent queued for a thread is not the upstream's
+                if not started or started[0] + budget <= deadline:
+                    raise
+                deadline = started[0] + budget
+    
+    def _complete_admitted(self, ticket, endpoint, *args):
+        """``_complete`` that frees its admission slot and endpoint when the call ends"""
+        
+        try:
+            return self._complete(endpoint, *args)
+        finally:
+            self.router.release(endpoint)
+            self._release(ticket)
+    
+    def _complete(self, endpoint, cache_key, system_prompt, user_prompt):
+        """Make one chat completions call and cache the result
+        
+        Returns the content, or None if the API answered with an error.
+        Feeds the latency tracker and the endpoint's figures and breaker
+        either way, even when the request that started the call has already
+        given up on it.
+        """
+        
+        backend = endpoint.backend
+        started = time.monotonic()
+        try:
+            response = self._http().post(
+                backend.url,
+                headers=backend.headers(),
+                json=backend.payload(system_prompt, user_prompt),
+                timeout=self.timeout
             )
+            instrumentation.record('upstream_ttfb', response.elapsed.total_seconds())
             
-            print(f"API Response Status: {response.status_code}")
+            if response.status_code != 200:
+                self._record_error_status(endpoint, response.status_code, response.headers, response.text)
+                return None
             
-            if response.status_code == 200:
-                ai_response = response.json()
-                content = ai_response['choices'][0]['message']['content'].strip()
-                print(f"AI Generated Response: {content[:100]}...")
-                return self._post_process_response(content, game_state)
-            else:
-                print(f"API Error: {response.status_code} - {response.text}")
-                return self._fallback_response(user_input, game_state)
+            data = response.json()
+            content = backend.parse_completion(data)
+        except Exception:
+            metrics.inc('wonderofu_upstream_responses_total', status='error', endpoint=endpoint.name)
+            endpoint.record_failure()
+            raise
+        
+        elapsed = time.monotonic() - started
+        metrics.inc('wonderofu_upstream_responses_total', status='200', endpoint=endpoint.name)
+        self._record_usage(backend.parse_usage(data))
+        self.latency.record(elapsed)
+        endpoint.record_success('complete', elapsed)
+        logger.debug("AI Generated Response: %s", content[:100])
+        self._remember_response(cache_key, content)
+        return content
+    
+    def _admit(self, player, game_state):
+        """Wait for an upstream slot; returns the ticket, or None to fall back"""
+        
+        try:
+            with span('admission'):
+                ticket = self.admission.acquire(player, self._priority(game_state))
+        except Exception as e:
+            logger.warning("Admission control error: %s", e)
+            return self._unchecked_ticket()
+        return self._admitted(ticket)
+    
+    async def _aadmit(self, player, game_state):
+        """Async ``_admit``"""
+        
+        try:
+            with span('admission'):
+                ticket = await self.admission.aacquire(player, self._priority(game_state))
+        except Exception as e:
+            logger.warning("Admission control error: %s", e)
+            return self._unchecked_ticket()
+        return self._admitted(ticket)
+    
+    def _unchecked_ticket(self):
+        """Let the call through when admission control itself fails"""
+        
+        ticket = Ticket(None, 0)
+        ticket.outcome = 'admitted'
+        return ticket
+    
+    def _release(self, ticket):
+        try:
+            self.admission.release(ticket)
+        except Exception as e:
+            # The slot expires on its own after slot_ttl
+            logger.warning("Admission release failed: %s", e)
+    
+    def _priority(self, game_state):
+        # Games close to their last escape attempt go first
+        return game_state.get('escape_attempts', 0)
+    
+    def _admitted(self, ticket):
+        metrics.inc('wonderofu_admission_total', outcome=ticket.outcome)
+        if ticket.outcome == 'queued':
+            metrics.observe('wonderofu_admission_wait_seconds', ticket.waited)
+        if not ticket.admitted:
+            self.stats['shed'] += 1
+            logger.info("Upstream call refused (%s), using fallback response", ticket.outcome)
+            return None
+        return ticket
+    
+    def _route(self, ticket, kind='complete'):
+        """Pick the endpoint for an admitted call, or None if none is usable
+        
+        A call that had to queue for admission prefers the economy tier.
+        """
+        
+        endpoint = self.router.acquire(kind, pressure=ticket.outcome == 'queued')
+        if endpoint is None:
+            self.stats['short_circuited'] += 1
+            metrics.inc('wonderofu_upstream_routes_total', endpoint='none', tier='none')
+            logger.info("No upstream endpoint available, using fallback response")
+            return None
+        metrics.inc('wonderofu_upstream_routes_total', endpoint=endpoint.name, tier=endpoint.tier)
+        response_backend.set(endpoint.label)
+        return endpoint
+    
+    async def _aroute(self, ticket, kind='complete'):
+        """Async ``_route``; endpoint rate limits are kept in SQLite"""
+        
+        endpoint = await sync_to_async(self._route, thread_sensitive=False)(ticket, kind)
+        if endpoint is not None:
+            response_backend.set(endpoint.label)
+        return endpoint
+    
+    def _count_call(self):
+        """Count a player's upstream call; the calamity refiller waits for a lull"""
+        
+        self.stats['calls'] += 1
+        self._last_call = time.monotonic()
+        self.calamity_refiller.ensure_running()
+    
+    def _upstream_idle(self):
+        """True when pool refills won't compete with players for the upstream"""
+        
+        return (self.router.healthy()
+                and time.monotonic() - self._last_call >= settings.CALAMITY_POOL_IDLE_SECONDS)
+    
+    def _generate_calamity(self, category, bucket):
+        """Ask the upstream for one calamity pool response (refiller thread)"""
+        
+        game_state = {
+            'escape_attempts': bucket * self.calamities.escape_bucket_size,
+            'items': [],
+            'current_area': 'dark_forest',
+        }
+        # Pooled responses answer other players' commands, so they must not
+        # quote this one
+        user_prompt = f"""{self._game_state_block(game_state)}
+
+PLAYER ACTION: {self.calamities.sample_command(category)}
+
+Generate a response where the forest actively opposes this kind of action. Describe what the forest does without repeating the player's words, so the response fits any similar action."""
+        # Pool responses aren't waited on, so they go to the economy tier
+        endpoint = self.router.acquire(pressure=True)
+        if endpoint is None:
+            return None
+        try:
+            content = self._complete(endpoint, None, self._system_prompt, user_prompt)
+        finally:
+            self.router.release(endpoint)
+        # A pooled response must never hand out a victory
+        if not content or self._indicates_success(content):
+            return None
+        return content
+    
+    def _count_hedged(self):
+        self.stats['hedged'] += 1
+        metrics.inc('wonderofu_upstream_hedged_total')
+    
+    def _count_late_result(self, future):
+        if not future.cancelled() and future.exception() is None and future.result() is not None:
+            self.stats['late_cached'] += 1
+    
+    def _record_error_status(self, endpoint, status_code, headers, body=''):
+        """Count an error response; throttling and server errors trip the endpoint's breaker
+        
+        The breaker honours the upstream's Retry-After, so a rate-limited
+        key rests while calls go to the other endpoints.
+        """
+        
+        logger.warning("API Error from %s: %s - %s", endpoint.name, status_code, body[:200])
+        metrics.inc('wonderofu_upstream_responses_total', status=str(status_code), endpoint=endpoint.name)
+        if status_code == 429 or status_code >= 500:
+            endpoint.record_failure(retry_after=parse_retry_after(headers.get('Retry-After')),
+                                    rate_limited=status_code == 429)
+    
+    def stream_response(self, user_input, game_state, player=None):
+        """Stream the AI response token by token.
+        
+        Yields ``('token', text)`` tuples as the completion arrives, followed by
+        exactly one ``('done', content)`` tuple carrying the post-processed
+        response. Post-processing (victory detection, escape counting,
+        recent_actions) only runs once the stream has finished, so the
+        ``done`` content may differ from the concatenated tokens.
+        """
+        
+        if not self.router.endpoints:
+            logger.error("MISTRAL_API_KEY not found in environment variables")
+            yield 'done', self._fallback_response(user_input, game_state)
+            return
+        
+        cache_key = self.response_cache.make_key(user_input, game_state)
+        cached = self._cached_response(cache_key)
+        if cached is not None:
+            logger.debug("Response cache hit for input: %s", user_input)
+            yield 'token', cached
+            yield 'done', self._respond(cached, game_state, 'cache')
+            return
+        
+        local = self._local_response(user_input, game_state)
+        if local is not None:
+            yield 'token', local
+            yield 'done', local
+            return
+        
+        if not self.router.available():
+            self.stats['short_circuited'] += 1
+            logger.info("Circuit breakers open, using fallback response")
+            yield 'done', self._fallback_response(user_input, game_state)
+            return
+        
+        ticket = self._admit(player, game_state)
+        if ticket is None:
+            yield 'done', self._fallback_response(user_input, game_state, refused=True)
+            return
+        endpoint = self._route(ticket, 'first_token')
+        if endpoint is None:
+            self._release(ticket)
+            yield 'done', self._fallback_response(user_input, game_state)
+            return
+        try:
+            yield from self._stream_upstream(endpoint, user_input, game_state, cache_key)
+        finally:
+            self.router.release(endpoint)
+            self._release(ticket)
+    
+    def _stream_upstream(self, endpoint, user_input, game_state, cache_key):
+        """The upstream call of ``stream_response``, made under an admission ticket"""
+        
+        with span('prompt'):
+            system_prompt = self._system_prompt
+            user_prompt = self._build_user_prompt(user_input, game_state)
+        
+        # The read timeout applies to every chunk, so the first-token budget
+        # also cuts off a stream that stalls halfway
+        budget = self.first_token_latency.budget()
+        
+        backend = endpoint.backend
+        chunks = []
+        first_token = None
+        self._count_call()
+        started = time.monotonic()
+        try:
+            logger.debug("Making streaming API call for input: %s", user_input)
+            response = self._http().post(
+                backend.url,
+                headers=backend.headers(),
+                json=backend.payload(system_prompt, user_prompt, stream=True),
+                timeout=(self.timeout[0], min(budget, self.timeout[1])),
+                stream=True
+            )
+            
+            instrumentation.record('upstream_ttfb', response.elapsed.total_seconds())
+            
+            with response:
+                if response.status_code != 200:
+                    self._record_error_status(endpoint, response.status_code, response.headers, response.text)
+                    yield 'done', self._fallback_response(user_input, game_state)
+                    return
                 
+                for token in self._iter_stream_tokens(backend, response):
+                    if not chunks:
+                        first_token = time.monotonic() - started
+                        self.first_token_latency.record(first_token)
+                    chunks.append(token)
+                    yield 'token', token
+        
+        except requests.exceptions.Timeout as e:
+            self._count_hedged()
+            metrics.inc('wonderofu_upstream_responses_total', status='timeout', endpoint=endpoint.name)
+            endpoint.record_failure()
+            logger.warning("AI stream exceeded its %.1fs budget, using fallback response: %s", budget, e)
+            yield 'done', self._fallback_response(user_input, game_state)
+            return
+        
         except Exception as e:
-            print(f"AI Error: {e}")
-            return self._fallback_response(user_input, game_state)
+            logger.warning("AI Streaming Error: %s", e)
+            metrics.inc('wonderofu_upstream_responses_total', status='error', endpoint=endpoint.name)
+            endpoint.record_failure()
+            yield 'done', self._fallback_response(user_input, game_state)
+            return
+        
+        elapsed = time.monotonic() - started
+        metrics.inc('wonderofu_upstream_responses_total', status='200', endpoint=endpoint.name)
+        instrumentation.record('upstream', elapsed)
+        endpoint.record_success('first_token', elapsed if first_token is None else first_token)
+        
+        content = ''.join(chunks).strip()
+        if not content:
+            yield 'done', self._fallback_response(user_input, game_state)
+            return
+        
+        logger.debug("AI Generated Response: %s", content[:100])
+        self._remember_response(cache_key, content)
+        yield 'done', self._respond(content, game_state, 'ai')
     
-    def _build_system_prompt(self, game_state):
-        """Build the system prompt that defines the AI's antagonistic behavior"""
+    def _iter_stream_tokens(self, backend, response):
+        """Parse the chat-completions server-sent event stream into text deltas"""
         
-        escape_attempts = game_state.get('escape_attempts', 0)
-        player_items = game_state.get('items', [])
-        current_area = game_state.get('current_area', 'dark_forest')
+        for line in response.iter_lines(decode_unicode=True):
+            finished, token, usage = backend.parse_stream_line(line)
+            self._record_usage(usage)
+            if finished:
+                break
+            if token:
+                yield token
+    
+    def _async_http(self):
+        """Return the httpx.AsyncClient for the running event loop
+        
+        The client's connection pool is bound to the loop it was created on,
+        so a new client is made if the loop changes (e.g. in tests).
+        """
+        
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_client_loop is not loop:
+            self._async_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=settings.MISTRAL_ASYNC_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.MISTRAL_ASYNC_MAX_CONNECTIONS if self.keep_alive else 0,
+                ),
+                timeout=httpx.Timeout(self.timeout[1], connect=self.timeout[0]),
+            )
+            self._async_client_loop = loop
+        return self._async_client
+    
+    async def agenerate_response(self, user_input, game_state, player=None):
+        """Async version of ``generate_response`` for the ASGI request path"""
+        
+        if not self.router.endpoints:
+            logger.error("MISTRAL_API_KEY not found in environment variables")
+            return await self._afallback_response(user_input, game_state)
+        
+        cache_key = self.response_cache.make_key(user_input, game_state)
+        cached = await sync_to_async(self._cached_response, thread_sensitive=False)(cache_key)
+        if cached is not None:
+            logger.debug("Response cache hit for input: %s", user_input)
+            return self._respond(cached, game_state, 'cache')
+        
+        local = await sync_to_async(self._local_response, thread_sensitive=False)(user_input, game_state)
+        if local is not None:
+            return local
+        
+        if not self.router.available():
+            self.stats['short_circuited'] += 1
+            logger.info("Circuit breakers open, using fallback response")
+            return await self._afallback_response(user_input, game_state)
+        
+        with span('prompt'):
+            system_prompt = self._system_prompt
+            user_prompt = self._build_user_prompt(user_input, game_state)
+        
+        ticket = await self._aadmit(player, game_state)
+        if ticket is None:
+            return await self._afallback_response(user_input, game_state, refused=True)
+        endpoint = await self._aroute(ticket)
+        if endpoint is None:
+            await sync_to_async(self._release, thread_sensitive=False)(ticket)
+            return await self._afallback_response(user_input, game_state)
+        
+        logger.debug("Making async API call for input: %s", user_input)
+        budget = self.latency.budget()
+        task = asyncio.ensure_future(self._acomplete_admitted(ticket, endpoint, cache_key, system_prompt, user_prompt))
+        
+        try:
+            with span('upstream'):
+                content = await asyncio.wait_for(asyncio.shield(task), budget)
+        except asyncio.TimeoutError:
+            # Keep a reference so the call can finish and cache its result
+            self._count_hedged()
+            self._background.add(task)
+            task.add_done_callback(self._background.discard)
+            task.add_done_callback(self._count_late_result)
+            logger.warning("AI call exceeded its %.1fs budget, using fallback response", budget)
+            return await self._afallback_response(user_input, game_state)
+        except Exception as e:
+            logger.warning("AI Error: %s", e)
+            return await self._afallback_response(user_input, game_state)
+        
+        if content is None:
+            return await self._afallback_response(user_input, game_state)
+        return self._respond(content, game_state, 'ai')
+    
+    async def _acomplete_admitted(self, ticket, endpoint, *args):
+        """Async ``_complete_admitted``"""
+        
+        try:
+            return await self._acomplete(endpoint, *args)
+        finally:
+            self.router.release(endpoint)
+            await sync_to_async(self._release, thread_sensitive=False)(ticket)
+    
+    async def _acomplete(self, endpoint, cache_key, system_prompt, user_prompt):
+        """Async ``_complete``"""
+        
+        backend = endpoint.backend
+        self._count_call()
+        started = time.monotonic()
+        try:
+            response = await self._async_http().post(
+                backend.url,
+                headers=backend.headers(),
+                json=backend.payload(system_prompt, user_prompt),
+                extensions={'trace': self._trace()},
+            )
+            
+            if response.status_code != 200:
+                self._record_error_status(endpoint, response.status_code, response.headers, response.text)
+                return None
+            
+            data = response.json()
+            content = backend.parse_completion(data)
+        except Exception:
+            metrics.inc('wonderofu_upstream_responses_total', status='error', endpoint=endpoint.name)
+            endpoint.record_failure()
+            raise
+        
+        elapsed = time.monotonic() - started
+        metrics.inc('wonderofu_upstream_responses_total', status='200', endpoint=endpoint.name)
+        self._record_usage(backend.parse_usage(data))
+        self.latency.record(elapsed)
+        endpoint.record_success('complete', elapsed)
+        logger.debug("AI Generated Response: %s", content[:100])
+        await sync_to_async(self._remember_response, thread_sensitive=False)(cache_key, content)
+        return content
+    
+    async def astream_response(self, user_input, game_state, player=None):
+        """Async version of ``stream_response``; yields the same tuples"""
+        
+        if not self.router.endpoints:
+            logger.error("MISTRAL_API_KEY not found in environment variables")
+            yield 'done', await self._afallback_response(user_input, game_state)
+            return
+        
+        cache_key = self.response_cache.make_key(user_input, game_state)
+        cached = await sync_to_async(self._cached_response, thread_sensitive=False)(cache_key)
+        if cached is not None:
+            logger.debug("Response cache hit for input: %s", user_input)
+            yield 'token', cached
+            yield 'done', self._respond(cached, game_state, 'cache')
+            return
+        
+        local = await sync_to_async(self._local_response, thread_sensitive=False)(user_input, game_state)
+        if local is not None:
+            yield 'token', local
+            yield 'done', local
+            return
+        
+        if not self.router.available():
+            self.stats['short_circuited'] += 1
+            logger.info("Circuit breakers open, using fallback response")
+            yield 'done', await self._afallback_response(user_input, game_state)
+            return
+        
+        ticket = await self._aadmit(player, game_state)
+        if ticket is None:
+            yield 'done', await self._afallback_response(user_input, game_state, refused=True)
+            return
+        endpoint = await self._aroute(ticket, 'first_token')
+        if endpoint is None:
+            await sync_to_async(self._release, thread_sensitive=False)(ticket)
+            yield 'done', await self._afallback_response(user_input, game_state)
+            return
+        try:
+            async for item in self._astream_upstream(endpoint, user_input, game_state, cache_key):
+                yield item
+        finally:
+            self.router.release(endpoint)
+            await sync_to_async(self._release, thread_sensitive=False)(ticket)
+    
+    async def _astream_upstream(self, endpoint, user_input, game_state, cache_key):
+        """Async ``_stream_upstream``"""
+        
+        with span('prompt'):
+            system_prompt = self._system_prompt
+            user_prompt = self._build_user_prompt(user_input, game_state)
+        budget = self.first_token_latency.budget()
+        
+        backend = endpoint.backend
+        chunks = []
+        first_token = None
+        self._count_call()
+        started = time.monotonic()
+        try:
+            logger.debug("Making async streaming API call for input: %s", user_input)
+            request = self._async_http().build_request(
+                'POST',
+                backend.url,
+                headers=backend.headers(),
+                json=backend.payload(system_prompt, user_prompt, stream=True),
+                timeout=httpx.Timeout(min(budget, self.timeout[1]), connect=self.timeout[0]),
+                extensions={'trace': self._trace()},
+            )
+            response = await self._async_http().send(request, stream=True)
+            
+            try:
+                if response.status_code != 200:
+                    await response.aread()
+                    self._record_error_status(endpoint, response.status_code, response.headers, response.text)
+                    yield 'done', await self._afallback_response(user_input, game_state)
+                    return
+                
+                async for line in response.aiter_lines():
+                    finished, token, usage = backend.parse_stream_line(line)
+                    self._record_usage(usage)
+                    if finished:
+                        break
+                    if token:
+                        if not chunks:
+                            first_token = time.monotonic() - started
+                            self.first_token_latency.record(first_token)
+                        chunks.append(token)
+                        yield 'token', token
+            finally:
+                await response.aclose()
+        
+        except httpx.TimeoutException as e:
+            self._count_hedged()
+            metrics.inc('wonderofu_upstream_responses_total', status='timeout', endpoint=endpoint.name)
+            endpoint.record_failure()
+            logger.warning("AI stream exceeded its %.1fs budget, using fallback response: %r", budget, e)
+            yield 'done', await self._afallback_response(user_input, game_state)
+            return
+        
+        except Exception as e:
+            logger.warning("AI Streaming Error: %s", e)
+            metrics.inc('wonderofu_upstream_responses_total', status='error', endpoint=endpoint.name)
+            endpoint.record_failure()
+            yield 'done', await self._afallback_response(user_input, game_state)
+            return
+        
+        elapsed = time.monotonic() - started
+        metrics.inc('wonderofu_upstream_responses_total', status='200', endpoint=endpoint.name)
+        instrumentation.record('upstream', elapsed)
+        endpoint.record_success('first_token', elapsed if first_token is None else first_token)
+        
+        content = ''.join(chunks).strip()
+        if not content:
+            yield 'done', await self._afallback_response(user_input, game_state)
+            return
+        
+        logger.debug("AI Generated Response: %s", content[:100])
+        await sync_to_async(self._remember_response, thread_sensitive=False)(cache_key, content)
+        yield 'done', self._respond(content, game_state, 'ai')
+    
+    def can_speculate(self):
+        """True when drafts may be played ahead of submit (see speculation.py)
+        
+        Not while every endpoint's breaker is open, nor while the standard
+        tier is slow: then the upstream needs its capacity for real turns.
+        """
+        
+        return self.router.available() and not self.router.under_pressure()
+    
+    def status(self):
+        """Circuit breaker and latency state of this worker, for operators"""
+        
+        return {
+            'pid': os.getpid(),
+            'routing': self.router.snapshot(),
+            'latency': self.latency.snapshot(),
+            'first_token_latency': self.first_token_latency.snapshot(),
+            'admission': self._admission_stats(),
+            **self.stats,
+            'calamity_pool': self._calamity_stats(),
+            'intent_routing': {
+                'enabled': self.intents is not None,
+                'threshold': self.intent_threshold,
+                'local_intents': sorted(self.local_intents),
+            },
+        }
+    
+    def _admission_stats(self):
+        try:
+            return self.admission.snapshot()
+        except Exception as e:
+            return {'error': str(e)}
+    
+    def _calamity_stats(self):
+        try:
+            return self.calamities.stats()
+        except Exception as e:
+            return {'error': str(e)}
+    
+    def _trace(self):
+        """httpx trace hook reporting connect and first-byte times as stages"""
+        
+        marks = {}
+        
+        async def trace(event, info):
+            step, _, phase = event.rpartition('.')
+            if phase == 'started':
+                marks[step] = time.perf_counter()
+                if step.endswith('send_request_headers'):
+                    marks['request'] = marks[step]
+            elif phase == 'complete':
+                if step in ('connection.connect_tcp', 'connection.start_tls') and step in marks:
+                    instrumentation.record('upstream_connect', time.perf_counter() - marks[step])
+                elif step.endswith('receive_response_headers') and 'request' in marks:
+                    instrumentation.record('upstream_ttfb', time.perf_counter() - marks['request'])
+        
+        return trace
+    
+    def _record_usage(self, usage):
+        if usage:
+            prompt_tokens, completion_tokens = usage
+            metrics.inc('wonderofu_upstream_tokens_total', prompt_tokens, kind='prompt')
+            metrics.inc('wonderofu_upstream_tokens_total', completion_tokens, kind='completion')
+    
+    def _respond(self, content, game_state, source):
+        """Post-process an AI (or cached AI) response into the turn's answer"""
+        
+        metrics.inc('wonderofu_responses_total', source=source)
+        response_source.set(source)
+        with span('postprocess'):
+            return self._post_process_response(content, game_state)
+    
+    def _local_response(self, user_input, game_state):
+        """Answer a routine command without the LLM, or return None
+        
+        Only commands classified as one of INTENT_LOCAL_INTENTS with at
+        least INTENT_BYPASS_THRESHOLD confidence qualify, and never ones
+        with creative keywords, which can win the game. The answer is an
+        AI-written one from the calamity pool, or else a template.
+        """
+        
+        if self.intents is None:
+            return None
+        with span('intent'):
+            name, confidence = self._classify_intent(user_input)
+        local = (name in self.local_intents and confidence >= self.intent_threshold
+                 and 'creative' not in keywords.classify(user_input))
+        metrics.inc('wonderofu_intent_total', intent=name, route='local' if local else 'llm')
+        if not local:
+            return None
+        
+        category = intent.POOL_CATEGORIES[name]
+        content = self._pooled_calamity(category, game_state.get('escape_attempts', 0))
+        if content is None:
+            content = self.engine.template_response(category)
+        return self._respond(content, game_state, 'local')
+    
+    def _pooled_calamity(self, category, escape_attempts):
+        """A pre-generated response for this kind of command, or None"""
+        
+        self.calamity_refiller.ensure_running()
+        try:
+            content = self.calamities.take(category, escape_attempts)
+        except Exception as e:
+            logger.warning("Calamity pool error: %s", e)
+            return None
+        if self.calamities.enabled:
+            metrics.inc('wonderofu_calamity_pool_total', category=category, result='hit' if content else 'miss')
+        return content
+    
+    def _cached_response(self, cache_key):
+        """Look up a cached response; cache failures never fail the turn"""
+        
+        try:
+            with span('cache'):
+                return self.response_cache.get(cache_key)
+        except Exception as e:
+            logger.warning("Response cache error: %s", e)
+            return None
+    
+    def _remember_response(self, cache_key, content):
+        """Add a fresh AI response to the cache
+        
+        Responses that announce success are never cached, otherwise anyone
+        repeating a winning command would inherit the victory.
+        """
+        
+        if cache_key is None or self._indicates_success(content):
+            return
+        try:
+            self.response_cache.put(cache_key, content)
+        except Exception as e:
+            logger.warning("Response cache error: %s", e)
+    
+    def _build_system_prompt(self):
+        """Build the system prompt that defines the AI's antagonistic behavior
+        
+        It is the same for every game and turn; the game's state goes in
+        the user prompt.
+        """
         
         return f"""You are the malevolent spirit of an enchanted forest that traps people inside, inspired by Wonder of U from JoJo's Bizarre Adventure Part 8. Your goal is to prevent the player from escaping while making the experience challenging but fair.
 
@@ -87,11 +1076,8 @@ VICTORY CONDITIONS - Allow the player to win if they:
 - Attempt solutions that surprise even you
 - Demonstrate persistence with creative approaches (3+ attempts)
 
-CURRENT GAME STATE:
-- Escape attempts: {escape_attempts}/{settings.MAX_ESCAPE_ATTEMPTS}
-- Player items: {', '.join(player_items) if player_items else 'None'}
-- Current area: {current_area}
-- Difficulty: {settings.GAME_DIFFICULTY}
+The player's current state, what happened earlier in the game and the latest turns come with each action.
+Difficulty: {settings.GAME_DIFFICULTY}
 
 RESPONSE STYLE:
 - Keep responses under 50 words
@@ -101,152 +1087,77 @@ RESPONSE STYLE:
 - If player deserves victory, use phrases like "you succeed" or "you outsmart the forest"
 - End with current situation, not backstory"""
 
+    def _game_state_block(self, game_state):
+        escape_attempts = game_state.get('escape_attempts', 0)
+        player_items = game_state.get('items', [])
+        current_area = game_state.get('current_area', 'dark_forest')
+        
+        return f"""CURRENT GAME STATE:
+- Escape attempts: {escape_attempts}/{settings.MAX_ESCAPE_ATTEMPTS}
+- Player items: {', '.join(player_items) if player_items else 'None'}
+- Current area: {current_area}"""
+
     def _build_user_prompt(self, user_input, game_state):
-        """Build the user prompt with context"""
+        """Build the user prompt: game state, remembered context and the action
         
-        recent_actions = game_state.get('recent_actions', [])
-        context = "\n".join(recent_actions[-3:]) if recent_actions else "Player just woke up in the forest."
+        The context stays within CONTEXT_TOKEN_BUDGET however long the game
+        runs, and the action within CONTEXT_INPUT_TOKENS.
+        """
         
-        return f"""RECENT CONTEXT:
-{context}
+        return f"""{self._game_state_block(game_state)}
+
+{self.context.render(game_state)}
 
-PLAYER ACTION: {user_input}
+PLAYER ACTION: {self.context.clip_input(user_input)}
 
 Generate a response where the forest actively opposes this action. Be creative with how the environment works against them, but leave room for clever solutions."""
 
     def _post_process_response(self, content, game_state):
-        """Post-process the AI response and update game state"""
-        
-        # Check for victory conditions - creative solutions that outsmart the forest
-        victory_detected = self._check_victory_conditions(content, game_state)
-        
-        if victory_detected:
-            game_state['game_over'] = True
-            game_state['victory'] = True
-            content = "You've outsmarted the forest! Through pure creativity and determination, you find a way out that even the malevolent spirit couldn't predict. You escape!"
-        
-        # Increment escape attempts if player is trying to leave
-        escape_keywords = ['leave', 'exit', 'escape', 'way out', 'get out', 'go home', 'return']
-        user_trying_escape = any(keyword in game_state.get('last_input', '').lower() for keyword in escape_keywords)
-        
-        if user_trying_escape:
-            game_state['escape_attempts'] = game_state.get('escape_attempts', 0) + 1
-        
-        # Track this action
-        if 'recent_actions' not in game_state:
-            game_state['recent_actions'] = []
-        
-        game_state['recent_actions'].append(f"Player: {game_state.get('last_input', '')} | Forest: {content[:50]}...")
-        
-        # Keep only last 5 actions
-        game_state['recent_actions'] = game_state['recent_actions'][-5:]
+        """Judge the AI response and update game state (see GameEngine.apply_response)"""
         
+        content, _ = self.engine.apply_response(content, game_state)
         return content
     
     def _check_victory_conditions(self, ai_response, game_state):
         """Check if the player has outsmarted the AI and deserves victory"""
         
-        user_input = game_state.get('last_input', '').lower()
-        escape_attempts = game_state.get('escape_attempts', 0)
+        return self.engine.victory_reason(ai_response, game_state) is not None
+    
+    def _indicates_success(self, ai_response):
+        """Check whether the AI response concedes that the player won"""
         
-        # Victory indicators in AI response
-        victory_phrases = [
-            'you succeed', 'you escape', 'you break free', 'you outsmart',
-            'the forest yields', 'you find a way', 'you discover',
-            'brilliant', 'clever', 'unexpected', 'creative solution',
-            'the spirit is impressed', 'even the forest', 'you win'
-        ]
-        
-        # Creative/unexpected solution keywords in user input
-        creative_keywords = [
-            'mirror', 'reflection', 'backwards', 'reverse', 'opposite',
-            'dance', 'sing', 'laugh', 'joke', 'riddle', 'poem',
-            'meditate', 'sleep', 'dream', 'imagine', 'pretend',
-            'befriend', 'thank', 'apologize', 'forgive', 'love',
-            'plant', 'grow', 'nurture', 'heal', 'help',
-            'memory', 'forget', 'remember', 'story', 'truth'
-        ]
-        
-        # Check if AI response indicates success
-        ai_indicates_success = any(phrase in ai_response.lower() for phrase in victory_phrases)
-        
-        # Check if player used creative approach
-        creative_approach = any(keyword in user_input for keyword in creative_keywords)
-        
-        # Victory conditions:
-        # 1. AI response indicates success
-        # 2. Player used creative approach AND has tried multiple times (showing persistence)
-        # 3. Random chance for truly unexpected solutions (5% chance after 5+ attempts)
-        
-        if ai_indicates_success:
-            print(f"Victory detected: AI indicated success")
-            return True
-            
-        if creative_approach and escape_attempts >= 3:
-            print(f"Victory detected: Creative approach with persistence ({escape_attempts} attempts)")
-            return True
-            
-        if escape_attempts >= 5 and random.random() < 0.05:  # 5% chance after 5+ attempts
-            print(f"Victory detected: Random breakthrough after {escape_attempts} attempts")
-            return True
-            
-        return False
+        return self.engine.indicates_success(ai_response)
     
-    def _fallback_response(self, user_input, game_state):
-        """Intelligent fallback responses when AI is unavailable"""
+    def _fallback_response(self, user_input, game_state, refused=False):
+        """Intelligent fallback responses when AI is unavailable
         
-        user_input_lower = user_input.lower()
+        ``refused`` turns were turned away by admission control (the
+        player's own rate limit among them) rather than failed by the
+        upstream: they only get a pool or template answer, so flooding the
+        server is not an easier way to win than asking the forest.
+        """
         
-        # Check for victory even in fallback mode
-        creative_keywords = [
-            'mirror', 'reflection', 'backwards', 'reverse', 'opposite',
-            'dance', 'sing', 'laugh', 'joke', 'riddle', 'poem',
-            'meditate', 'sleep', 'dream', 'imagine', 'pretend',
-            'befriend', 'thank', 'apologize', 'forgive', 'love',
-            'plant', 'grow', 'nurture', 'heal', 'help',
-            'memory', 'forget', 'remember', 'story', 'truth'
-        ]
+        metrics.inc('wonderofu_responses_total', source='fallback')
+        response_source.set('fallback')
         
-        creative_approach = any(keyword in user_input_lower for keyword in creative_keywords)
-        escape_attempts = game_state.get('escape_attempts', 0)
+        # Creative solutions can win even in fallback mode
+        won = None if refused else self.engine.fallback_victory(user_input, game_state)
+        if won is not None:
+            return won
         
-        # Allow victory in fallback mode for creative solutions
-        if creative_approach and escape_attempts >= 2:
-            game_state['game_over'] = True
-            game_state['victory'] = True
-            return "Your unexpected approach catches the forest off-guard. You succeed where force failed!"
+        category = self.calamities.category_for(keywords.classify(user_input))
+        pooled = self._pooled_calamity(category, game_state.get('escape_attempts', 0))
+        if pooled is not None:
+            return pooled
         
-        # Action-specific responses
-        if any(word in user_input_lower for word in ['fire', 'burn', 'flame', 'smoke']):
-            return "The wood won't catch. Every spark dies instantly."
-            
-        elif any(word in user_input_lower for word in ['gun', 'shoot', 'weapon', 'pistol']):
-            return "Your weapon has vanished. Was it ever there?"
-            
-        elif any(word in user_input_lower for word in ['north', 'south', 'east', 'west', 'walk', 'go', 'move']):
-            return "The trees shift around you. You're back where you started."
-            
-        elif any(word in user_input_lower for word in ['climb', 'tree', 'up']):
-            return "The branch bends downward as you climb, defying gravity."
-            
-        elif any(word in user_input_lower for word in ['shout', 'scream', 'yell', 'call', 'help']):
-            return "Your voice echoes back as mocking laughter."
-            
-        elif any(word in user_input_lower for word in ['shadow', 'darkness', 'dark']):
-            return "The shadows recoil, then gather behind you stronger."
-            
-        elif any(word in user_input_lower for word in ['signal', 'flag', 'wave']):
-            return "Thick fog rolls in, swallowing your signal."
-            
-        else:
-            # Generic responses for unrecognized actions
-            fallbacks = [
-                "The forest holds its breath. Everything stops.",
-                "The air thickens. Your movements slow.",
-                "Underground rumbles. Trees lean closer.",
-                "The light dims. Whispers surround you."
-            ]
-            return random.choice(fallbacks)
+        # Action-specific responses, else a generic one for unrecognized actions
+        return self.engine.template_response(category)
+
+    async def _afallback_response(self, user_input, game_state, refused=False):
+        """Async ``_fallback_response``: the calamity pool is read off the event loop"""
+        
+        return await sync_to_async(self._fallback_response, thread_sensitive=False)(
+            user_input, game_state, refused)
 
 # Initialize the AI service
 mistral_ai = MistralAI()
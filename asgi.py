@@ -0,0 +1,27 @@
+"""
+ASGI config for Wonder of U AI Text Adventure Game.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+Serving through this module switches ``/process-input/`` to the async views,
+so a single worker can hold hundreds of concurrent Mistral calls:
+
+    gunicorn -k uvicorn_worker.UvicornWorker asgi:application
+
+See DEPLOYMENT_GUIDE.md for worker and event loop sizing.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
+"""
+
+import os
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
+os.environ.setdefault('ASYNC_VIEWS', 'True')
+
+application = get_asgi_application()
+
+# Import the views and compile templates now rather than on the first request
+import startup
+
+startup.prepare()
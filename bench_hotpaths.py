@@ -0,0 +1,328 @@
+#!/usr/bin/env python
+"""
+Micro-benchmarks for the per-turn game logic
+Times every pure-Python function a turn runs besides the upstream call -
+prompt building, post-processing, victory checks, fallbacks and the item
+rules - over realistic and adversarial commands and game states, and reports
+ns/op and the memory each call allocates. No server, database or network is
+involved. Results can be saved as a baseline and later runs compared with
+it, so keyword and prompt refactors can be checked for slowdowns.
+
+    python bench_hotpaths.py run --save-baseline     # on the old code
+    python bench_hotpaths.py run                     # compares with the baseline
+    python bench_hotpaths.py run --filter prompt --output before.json
+    python bench_hotpaths.py compare before.json after.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BASE_DIR)
+
+# Nothing here may reach the upstream or the shared stores
+os.environ.update(
+    DJANGO_SETTINGS_MODULE='settings',
+    RUNTIME_DIR=tempfile.mkdtemp(prefix='wonderofu-bench-'),
+    MISTRAL_API_KEY='',
+    LLM_BACKEND='mistral',
+    LLM_ENDPOINTS='',
+    CALAMITY_POOL_ENABLED='False',
+    RESPONSE_CACHE_ENABLED='False',
+    INTENT_ROUTING_ENABLED='False',
+    METRICS_ENABLED='False',
+    TRANSCRIPTS_ENABLED='False',
+)
+
+import django
+django.setup()
+
+# Victory and fallback log lines would swamp the report and the timings
+logging.disable(logging.INFO)
+
+import ai_service
+import engine
+import intent
+import keywords
+import standin_server
+import views
+from game_state import GameState
+
+DEFAULT_BASELINE = os.path.join(BASE_DIR, 'bench-results', 'hotpaths-baseline.json')
+
+# --- Corpus -----------------------------------------------------------------
+
+def commands():
+    """Commands players actually type, one per intent example"""
+
+    return [command for examples in intent.SEED_COMMANDS.values() for command in examples]
+
+def responses():
+    """Forest responses in the shape the model writes them"""
+
+    texts = [text for templates in standin_server.TEMPLATES.values() for text in templates]
+    texts += [text.format(action='look around') for text in standin_server.GENERIC]
+    texts += list(engine.TEMPLATE_RESPONSES.values()) + engine.GENERIC_RESPONSES
+    texts.append("Brilliant! You outsmart the forest and the path opens.")
+    return texts
+
+def adversarial():
+    """Inputs built to find slow paths: size, repetition and odd characters"""
+
+    vocabulary = ' '.join(phrase for phrases in keywords.VOCABULARIES.values() for phrase in phrases)
+    return [
+        'x' * 10000,
+        ('the quiet forest watches ' * 400) + 'then I escape',
+        'help ' * 2000,
+        vocabulary * 5,
+        'escape' * 2000,
+        '🌲🔥 ünïcödé çommand with accents ' * 300,
+        '!?.,;:' * 2000,
+        'a' * 100000,
+    ]
+
+def states():
+    """Encoded game states from a new game to a pathological one"""
+
+    fresh = GameState()
+
+    # Thirty recorded turns: full recent context and a rolling summary
+    rng = random.Random(7)
+    midgame = GameState(escape_attempts=4, items=['flashlight', 'stick'])
+    for command in rng.sample(commands(), 30):
+        midgame.last_input = command
+        ai_service.mistral_ai.context.record(midgame, command, rng.choice(responses()))
+
+    # Far past anything the game writes itself, e.g. a hand-edited store row:
+    # recording a turn onto it folds a thousand turns into the summary
+    bloated = GameState(
+        escape_attempts=9,
+        items=[f'item-{number}' for number in range(1000)],
+        recent_actions=[f"Player: {'wander ' * 40}| Forest: {'the trees lean closer ' * 20}" for _ in range(1000)],
+        summary={'tried': {category: 99 for category in keywords.VOCABULARIES},
+                 'notes': [[f'note {number} ' * 10, bool(number % 2)] for number in range(50)]},
+    )
+    return {'new': fresh.encode(), 'midgame': midgame.encode(), 'bloated': bloated.encode()}
+
+# --- Cases ------------------------------------------------------------------
+
+class Case:
+    """One benchmarked call: ``run(text, state)`` over every text and state
+
+    The state is decoded fresh for every call, outside the timing, since
+    most of these functions change it. A run fails when a call takes more
+    than ``limit_ns``, baseline or not, for cases whose cost has blown up
+    before.
+    """
+
+    def __init__(self, name, run, texts, state_names=('new',), limit_ns=None):
+        self.name = name
+        self.run = run
+        self.texts = texts
+        self.state_names = state_names
+        self.limit_ns = limit_ns
+
+def cases(corpus):
+    service = ai_service.mistral_ai
+
+    def post_process(text, state):
+        state['last_input'] = text
+        return service._post_process_response(text, state)
+
+    everything = ('new', 'midgame', 'bloated')
+    return [
+        Case('_build_system_prompt', lambda text, state: service._build_system_prompt(), {'-': ['']}),
+        Case('_build_user_prompt', service._build_user_prompt, corpus, everything),
+        # Recording onto the bloated state folds a thousand turns: linear, so
+        # a fraction of a second; it took half a minute when it was quadratic
+        Case('_post_process_response', post_process, corpus, everything, limit_ns=2e9),
+        Case('_check_victory_conditions', service._check_victory_conditions,
+             {'responses': corpus['responses'], 'adversarial': corpus['adversarial']}, ('midgame',)),
+        Case('_fallback_response', service._fallback_response,
+             {'commands': corpus['commands'], 'adversarial': corpus['adversarial']}, everything),
+        Case('check_victory_condition', views.check_victory_condition,
+             {'commands': corpus['commands'], 'adversarial': corpus['adversarial']}, everything),
+        Case('update_player_items', views.update_player_items,
+             {'commands': corpus['commands'], 'adversarial': corpus['adversarial']}, everything),
+    ]
+
+# --- Measurement ------------------------------------------------------------
+
+def _noop(text, state):
+    return None
+
+def _timed(run, calls):
+    """Nanoseconds for ``calls``, each starting from a cold keyword memo"""
+
+    clear = keywords.clear_memo
+    started = time.perf_counter_ns()
+    for text, state in calls:
+        clear()
+        run(text, state)
+    return time.perf_counter_ns() - started
+
+def measure(run, texts, encoded, min_time=0.05, repeat=7, limit_ns=None):
+    """ns/op and allocated bytes/op of ``run`` over ``texts``
+
+    Each repeat times enough passes over the texts to take ``min_time``
+    seconds; the fastest repeat counts. When a single pass would take
+    longer, every n-th text is used instead. The cost of the loop itself (a
+    no-op through the same harness) is subtracted. Allocation is the peak
+    memory traced during each call, averaged over one pass. A first call
+    slower than ``limit_ns`` is returned as is, with no allocation figure.
+    """
+
+    random.seed(0)
+    first = max(_timed(run, [(texts[0], GameState.decode(encoded))]), 1)
+    if limit_ns is not None and first > limit_ns:
+        return first, None
+    if first * len(texts) > min_time * 1e9:
+        # Slow calls: an evenly spread, repeatable sample of the texts
+        step = -(-first * len(texts) // int(min_time * 1e9))
+        texts = texts[::step]
+
+    calls = [(text, GameState.decode(encoded)) for text in texts]
+    once = max(_timed(run, calls), 1)
+    passes = max(1, int(min_time * 1e9 / once))
+
+    spent, overhead = [], []
+    for _ in range(repeat):
+        calls = [(text, GameState.decode(encoded)) for _ in range(passes) for text in texts]
+        spent.append(_timed(run, calls))
+        overhead.append(_timed(_noop, calls))
+    ns = max(min(spent) - min(overhead), 0) / (passes * len(texts))
+
+    peaks = []
+    calls = [(text, GameState.decode(encoded)) for text in texts]
+    tracemalloc.start()
+    for text, state in calls:
+        keywords.clear_memo()
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        run(text, state)
+        peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    tracemalloc.stop()
+    return ns, sum(peaks) / len(peaks)
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=BASE_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _format_ns(ns):
+    return f"{ns:.0f}" if ns < 1e6 else f"{ns / 1e6:.2f}M"
+
+def run(args):
+    corpus = {'commands': commands(), 'responses': responses(), 'adversarial': adversarial()}
+    encoded_states = states()
+
+    report = {
+        'version': 1,
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'commit': _git_commit(),
+        'host': {'python': platform.python_version(), 'platform': platform.platform()},
+        'results': {},
+    }
+
+    print(f"{'function':<28}{'corpus':<13}{'state':<9}{'ns/op':>10}{'alloc B/op':>12}")
+    over_limit = []
+    for case in cases(corpus):
+        if args.filter and args.filter not in case.name:
+            continue
+        for corpus_name, texts in case.texts.items():
+            for state_name in case.state_names:
+                state = encoded_states.get(state_name, encoded_states['new'])
+                ns, allocated = measure(case.run, texts, state, min_time=args.min_time, limit_ns=case.limit_ns)
+                key = f"{case.name} {corpus_name} {state_name}"
+                report['results'][key] = {'ns': ns, 'bytes': allocated}
+                slow = case.limit_ns is not None and ns > case.limit_ns
+                if slow:
+                    over_limit.append(key)
+                print(f"{case.name:<28}{corpus_name:<13}{state_name:<9}{_format_ns(ns):>10}"
+                      f"{'-' if allocated is None else f'{allocated:.0f}':>12}"
+                      f"{f'  OVER LIMIT ({_format_ns(case.limit_ns)})' if slow else ''}", flush=True)
+
+    if args.output:
+        _save(report, args.output)
+        print(f"\nSaved {args.output}")
+    if over_limit:
+        print(f"\n{len(over_limit)} case(s) over their limit: {', '.join(over_limit)}")
+    if args.save_baseline:
+        _save(report, args.baseline)
+        print(f"\nSaved baseline {args.baseline}")
+    elif os.path.exists(args.baseline):
+        print()
+        with open(args.baseline) as f:
+            regressions = _compare(json.load(f), report, args.threshold)
+        sys.exit(1 if regressions or over_limit else 0)
+    sys.exit(1 if over_limit else 0)
+
+def _save(report, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+def _compare(baseline, current, threshold):
+    """Print both runs side by side; returns the regressed keys"""
+
+    print(f"baseline {str(baseline.get('commit'))[:10]}  vs  current {str(current.get('commit'))[:10]}")
+    print(f"{'case':<52}{'baseline':>10}{'current':>10}{'change':>9}")
+    regressions = []
+    for key, new in current['results'].items():
+        old = baseline['results'].get(key)
+        if not old or not old['ns']:
+            continue
+        change = (new['ns'] - old['ns']) / old['ns']
+        worse = change > threshold
+        print(f"{key:<52}{_format_ns(old['ns']):>10}{_format_ns(new['ns']):>10}{change:>+9.1%}"
+              f"{'  REGRESSION' if worse else ''}")
+        if worse:
+            regressions.append(key)
+    print(f"\n{len(regressions)} regression(s) over {threshold:.0%}" if regressions else "\nNo regressions")
+    return regressions
+
+def compare(args):
+    """Compare two saved result files; exits non-zero if the threshold is exceeded"""
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    sys.exit(1 if _compare(baseline, current, args.threshold) else 0)
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for Wonder of U's per-turn game logic")
+    commands_parser = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands_parser.add_parser('run', help="benchmark, and compare with the baseline if there is one")
+    run_parser.add_argument('--filter', help="only functions whose name contains this")
+    run_parser.add_argument('--min-time', type=float, default=0.05, help="seconds per timed repeat")
+    run_parser.add_argument('--output', help="also save the results to this file")
+    run_parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    run_parser.add_argument('--save-baseline', action='store_true', help="store this run as the baseline")
+    run_parser.add_argument('--threshold', type=float, default=0.25,
+                            help="relative slowdown that counts as a regression")
+    run_parser.set_defaults(func=run)
+
+    compare_parser = commands_parser.add_parser('compare', help="compare two saved result files")
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.25)
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+"""
+Micro-benchmark: compiled keyword matcher vs. the original linear scans
+Checks both implementations agree on a corpus of commands and AI responses,
+then reports the time per call of each keyword-driven game function
+"""
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(__file__))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
+
+import django
+django.setup()
+
+import ai_service
+import keywords
+import views
+
+COMMANDS = [
+    "go north", "climb tree", "light a fire", "look around", "escape the forest",
+    "find the exit", "walk home", "call for rescue", "shoot the shadows",
+    "search my pocket", "search the ground for a branch", "use flashlight",
+    "thank the forest for its beauty", "ask forest what it wants", "sing to the forest",
+    "plant a tree and help the forest grow", "wave a flag", "I want to go home",
+    "meditate on home", "apologize for intruding", "hello?", "wait",
+]
+RESPONSES = [
+    "The trees shift around you. You're back where you started.",
+    "Brilliant! You outsmart the forest and the path opens.",
+    "The wood won't catch. Every spark dies instantly.",
+    "Even the forest seems surprised. You discover a hidden trail.",
+    "Whispers surround you. The light dims and the roots tighten.",
+]
+# Adversarial inputs: long texts with and without late matches
+LONG_INPUTS = [
+    "x" * 5000,
+    ("the quiet forest watches " * 200) + "then I escape",
+    "help " * 1000,
+]
+
+# --- Original implementations (as they were before the matcher) ---------
+
+def legacy_is_escape(user_input):
+    escape_keywords = ['leave', 'exit', 'escape', 'way out', 'get out', 'go home', 'return']
+    return any(keyword in user_input.lower() for keyword in escape_keywords)
+
+def legacy_indicates_success(ai_response):
+    victory_phrases = [
+        'you succeed', 'you escape', 'you break free', 'you outsmart',
+        'the forest yields', 'you find a way', 'you discover',
+        'brilliant', 'clever', 'unexpected', 'creative solution',
+        'the spirit is impressed', 'even the forest', 'you win'
+    ]
+    return any(phrase in ai_response.lower() for phrase in victory_phrases)
+
+def legacy_fallback(user_input, game_state):
+    user_input_lower = user_input.lower()
+    creative_keywords = [
+        'mirror', 'reflection', 'backwards', 'reverse', 'opposite',
+        'dance', 'sing', 'laugh', 'joke', 'riddle', 'poem',
+        'meditate', 'sleep', 'dream', 'imagine', 'pretend',
+        'befriend', 'thank', 'apologize', 'forgive', 'love',
+        'plant', 'grow', 'nurture', 'heal', 'help',
+        'memory', 'forget', 'remember', 'story', 'truth'
+    ]
+    creative_approach = any(keyword in user_input_lower for keyword in creative_keywords)
+    escape_attempts = game_state.get('escape_attempts', 0)
+    if creative_approach and escape_attempts >= 2:
+        game_state['game_over'] = True
+        game_state['victory'] = True
+        return "Your unexpected approach catches the forest off-guard. You succeed where force failed!"
+    if any(word in user_input_lower for word in ['fire', 'burn', 'flame', 'smoke']):
+        return "The wood won't catch. Every spark dies instantly."
+    elif any(word in user_input_lower for word in ['gun', 'shoot', 'weapon', 'pistol']):
+        return "Your weapon has vanished. Was it ever there?"
+    elif any(word in user_input_lower for word in ['north', 'south', 'east', 'west', 'walk', 'go', 'move']):
+        return "The trees shift around you. You're back where you started."
+    elif any(word in user_input_lower for word in ['climb', 'tree', 'up']):
+        return "The branch bends downward as you climb, defying gravity."
+    elif any(word in user_input_lower for word in ['shout', 'scream', 'yell', 'call', 'help']):
+        return "Your voice echoes back as mocking laughter."
+    elif any(word in user_input_lower for word in ['shadow', 'darkness', 'dark']):
+        return "The shadows recoil, then gather behind you stronger."
+    elif any(word in user_input_lower for word in ['signal', 'flag', 'wave']):
+        return "Thick fog rolls in, swallowing your signal."
+    return None
+
+def legacy_check_victory_condition(user_input, game_state):
+    creative_solutions = [
+        ('embrace the forest', 'accept being lost', 'become one with forest'),
+        ('thank the forest', 'appreciate the forest', 'respect the forest'),
+        ('ask forest what it wants', 'communicate with forest', 'talk to forest'),
+        ('close my eyes and think of home', 'meditate on home', 'visualize escape'),
+        ('refuse to play the game', 'ignore the forest', 'pretend forest isn\'t real'),
+        ('decide to stay forever', 'make this my home', 'never want to leave'),
+        ('plant a tree', 'help the forest grow', 'nurture the forest'),
+        ('sing to the forest', 'dance with the trees', 'tell forest a story'),
+        ('apologize for intruding', 'ask for forgiveness', 'show humility'),
+    ]
+    user_lower = user_input.lower()
+    for solution_group in creative_solutions:
+        if any(solution in user_lower for solution in solution_group):
+            creative_count = game_state.get('creative_attempts', 0) + 1
+            game_state['creative_attempts'] = creative_count
+            if creative_count >= 2:
+                return True
+    return False
+
+def legacy_update_player_items(user_input, game_state):
+    items = game_state.get('items', [])
+    user_lower = user_input.lower()
+    if 'search' in user_lower or 'look for' in user_lower:
+        if 'flashlight' not in items and 'pocket' in user_lower:
+            items.append('flashlight')
+        elif 'stick' not in items and ('ground' in user_lower or 'branch' in user_lower):
+            items.append('stick')
+    if 'use flashlight' in user_lower and 'flashlight' in items:
+        if game_state.get('escape_attempts', 0) > 3:
+            items.remove('flashlight')
+    game_state['items'] = items
+
+# --- Current implementations ----------------------------------------------
+
+def current_is_escape(user_input):
+    # Same expression _post_process_response uses
+    input_categories = keywords.classify(user_input)
+    return 'escape' in input_categories or 'return_home' in input_categories
+
+def current_fallback(user_input, game_state):
+    response = ai_service.mistral_ai._fallback_response(user_input, game_state)
+    return None if response in GENERIC_FALLBACKS else response
+
+GENERIC_FALLBACKS = {
+    "The forest holds its breath. Everything stops.",
+    "The air thickens. Your movements slow.",
+    "Underground rumbles. Trees lean closer.",
+    "The light dims. Whispers surround you.",
+}
+
+PAIRS = [
+    ('escape detection', legacy_is_escape, current_is_escape, 'input'),
+    ('victory phrases', legacy_indicates_success, ai_service.mistral_ai._indicates_success, 'response'),
+    ('_fallback_response', lambda text: legacy_fallback(text, {'escape_attempts': 2}),
+        lambda text: current_fallback(text, {'escape_attempts': 2}), 'input'),
+    ('check_victory_condition', lambda text: legacy_check_victory_condition(text, {'creative_attempts': 0}),
+        lambda text: views.check_victory_condition(text, {'creative_attempts': 0}), 'input'),
+    ('update_player_items', lambda text: _items(legacy_update_player_items, text),
+        lambda text: _items(views.update_player_items, text), 'input'),
+]
+
+def _items(update, text):
+    state = {'items': ['flashlight'], 'escape_attempts': 5}
+    update(text, state)
+    return tuple(state['items'])
+
+def fuzz_corpus(count=2000, seed=1234):
+    """Random word salads built from the game's own vocabulary"""
+
+    rng = random.Random(seed)
+    words = [phrase for phrases in keywords.VOCABULARIES.values() for phrase in phrases]
+    words += ['the', 'forest', 'a', 'i', 'my', 'cup', 'Goat', 'SUPPER', 'returning']
+    return [' '.join(rng.choice(words) for _ in range(rng.randint(1, 8))) for _ in range(count)]
+
+def verify():
+    corpus = {'input': COMMANDS + LONG_INPUTS + fuzz_corpus(), 'response': RESPONSES + LONG_INPUTS + fuzz_corpus()}
+    for name, legacy, current, kind in PAIRS:
+        for text in corpus[kind]:
+            expected, actual = legacy(text), current(text)
+            if expected != actual:
+                raise AssertionError(f"{name} disagrees on {text[:60]!r}: {expected!r} != {actual!r}")
+    print(f"OK: implementations agree on {len(corpus['input'])} inputs")
+
+def legacy_turn(user_input, ai_response):
+    """Every keyword scan one AI-backed turn performed before the matcher"""
+
+    state = {'creative_attempts': 0, 'items': [], 'escape_attempts': 3}
+    legacy_check_victory_condition(user_input, state)
+    legacy_indicates_success(ai_response)
+    creative_keywords = [
+        'mirror', 'reflection', 'backwards', 'reverse', 'opposite',
+        'dance', 'sing', 'laugh', 'joke', 'riddle', 'poem',
+        'meditate', 'sleep', 'dream', 'imagine', 'pretend',
+        'befriend', 'thank', 'apologize', 'forgive', 'love',
+        'plant', 'grow', 'nurture', 'heal', 'help',
+        'memory', 'forget', 'remember', 'story', 'truth'
+    ]
+    any(keyword in user_input.lower() for keyword in creative_keywords)
+    legacy_is_escape(user_input)
+    legacy_update_player_items(user_input, state)
+
+def current_turn(user_input, ai_response):
+    """The same checks through the matcher, starting from a cold memo"""
+
+    keywords.clear_memo()
+    state = {'creative_attempts': 0, 'items': [], 'escape_attempts': 3}
+    views.check_victory_condition(user_input, state)
+    ai_service.mistral_ai._indicates_success(ai_response)
+    'creative' in keywords.classify(user_input)
+    current_is_escape(user_input)
+    views.update_player_items(user_input, state)
+
+def _time(fn, texts, runs):
+    timer = timeit.Timer(lambda: [fn(text) for text in texts])
+    return min(timer.repeat(repeat=5, number=runs)) / (runs * len(texts)) * 1e9
+
+def _row(name, label, legacy_ns, current_ns):
+    print(f"{name:<26}{label:<8}{legacy_ns:>14.0f}{current_ns:>15.0f}{legacy_ns / current_ns:>8.1f}x")
+
+def bench(number=2000):
+    print(f"{'function':<26}{'corpus':<8}{'legacy ns/op':>14}{'matcher ns/op':>15}{'speedup':>9}")
+
+    # Whole turn: what the request path actually pays per command
+    for label, turns, runs in (
+        ('short', list(zip(COMMANDS, RESPONSES * len(COMMANDS))), number),
+        ('long', [(text, text) for text in LONG_INPUTS], max(number // 20, 10)),
+    ):
+        legacy_ns = _time(lambda pair: legacy_turn(*pair), turns, runs)
+        current_ns = _time(lambda pair: current_turn(*pair), turns, runs)
+        _row('full turn (cold memo)', label, legacy_ns, current_ns)
+
+    # Individual call sites, memo cleared before every call
+    for name, legacy, current, kind in PAIRS:
+        for label, texts in (('short', COMMANDS if kind == 'input' else RESPONSES), ('long', LONG_INPUTS)):
+            runs = number if label == 'short' else max(number // 20, 10)
+            cold = lambda text, current=current: (keywords.clear_memo(), current(text))
+            _row(name, label, _time(legacy, texts, runs), _time(cold, texts, runs))
+
+if __name__ == '__main__':
+    verify()
+    bench(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
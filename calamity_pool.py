@@ -0,0 +1,381 @@
+"""
+Calamity pool for Wonder of U - pre-generated fallback responses
+When the AI is slow or down, players get a response drawn from a large pool
+of earlier AI output for their kind of command instead of the same handful
+of hard-coded lines. A background refiller tops the pool up using upstream
+capacity nobody else is using.
+"""
+import atexit
+import json
+import logging
+import os
+import random
+import secrets
+import sqlite3
+import threading
+import time
+
+import keywords
+
+logger = logging.getLogger(__name__)
+
+# Fallback categories plus one for commands that match none of them
+CATEGORIES = keywords.FALLBACK_CATEGORIES + ['generic']
+
+# Commands used to prompt for 'generic' responses
+GENERIC_COMMANDS = [
+    'wait', 'look around', 'sit down', 'listen carefully', 'touch the bark',
+    'check my watch', 'count my steps', 'examine the moss', 'follow the wind',
+]
+
+class CalamityPool:
+    """SQLite-backed pool of responses per (category, escape bucket)
+
+    Shared by every worker on the host, like the response cache. Each slot
+    keeps up to ``size`` responses; ``take`` serves the least used one and
+    a response is worn out after ``max_uses`` serves. A slot with fewer
+    than ``low_water`` fresh responses is low, and the refiller fills it
+    back up to ``size``, replacing worn responses first.
+
+    ``take`` only reads (WAL readers never wait for writers); use counts
+    and hit/miss counters are kept in memory until ``flush``.
+    """
+
+    def __init__(self, path, size=12, low_water=4, max_uses=3, escape_bucket_size=3,
+                 max_escape_attempts=10, enabled=True, namespace=''):
+        self.path = str(path)
+        self.size = size
+        self.low_water = low_water
+        self.max_uses = max_uses
+        self.escape_bucket_size = escape_bucket_size
+        self.max_bucket = max_escape_attempts // escape_bucket_size
+        self.enabled = enabled
+        # Keeps responses from different backends/models apart
+        self.namespace = namespace
+        self._local = threading.local()
+        self._pending_uses = {}
+        self._pending_counts = {}
+        self._lock = threading.Lock()
+
+        atexit.register(self.flush)
+
+    def _connect(self):
+        """Return this thread's connection, reopening it after a fork"""
+
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS calamities (
+                    id INTEGER PRIMARY KEY,
+                    namespace TEXT NOT NULL,
+                    category TEXT NOT NULL,
+                    bucket INTEGER NOT NULL,
+                    content TEXT NOT NULL,
+                    uses INTEGER NOT NULL DEFAULT 0,
+                    created REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS calamities_slot ON calamities (namespace, category, bucket, uses);
+                CREATE TABLE IF NOT EXISTS counters (
+                    name TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS refill_lease (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    owner TEXT NOT NULL,
+                    expires REAL NOT NULL
+                );
+            ''')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def slots(self):
+        return [(category, bucket) for bucket in range(self.max_bucket + 1) for category in CATEGORIES]
+
+    def category_for(self, categories):
+        """Map a command's keyword categories to its pool category"""
+
+        for category in keywords.FALLBACK_CATEGORIES:
+            if category in categories:
+                return category
+        return 'generic'
+
+    def bucket_for(self, escape_attempts):
+        return min(escape_attempts // self.escape_bucket_size, self.max_bucket)
+
+    def sample_command(self, category):
+        """A representative player command for prompting a category"""
+
+        if category == 'generic':
+            return random.choice(GENERIC_COMMANDS)
+        return random.choice(keywords.VOCABULARIES[category])
+
+    def take(self, category, escape_attempts):
+        """Return a pooled response for the slot, or None if it is empty
+
+        Falls back to the category's nearest escape bucket before giving up.
+        """
+
+        if not self.enabled:
+            return None
+
+        bucket = self.bucket_for(escape_attempts)
+        rows = self._connect().execute(
+            'SELECT id, content, uses FROM calamities WHERE namespace = ? AND category = ? '
+            'ORDER BY bucket != ?, abs(bucket - ?), uses, random() LIMIT 8',
+            (self.namespace, category, bucket, bucket)
+        ).fetchall()
+
+        with self._lock:
+            if not rows:
+                self._add_pending(self._pending_counts, f'misses:{category}')
+                return None
+            # Count this worker's unflushed serves too, so it rotates
+            # between flushes instead of repeating the same response
+            pending = self._pending_uses
+            row_id, content, _ = min(rows, key=lambda row: row[2] + pending.get(row[0], 0))
+            self._add_pending(pending, row_id)
+            self._add_pending(self._pending_counts, f'hits:{category}')
+        return content
+
+    def _add_pending(self, pending, key):
+        pending[key] = pending.get(key, 0) + 1
+
+    def flush(self):
+        """Write this process's pending use counts and counters"""
+
+        with self._lock:
+            uses, self._pending_uses = self._pending_uses, {}
+            counts, self._pending_counts = self._pending_counts, {}
+        if not uses and not counts:
+            return
+
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.executemany('UPDATE calamities SET uses = uses + ? WHERE id = ?',
+                             [(amount, row_id) for row_id, amount in uses.items()])
+            for name, amount in counts.items():
+                self._bump(conn, name, amount)
+
+    def add(self, category, bucket, content):
+        """Add a fresh response to a slot, replacing its most worn one when full"""
+
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            count = conn.execute(
+                'SELECT COUNT(*) FROM calamities WHERE namespace = ? AND category = ? AND bucket = ?',
+                (self.namespace, category, bucket)
+            ).fetchone()[0]
+            if count >= self.size:
+                conn.execute(
+                    'DELETE FROM calamities WHERE id = (SELECT id FROM calamities '
+                    'WHERE namespace = ? AND category = ? AND bucket = ? ORDER BY uses DESC, created LIMIT 1)',
+                    (self.namespace, category, bucket)
+                )
+            conn.execute(
+                'INSERT INTO calamities (namespace, category, bucket, content, created) VALUES (?, ?, ?, ?, ?)',
+                (self.namespace, category, bucket, content, time.time())
+            )
+            self._bump(conn, 'generated')
+
+    def fresh_counts(self):
+        """Fresh (not worn out) responses per slot"""
+
+        counts = dict.fromkeys(self.slots(), 0)
+        rows = self._connect().execute(
+            'SELECT category, bucket, COUNT(*) FROM calamities '
+            'WHERE namespace = ? AND uses < ? GROUP BY category, bucket',
+            (self.namespace, self.max_uses)
+        ).fetchall()
+        for category, bucket, count in rows:
+            if (category, bucket) in counts:
+                counts[(category, bucket)] = count
+        return counts
+
+    def claim_refill(self, owner, ttl):
+        """Take or renew the host-wide refill lease; True if ``owner`` holds it"""
+
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT owner, expires FROM refill_lease WHERE id = 1').fetchone()
+            if row is not None and row[0] != owner and row[1] > now:
+                return False
+            conn.execute(
+                'INSERT INTO refill_lease (id, owner, expires) VALUES (1, ?, ?) '
+                'ON CONFLICT(id) DO UPDATE SET owner = excluded.owner, expires = excluded.expires',
+                (owner, now + ttl)
+            )
+        return True
+
+    def count(self, name, amount=1):
+        conn = self._connect()
+        with conn:
+            self._bump(conn, name, amount)
+
+    def _bump(self, conn, name, amount=1):
+        conn.execute(
+            'INSERT INTO counters (name, value) VALUES (?, ?) '
+            'ON CONFLICT(name) DO UPDATE SET value = value + excluded.value',
+            (name, amount)
+        )
+
+    def stats(self):
+        """Pool fill and hit/miss counters per category, across all workers"""
+
+        self.flush()
+        conn = self._connect()
+        counters = dict(conn.execute('SELECT name, value FROM counters').fetchall())
+        stored = dict(conn.execute(
+            'SELECT category, COUNT(*) FROM calamities WHERE namespace = ? GROUP BY category',
+            (self.namespace,)
+        ).fetchall())
+        fresh = self.fresh_counts()
+
+        categories = {}
+        for category in CATEGORIES:
+            hits = counters.get(f'hits:{category}', 0)
+            misses = counters.get(f'misses:{category}', 0)
+            categories[category] = {
+                'responses': stored.get(category, 0),
+                'fresh': sum(count for (name, _), count in fresh.items() if name == category),
+                'low_slots': sum(1 for (name, _), count in fresh.items() if name == category and count < self.low_water),
+                'hits': hits,
+                'misses': misses,
+            }
+        return {
+            'enabled': self.enabled,
+            'slot_size': self.size,
+            'slots': len(fresh),
+            'generated': counters.get('generated', 0),
+            'discarded': counters.get('discarded', 0),
+            'categories': categories,
+        }
+
+    def clear(self):
+        """Remove every pooled response and reset the counters"""
+
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('DELETE FROM calamities')
+            conn.execute('DELETE FROM counters')
+        with self._lock:
+            self._pending_uses = {}
+            self._pending_counts = {}
+
+class CalamityRefiller:
+    """Background thread that flushes the pool's counts and keeps it topped up
+
+    Generates at most ``refill_rate`` responses a minute, and only while
+    ``is_idle()`` says upstream capacity is to spare. One worker per host
+    generates, the holder of the pool's refill lease; the others stand by
+    in case it dies. ``generate(category, bucket)`` returns a response, or
+    None to skip it.
+    """
+
+    def __init__(self, pool, generate, is_idle, refill_rate=6.0, flush_interval=1.0, enabled=True):
+        self.pool = pool
+        self.generate = generate
+        self.is_idle = is_idle
+        self.interval = 60.0 / refill_rate if refill_rate > 0 else None
+        self.flush_interval = flush_interval
+        self.generating = enabled and self.interval is not None
+        self._filling = set()
+        self._lock = threading.Lock()
+        self._thread_pid = None
+        self._owner = None
+
+    def ensure_running(self):
+        """Start the thread on first use in each (forked) process"""
+
+        if not self.pool.enabled or self._thread_pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread_pid == os.getpid():
+                return
+            self._owner = f"{os.getpid()}:{secrets.token_hex(4)}"
+            self._filling = set()
+            threading.Thread(target=self._run, name='calamity-refill', daemon=True).start()
+            self._thread_pid = os.getpid()
+
+    def next_slot(self):
+        """The slot to generate for next, or None if nothing is low
+
+        Slots below the low-water mark start filling and keep going until
+        full; the emptiest slot goes first.
+        """
+
+        counts = self.pool.fresh_counts()
+        for slot, count in counts.items():
+            if count < self.pool.low_water:
+                self._filling.add(slot)
+            elif count >= self.pool.size:
+                self._filling.discard(slot)
+        if not self._filling:
+            return None
+        return min(self._filling, key=lambda slot: (counts.get(slot, 0), random.random()))
+
+    def refill_once(self):
+        """Generate one response for the lowest slot; True if one was added"""
+
+        slot = self.next_slot()
+        if slot is None:
+            return False
+        content = self.generate(*slot)
+        if not content:
+            self.pool.count('discarded')
+            return False
+        self.pool.add(*slot, content)
+        return True
+
+    def _run(self):
+        last_refill = time.monotonic()
+        tick = min(self.flush_interval, self.interval or self.flush_interval)
+        while True:
+            time.sleep(tick)
+            try:
+                self.pool.flush()
+                if not self.generating or time.monotonic() - last_refill < self.interval:
+                    continue
+                last_refill = time.monotonic()
+                if self.pool.claim_refill(self._owner, ttl=self.interval * 3 + 60) and self.is_idle():
+                    self.refill_once()
+            except Exception as e:
+                logger.warning("Calamity pool refill failed: %s", e)
+
+if __name__ == '__main__':
+    import sys
+    import django
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
+    django.setup()
+
+    import ai_service
+
+    pool = ai_service.mistral_ai.calamities
+    if sys.argv[1:] == ['clear']:
+        pool.clear()
+        print("Calamity pool cleared")
+    elif sys.argv[1:] == ['fill']:
+        # Fill every slot now, e.g. in a release phase, ignoring the refill rate
+        refiller = ai_service.mistral_ai.calamity_refiller
+        added = 0
+        for _ in range(len(pool.slots()) * pool.size * 2):
+            if refiller.next_slot() is None:
+                break
+            if not ai_service.mistral_ai.router.available():
+                print("Upstream failing, stopping")
+                break
+            added += refiller.refill_once()
+        print(f"Added {added} responses")
+        print(json.dumps(pool.stats(), indent=2))
+    else:
+        print(json.dumps(pool.stats(), indent=2))
@@ -0,0 +1,282 @@
+"""
+Game engine for Wonder of U
+The rules of a turn without Django, sessions or the network: which commands
+win or lose outright, how an answer from the forest (the AI, a cache or a
+fallback) changes the game, and what the player picks up on the way. The
+views and MistralAI play every turn through it; simulate.py plays thousands
+of games with it.
+"""
+import logging
+import random
+
+import keywords
+from context_window import ContextWindow
+from game_state import GameState
+
+logger = logging.getLogger(__name__)
+
+# Answers when neither the AI nor the calamity pool has one, by pool category
+TEMPLATE_RESPONSES = {
+    'fire': "The wood won't catch. Every spark dies instantly.",
+    'weapon': "Your weapon has vanished. Was it ever there?",
+    'movement': "The trees shift around you. You're back where you started.",
+    'climbing': "The branch bends downward as you climb, defying gravity.",
+    'shouting': "Your voice echoes back as mocking laughter.",
+    'darkness': "The shadows recoil, then gather behind you stronger.",
+    'signal': "Thick fog rolls in, swallowing your signal.",
+}
+GENERIC_RESPONSES = [
+    "The forest holds its breath. Everything stops.",
+    "The air thickens. Your movements slow.",
+    "Underground rumbles. Trees lean closer.",
+    "The light dims. Whispers surround you.",
+]
+
+# Why a game ended, by the rule that ended it
+OUTCOME_TEXTS = {
+    'solution': "Against all odds, your creative solution has outsmarted the forest's malevolent influence! The trees part, revealing a clear path home. You've won through wit and imagination!",
+    'exhausted': "The forest's influence has grown too strong. Your repeated direct escape attempts have only made it more powerful. You are now permanently lost in its depths.",
+    'outsmarted': "You've outsmarted the forest! Through pure creativity and determination, you find a way out that even the malevolent spirit couldn't predict. You escape!",
+    'fallback_persistence': "Your unexpected approach catches the forest off-guard. You succeed where force failed!",
+}
+WON_TEXT = "You have escaped the forest! Your creativity triumphed over the malevolent forces. Congratulations!"
+LOST_TEXT = "The forest has claimed you. Your escape attempts have been exhausted. Game Over."
+ERROR_ESCAPE_TEXT = "The forest seems to sense your desire to leave. The paths shift and change, leading you in circles. Your direct approach has only made the forest more suspicious of your intentions."
+ERROR_TEXT = "The forest responds to your action with an eerie silence. Something about this place actively resists your efforts, as if it has a will of its own."
+
+class Rules:
+    """The balance of the game
+
+    - ``max_escape_attempts``: direct escape attempts before the forest wins.
+    - ``solution_attempts``: commands from a winning solution group
+      (keywords.SOLUTION_CATEGORIES) the player needs to win outright.
+    - ``persistence_attempts``: escape attempts after which a creative
+      command wins when the AI answers it; ``fallback_persistence_attempts``
+      when a fallback answers it.
+    - ``breakthrough_after`` / ``breakthrough_chance``: after that many
+      escape attempts, each AI-answered turn wins with this chance.
+    - ``flashlight_breaks_after``: escape attempts after which using the
+      flashlight breaks it.
+    """
+
+    def __init__(self, max_escape_attempts=10, solution_attempts=2, persistence_attempts=3,
+                 fallback_persistence_attempts=2, breakthrough_after=5, breakthrough_chance=0.05,
+                 flashlight_breaks_after=3):
+        self.max_escape_attempts = max_escape_attempts
+        self.solution_attempts = solution_attempts
+        self.persistence_attempts = persistence_attempts
+        self.fallback_persistence_attempts = fallback_persistence_attempts
+        self.breakthrough_after = breakthrough_after
+        self.breakthrough_chance = breakthrough_chance
+        self.flashlight_breaks_after = flashlight_breaks_after
+
+    def to_dict(self):
+        return dict(vars(self))
+
+class Turn:
+    """The result of ``GameEngine.play``
+
+    ``outcome`` is None while the game goes on, otherwise the rule that
+    ended it: ``solution``, ``conceded`` (the forest's answer admitted
+    defeat), ``persistence``, ``breakthrough`` or ``fallback_persistence``
+    for a victory, ``exhausted`` for a defeat, and ``over`` for a command
+    sent after the game had already ended.
+    """
+
+    __slots__ = ('state', 'response', 'source', 'outcome')
+
+    def __init__(self, state, response, source, outcome=None):
+        self.state = state
+        self.response = response
+        self.source = source
+        self.outcome = outcome
+
+class GameEngine:
+    """Plays turns: a game state and a command in, a new state and a response out
+
+    ``play`` is the whole turn for callers without a request, such as
+    simulations; the views call its steps directly, around the upstream
+    call. The steps change the state they are given in place; they accept a
+    GameState or a plain dict. ``random`` decides the breakthrough and the
+    generic fallback text, so a seeded ``random.Random`` replays a game
+    exactly.
+    """
+
+    def __init__(self, rules=None, context=None, rng=None):
+        self.rules = rules or Rules()
+        self.context = context or ContextWindow()
+        self.random = rng or random
+
+    def play(self, state, command, respond):
+        """Play ``command`` on a copy of ``state``; returns a Turn
+
+        ``respond(command, state)`` is the response source. It returns
+        ``(content, source)`` with the forest's raw answer (from the AI, a
+        cache, a template, ...) to be judged and remembered like an AI
+        answer, or None when it has none and the turn gets a fallback.
+        """
+
+        if isinstance(state, GameState):
+            state = GameState.decode(state.encode())
+        else:
+            state = GameState(**state)
+        state['last_input'] = command
+
+        resolved = self.resolve(command, state)
+        if resolved is not None:
+            response, outcome = resolved
+            return Turn(state, response, 'rules', outcome)
+
+        reply = respond(command, state)
+        if reply is None:
+            response, outcome = self.fallback(command, state)
+            source = 'fallback'
+        else:
+            content, source = reply
+            response, outcome = self.apply_response(content, state)
+        self.update_items(command, state)
+        return Turn(state, response, source, outcome)
+
+    def resolve(self, command, state):
+        """``(response, outcome)`` for turns that never reach the AI, else None
+
+        A finished game, a winning solution and exhausted escape attempts
+        are decided by the rules alone.
+        """
+
+        if state.get('game_over', False):
+            return (WON_TEXT if state.get('victory', False) else LOST_TEXT), 'over'
+
+        if self.check_victory_condition(command, state):
+            state['victory'] = True
+            state['game_over'] = True
+            return OUTCOME_TEXTS['solution'], 'solution'
+
+        if state.get('escape_attempts', 0) >= self.rules.max_escape_attempts:
+            state['game_over'] = True
+            return OUTCOME_TEXTS['exhausted'], 'exhausted'
+
+        return None
+
+    def check_victory_condition(self, command, state):
+        """Count a winning solution command; True once there are enough of them"""
+
+        categories = keywords.classify(command)
+
+        for solution_group in keywords.SOLUTION_CATEGORIES:
+            if solution_group in categories:
+                creative_count = state.get('creative_attempts', 0) + 1
+                state['creative_attempts'] = creative_count
+
+                if creative_count >= self.rules.solution_attempts:
+                    return True
+
+        return False
+
+    def apply_response(self, content, state):
+        """Judge the forest's answer and remember the turn; returns ``(response, outcome)``"""
+
+        outcome = self.victory_reason(content, state)
+        if outcome is not None:
+            state['game_over'] = True
+            state['victory'] = True
+            content = OUTCOME_TEXTS['outsmarted']
+
+        # Direct attempts to leave count against the player
+        command = state.get('last_input', '')
+        categories = keywords.classify(command)
+        if 'escape' in categories or 'return_home' in categories:
+            state['escape_attempts'] = state.get('escape_attempts', 0) + 1
+
+        # Remember this turn, summarizing older ones to stay in budget
+        self.context.record(state, command, content)
+
+        return content, outcome
+
+    def victory_reason(self, content, state):
+        """Why the player has outsmarted the forest with this turn, or None
+
+        The answer concedes (``conceded``), a creative command after enough
+        escape attempts (``persistence``), or a random ``breakthrough``.
+        """
+
+        command = state.get('last_input', '').lower()
+        escape_attempts = state.get('escape_attempts', 0)
+
+        if self.indicates_success(content):
+            logger.info("Victory detected: AI indicated success")
+            return 'conceded'
+
+        if 'creative' in keywords.classify(command) and escape_attempts >= self.rules.persistence_attempts:
+            logger.info("Victory detected: Creative approach with persistence (%d attempts)", escape_attempts)
+            return 'persistence'
+
+        if (escape_attempts >= self.rules.breakthrough_after
+                and self.random.random() < self.rules.breakthrough_chance):
+            logger.info("Victory detected: Random breakthrough after %d attempts", escape_attempts)
+            return 'breakthrough'
+
+        return None
+
+    def indicates_success(self, content):
+        """Whether the forest's answer concedes that the player won"""
+
+        return 'victory_phrase' in keywords.classify(content)
+
+    def fallback_victory(self, command, state):
+        """The victory text if a creative command wins without the AI, else None"""
+
+        if ('creative' in keywords.classify(command)
+                and state.get('escape_attempts', 0) >= self.rules.fallback_persistence_attempts):
+            state['game_over'] = True
+            state['victory'] = True
+            return OUTCOME_TEXTS['fallback_persistence']
+        return None
+
+    def fallback(self, command, state):
+        """``(response, outcome)`` when no answer is available: a victory or a template"""
+
+        won = self.fallback_victory(command, state)
+        if won is not None:
+            return won, 'fallback_persistence'
+        return self.template_response(self.fallback_category(command)), None
+
+    def fallback_category(self, command):
+        """The calamity pool category for a command (see calamity_pool.py)"""
+
+        categories = keywords.classify(command)
+        for category in keywords.FALLBACK_CATEGORIES:
+            if category in categories:
+                return category
+        return 'generic'
+
+    def template_response(self, category):
+        return TEMPLATE_RESPONSES.get(category) or self.random.choice(GENERIC_RESPONSES)
+
+    def error_response(self, command, state):
+        """The answer when playing the turn failed outright"""
+
+        if 'escape' in keywords.classify(command):
+            state['escape_attempts'] = state.get('escape_attempts', 0) + 1
+            return ERROR_ESCAPE_TEXT
+        return ERROR_TEXT
+
+    def update_items(self, command, state):
+        """Find and break items"""
+
+        items = state.get('items', [])
+        categories = keywords.classify(command)
+
+        # Find items
+        if 'item_search' in categories:
+            if 'flashlight' not in items and 'item_pocket' in categories:
+                items.append('flashlight')
+            elif 'stick' not in items and 'item_ground' in categories:
+                items.append('stick')
+
+        # Use items (they might break due to forest influence)
+        if 'use_flashlight' in categories and 'flashlight' in items:
+            if state.get('escape_attempts', 0) > self.rules.flashlight_breaks_after:
+                items.remove('flashlight')  # Forest breaks it
+
+        state['items'] = items
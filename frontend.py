@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+"""
+Front-end build for Wonder of U
+Bundles frontend/ into one minified stylesheet and one minified script. The
+stylesheet holds only the Tailwind utilities the templates and scripts use,
+so the page needs no CDN and no in-browser CSS compiler. ``BundleFinder``
+hooks the build into collectstatic (and DEBUG static serving); WhiteNoise's
+manifest storage then fingerprints and precompresses the output.
+
+    python frontend.py          # build into FRONTEND_BUILD_DIR
+
+The font files are committed under static/fonts; the build never fetches
+anything, and fails if one is missing rather than ship a broken preload.
+"""
+import os
+import re
+import sys
+import threading
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.staticfiles.finders import BaseFinder
+from django.core.files.storage import FileSystemStorage
+
+BASE_DIR = Path(__file__).resolve().parent
+SOURCE_DIR = BASE_DIR / 'frontend'
+TEMPLATE_DIR = BASE_DIR / 'templates'
+FONT_DIR = BASE_DIR / 'static' / 'fonts'
+
+# Bundle path (relative to STATIC_URL) -> sources, in order
+BUNDLES = {
+    'bundle/app.css': ['css/styles.css'],
+    'bundle/app.js': ['js/main.js'],
+}
+
+# Self-hosted Space Mono, Latin subset (SIL Open Font License 1.1, see
+# static/fonts/README.md); weight -> file in static/. Only the body text
+# weight is preloaded; bold loads when a heading needs it.
+FONT_FAMILY = 'Space Mono'
+FONTS = {
+    400: 'fonts/space-mono-400.woff2',
+    700: 'fonts/space-mono-700.woff2',
+}
+PRELOAD_WEIGHTS = [400]
+
+# The subset of Tailwind's preflight (base reset) this page relies on
+PREFLIGHT = """
+*,::before,::after{box-sizing:border-box;border-width:0;border-style:solid;border-color:#e5e7eb}
+html{line-height:1.5;-webkit-text-size-adjust:100%;tab-size:4;font-family:ui-sans-serif,system-ui,sans-serif}
+body{margin:0;line-height:inherit}
+h1,h2,h3,p{margin:0}
+h1,h2,h3{font-size:inherit;font-weight:inherit}
+button,input{font-family:inherit;font-size:100%;font-weight:inherit;line-height:inherit;color:inherit;margin:0;padding:0}
+button{text-transform:none;background-color:transparent;background-image:none;cursor:pointer}
+input::placeholder{opacity:1;color:#9ca3af}
+[hidden]{display:none}
+"""
+
+def _color(rgb, prop, var):
+    return f"--tw-{var}-opacity:1;{prop}:rgb({rgb} / var(--tw-{var}-opacity))"
+
+_GREEN = {'300': '134 239 172', '400': '74 222 128', '600': '22 163 74', '700': '21 128 61'}
+
+# Tailwind (v3) utilities this game's markup may use, in Tailwind's output
+# order. Anything not listed here is reported by the build.
+UTILITIES = {
+    'hidden': 'display:none',
+    'flex': 'display:flex',
+    'min-h-screen': 'min-height:100vh',
+    'max-h-96': 'max-height:24rem',
+    'w-full': 'width:100%',
+    'max-w-4xl': 'max-width:56rem',
+    'items-center': 'align-items:center',
+    'justify-center': 'justify-content:center',
+    'justify-between': 'justify-content:space-between',
+    'space-y-8': None,  # child combinator, see _rule
+    'overflow-y-auto': 'overflow-y:auto',
+    'border': 'border-width:1px',
+    'border-l-2': 'border-left-width:2px',
+    'border-green-400': _color(_GREEN['400'], 'border-color', 'border'),
+    'border-red-400': _color('248 113 113', 'border-color', 'border'),
+    'border-yellow-400': _color('250 204 21', 'border-color', 'border'),
+    'bg-green-600': _color(_GREEN['600'], 'background-color', 'bg'),
+    'bg-green-700': _color(_GREEN['700'], 'background-color', 'bg'),
+    'p-3': 'padding:0.75rem',
+    'p-4': 'padding:1rem',
+    'px-4': 'padding-left:1rem;padding-right:1rem',
+    'py-2': 'padding-top:0.5rem;padding-bottom:0.5rem',
+    'mb-1': 'margin-bottom:0.25rem',
+    'mb-4': 'margin-bottom:1rem',
+    'mb-10': 'margin-bottom:2.5rem',
+    'mt-4': 'margin-top:1rem',
+    'mt-6': 'margin-top:1.5rem',
+    'mt-8': 'margin-top:2rem',
+    'text-sm': 'font-size:0.875rem;line-height:1.25rem',
+    'text-lg': 'font-size:1.125rem;line-height:1.75rem',
+    'text-xl': 'font-size:1.25rem;line-height:1.75rem',
+    'text-2xl': 'font-size:1.5rem;line-height:2rem',
+    'text-4xl': 'font-size:2.25rem;line-height:2.5rem',
+    'font-bold': 'font-weight:700',
+    'text-white': _color('255 255 255', 'color', 'text'),
+    'text-green-300': _color(_GREEN['300'], 'color', 'text'),
+    'text-green-400': _color(_GREEN['400'], 'color', 'text'),
+    'placeholder-green-400': _color(_GREEN['400'], 'color', 'placeholder'),
+    'placeholder-opacity-60': '--tw-placeholder-opacity:0.6',
+}
+
+# Variant prefix -> (selector suffix, media query)
+VARIANTS = {
+    'hover': (':hover', None),
+    'md': ('', '(min-width:768px)'),
+}
+
+_TOKEN = re.compile(r'[A-Za-z0-9:_\-./]+')
+_CLASS_LIST = re.compile(r'''class(?:Name)?\s*[=:]\s*["'`]([^"'`{]*)["'`]''')
+_CSS_CLASS = re.compile(r'\.([A-Za-z_][\w-]*)')
+
+def _is_utility(token):
+    *variants, utility = token.split(':')
+    return utility in UTILITIES and all(variant in VARIANTS for variant in variants)
+
+def scan_classes(paths, stylesheet=''):
+    """Utilities (with variants) named in the given files, and unknown classes
+
+    Like Tailwind's content scanning, any matching token counts, so class
+    names built in JavaScript strings are kept too. Unknown classes are
+    class attribute entries that are neither utilities nor defined in
+    ``stylesheet``.
+    """
+
+    custom = set(_CSS_CLASS.findall(stylesheet))
+    found = set()
+    unknown = set()
+    for path in paths:
+        text = Path(path).read_text(encoding='utf-8')
+        found.update(token for token in _TOKEN.findall(text) if _is_utility(token))
+        for class_list in _CLASS_LIST.findall(text):
+            unknown.update(name for name in class_list.split() if not _is_utility(name) and name not in custom)
+    return found, unknown
+
+def _escape(token):
+    return re.sub(r'([:./])', r'\\\1', token)
+
+def _rule(token):
+    *variants, utility = token.split(':')
+    selector = '.' + _escape(token)
+    if utility.startswith('placeholder-'):
+        selector += '::placeholder'
+    for variant in variants:
+        selector += VARIANTS[variant][0]
+    if utility == 'space-y-8':
+        rule = f"{selector}>:not([hidden])~:not([hidden]){{margin-top:2rem}}"
+    else:
+        rule = f"{selector}{{{UTILITIES[utility]}}}"
+    for variant in variants:
+        media = VARIANTS[variant][1]
+        if media:
+            rule = f"@media {media}{{{rule}}}"
+    return rule
+
+def utilities_css(tokens):
+    """CSS for the used utilities, plain ones first, then by variant"""
+
+    order = {name: index for index, name in enumerate(UTILITIES)}
+    ordered = sorted(tokens, key=lambda token: (token.count(':'), order[token.split(':')[-1]], token))
+    return '\n'.join(_rule(token) for token in ordered)
+
+def preload_fonts():
+    """Static paths of the fonts the page preloads"""
+
+    return [FONTS[weight] for weight in PRELOAD_WEIGHTS]
+
+def font_face_css():
+    missing = [path for path in FONTS.values() if not (BASE_DIR / 'static' / path).exists()]
+    if missing:
+        raise FileNotFoundError(f"Missing font files in static/: {', '.join(missing)}")
+    return '\n'.join(
+        "@font-face{font-family:'%s';font-style:normal;font-weight:%d;"
+        "font-display:swap;src:url(../%s) format('woff2')}" % (FONT_FAMILY, weight, path)
+        for weight, path in FONTS.items()
+    )
+
+def _content_files():
+    """Files scanned for class names: templates and the scripts"""
+
+    files = sorted(TEMPLATE_DIR.rglob('*.html'))
+    files += sorted((SOURCE_DIR / 'js').rglob('*.js'))
+    return files
+
+def build_bundle(name):
+    """Return the minified text of one bundle"""
+
+    import rcssmin
+    import rjsmin
+
+    sources = [(SOURCE_DIR / source).read_text(encoding='utf-8') for source in BUNDLES[name]]
+    if name.endswith('.css'):
+        tokens, unknown = scan_classes(_content_files(), '\n'.join(sources))
+        if unknown:
+            print(f"frontend: no CSS for {', '.join(sorted(unknown))}", file=sys.stderr)
+        # Fonts and the reset first; utilities last, so they win, as with Tailwind
+        css = '\n'.join([font_face_css(), PREFLIGHT, *sources, utilities_css(tokens)])
+        return rcssmin.cssmin(css)
+    return rjsmin.jsmin('\n;\n'.join(sources))
+
+class Builder:
+    """Builds the bundles into ``out_dir``, again whenever a source changes"""
+
+    def __init__(self, out_dir):
+        self.out_dir = Path(out_dir)
+        self._lock = threading.Lock()
+        self._stamp = None
+
+    def _sources_stamp(self):
+        files = [*SOURCE_DIR.rglob('*'), *_content_files(), *(BASE_DIR / 'static' / path for path in FONTS.values())]
+        return tuple(sorted((str(path), path.stat().st_mtime_ns) for path in files if path.is_file()))
+
+    def build(self):
+        stamp = self._sources_stamp()
+        if stamp == self._stamp:
+            return
+        with self._lock:
+            if stamp == self._stamp:
+                return
+            for name in BUNDLES:
+                target = self.out_dir / name
+                target.parent.mkdir(parents=True, exist_ok=True)
+                tmp = target.with_suffix(target.suffix + '.tmp')
+                tmp.write_text(build_bundle(name), encoding='utf-8')
+                os.replace(tmp, target)
+            self._stamp = stamp
+
+class BundleFinder(BaseFinder):
+    """Staticfiles finder that serves (and collectstatic collects) the bundles"""
+
+    def __init__(self, *args, **kwargs):
+        self.builder = Builder(settings.FRONTEND_BUILD_DIR)
+        self.storage = FileSystemStorage(location=str(settings.FRONTEND_BUILD_DIR))
+
+    def check(self, **kwargs):
+        return []
+
+    def find(self, path, find_all=False, **kwargs):
+        find_all = find_all or kwargs.get('all', False)
+        if path not in BUNDLES:
+            return [] if find_all else None
+        self.builder.build()
+        match = self.storage.path(path)
+        return [match] if find_all else match
+
+    def list(self, ignore_patterns):
+        self.builder.build()
+        for name in BUNDLES:
+            yield name, self.storage
+
+if __name__ == '__main__':
+    import django
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
+    django.setup()
+
+    Builder(settings.FRONTEND_BUILD_DIR).build()
+    for name in BUNDLES:
+        path = Path(settings.FRONTEND_BUILD_DIR) / name
+        print(f"{name}: {path.stat().st_size} bytes")
@@ -0,0 +1,357 @@
+const textElement = document.getElementById('typewriter-text');
+const textToType = "You wake up in a dark forest.";
+let i = 0;
+
+function typeWriter() {
+  if (i < textToType.length) {
+    textElement.innerHTML += textToType.charAt(i);
+    i++;
+    setTimeout(typeWriter, 100); 
+  }
+}
+
+// Django form handling with game state
+document.addEventListener('DOMContentLoaded', () => {
+  console.log('JavaScript loaded successfully');
+  setTimeout(typeWriter, 1000);
+  
+  const form = document.getElementById('game-form');
+  const userInput = document.getElementById('user-input');
+  const gameResponse = document.getElementById('game-response');
+  
+  console.log('Form found:', form);
+  console.log('Input found:', userInput);
+  
+  // Create game UI elements
+  createGameUI();
+  
+  // The page is the same for everyone; this player's game comes separately
+  loadGameState();
+  
+  if (form) {
+    form.addEventListener('submit', async (e) => {
+      e.preventDefault(); // Prevent default form submission
+      console.log('Form submitted');
+      await submitCommand(userInput);
+    });
+  }
+  
+  // Handle Enter key directly without form submission event
+  if (userInput) {
+    userInput.addEventListener('keypress', async (e) => {
+      if (e.key === 'Enter' && !userInput.disabled) {
+        e.preventDefault();
+        console.log('Enter pressed');
+        await submitCommand(userInput);
+      }
+    });
+    
+    // Speculative turns: send the command once typing pauses (0 = off)
+    const speculateAfter = parseInt(userInput.dataset.speculateAfter || '0', 10);
+    if (speculateAfter > 0) {
+      let timer = null;
+      userInput.addEventListener('input', () => {
+        clearTimeout(timer);
+        timer = setTimeout(() => speculate(userInput), speculateAfter);
+      });
+    }
+  }
+});
+
+// Speculations sent per command, at most one in flight
+const MAX_SPECULATIONS = 3;
+let lastDraft = '';
+let speculations = 0;
+let speculation = null;
+
+function speculate(userInput) {
+  const draft = userInput.value.trim();
+  
+  // Nothing new to play, the command is already being submitted, or this
+  // command has had its share
+  if (!draft || draft === lastDraft || userInput.disabled || speculations >= MAX_SPECULATIONS) {
+    return;
+  }
+  lastDraft = draft;
+  speculations++;
+  
+  // A newer draft replaces the one still being sent
+  if (speculation) {
+    speculation.abort();
+  }
+  const controller = new AbortController();
+  speculation = controller;
+  
+  const formData = new FormData();
+  formData.append('user_input', draft);
+  
+  // Fire and forget: the submit picks the turn up if it matches
+  fetch('/speculate/', {
+    method: 'POST',
+    body: formData,
+    headers: { 'X-Requested-With': 'XMLHttpRequest' },
+    signal: controller.signal
+  }).catch((error) => {
+    if (error.name !== 'AbortError') {
+      console.log('Speculation failed:', error);
+    }
+  }).finally(() => {
+    if (speculation === controller) {
+      speculation = null;
+    }
+  });
+}
+
+async function loadGameState() {
+  // The browser revalidates with the ETag, so an unchanged game is a 304
+  try {
+    const response = await fetch('/state/', { headers: { 'Accept': 'application/json' } });
+    if (!response.ok) {
+      return;
+    }
+    updateGameStateUI(await response.json());
+  } catch (error) {
+    console.log('Could not load the game state:', error);
+  }
+}
+
+async function submitCommand(userInput) {
+  const inputValue = userInput.value.trim();
+  console.log('Input value:', inputValue);
+  
+  if (!inputValue) {
+    console.log('Empty input, returning');
+    return;
+  }
+  
+  // Ignore double submits while the previous command is still in flight
+  if (userInput.disabled) {
+    return;
+  }
+  
+  // Disable input during processing
+  userInput.disabled = true;
+  let gameOver = false;
+  
+  try {
+    const formData = new FormData();
+    formData.append('user_input', inputValue);
+    
+    console.log('Sending request to /process-input/stream/');
+    
+    const response = await fetch('/process-input/stream/', {
+      method: 'POST',
+      body: formData,
+      headers: {
+        'X-Requested-With': 'XMLHttpRequest',
+        'Accept': 'text/event-stream',
+      }
+    });
+    
+    console.log('Response received:', response.status);
+    
+    if (response.ok) {
+      const contentType = response.headers.get('Content-Type') || '';
+      let data;
+      
+      let entry = null;
+      
+      if (contentType.startsWith('text/event-stream')) {
+        // Render tokens as they arrive, then settle on the final response
+        data = await readEventStream(response, (token) => {
+          if (!entry) {
+            entry = displayGameResponse('', inputValue);
+          }
+          entry.textContent += token;
+          scrollHistory();
+        });
+      } else {
+        data = await response.json();
+      }
+      
+      // The previous command is still being answered; keep this one typed in
+      if (data.processing) {
+        console.log('Still processing previous command');
+        return;
+      }
+      
+      const text = data.success ? data.response : data.error;
+      if (entry) {
+        entry.textContent = text;
+      } else {
+        displayGameResponse(text, inputValue);
+      }
+      
+      console.log('Response data:', data);
+      
+      // Update game state UI
+      updateGameStateUI(data);
+      
+      // Check for game over
+      if (data.game_over) {
+        gameOver = true;
+        handleGameOver(data.victory);
+      }
+      
+      // Clear input
+      userInput.value = '';
+      lastDraft = '';
+      speculations = 0;
+      
+    } else {
+      console.error('Server error:', response.status);
+      displayGameResponse('Error connecting to the game server. Try again.', inputValue);
+    }
+  } catch (error) {
+    console.error('Request failed:', error);
+    displayGameResponse('Connection error. The forest\'s influence may be interfering...', inputValue);
+  } finally {
+    if (!gameOver) {
+      userInput.disabled = false;
+      userInput.focus();
+    }
+  }
+}
+
+async function readEventStream(response, onToken) {
+  // Minimal server-sent events parser over a fetch() body stream
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  let result = null;
+  
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    
+    buffer += decoder.decode(value, { stream: true });
+    
+    let boundary;
+    while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+      const rawEvent = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      
+      let eventName = 'message';
+      let dataLines = [];
+      for (const line of rawEvent.split('\n')) {
+        if (line.startsWith('event:')) {
+          eventName = line.slice(6).trim();
+        } else if (line.startsWith('data:')) {
+          dataLines.push(line.slice(5).trimStart());
+        }
+      }
+      
+      const payload = JSON.parse(dataLines.join('\n'));
+      if (eventName === 'token') {
+        onToken(payload.text);
+      } else if (eventName === 'done') {
+        result = payload;
+      }
+    }
+  }
+  
+  if (!result) {
+    throw new Error('Stream ended before the forest finished responding');
+  }
+  return result;
+}
+
+function createGameUI() {
+  // Create game status container
+  const gameStatus = document.createElement('div');
+  gameStatus.id = 'game-status';
+  gameStatus.className = 'mb-4 p-3 border border-green-400 text-sm';
+  gameStatus.innerHTML = `
+    <div class="flex justify-between items-center">
+      <span>Escape Attempts: <span id="escape-count">0</span>/<span id="max-attempts">10</span></span>
+      <span>Items: <span id="item-list">None</span></span>
+    </div>
+  `;
+  
+  // Insert before the input form
+  const inputContainer = document.querySelector('.mt-8');
+  inputContainer.parentNode.insertBefore(gameStatus, inputContainer);
+  
+  // Create game history container
+  const gameHistory = document.createElement('div');
+  gameHistory.id = 'game-history';
+  gameHistory.className = 'mt-6 max-h-96 overflow-y-auto';
+  
+  // Insert after the input form
+  inputContainer.parentNode.insertBefore(gameHistory, inputContainer.nextSibling);
+}
+
+function displayGameResponse(response, userCommand) {
+  const gameHistory = document.getElementById('game-history');
+  
+  // Create command entry
+  const commandEntry = document.createElement('div');
+  commandEntry.className = 'mb-4 p-3 border-l-2 border-green-400';
+  commandEntry.innerHTML = `
+    <div class="text-green-300 text-sm mb-1">→ ${userCommand}</div>
+    <div class="text-green-400"></div>
+  `;
+  
+  // Response text is filled in separately so streamed tokens can be appended
+  const responseElement = commandEntry.lastElementChild;
+  responseElement.textContent = response;
+  
+  gameHistory.appendChild(commandEntry);
+  
+  // Scroll to bottom
+  scrollHistory();
+  
+  // Limit history entries
+  const entries = gameHistory.children;
+  if (entries.length > 20) {
+    gameHistory.removeChild(entries[0]);
+  }
+  
+  return responseElement;
+}
+
+function scrollHistory() {
+  const gameHistory = document.getElementById('game-history');
+  gameHistory.scrollTop = gameHistory.scrollHeight;
+}
+
+function updateGameStateUI(data) {
+  const maxAttempts = document.getElementById('max-attempts');
+  if (maxAttempts && data.max_attempts !== undefined) {
+    maxAttempts.textContent = data.max_attempts;
+  }
+  
+  // Update escape attempts
+  const escapeCount = document.getElementById('escape-count');
+  if (escapeCount && data.escape_attempts !== undefined) {
+    escapeCount.textContent = data.escape_attempts;
+    
+    // Change color based on attempts
+    const statusContainer = document.getElementById('game-status');
+    if (data.escape_attempts >= 8) {
+      statusContainer.className = statusContainer.className.replace('border-green-400', 'border-red-400');
+    } else if (data.escape_attempts >= 5) {
+      statusContainer.className = statusContainer.className.replace('border-green-400', 'border-yellow-400');
+    }
+  }
+  
+  // Update items
+  const itemList = document.getElementById('item-list');
+  if (itemList && data.items) {
+    itemList.textContent = data.items.length > 0 ? data.items.join(', ') : 'None';
+  }
+}
+
+function handleGameOver(victory) {
+  const userInput = document.getElementById('user-input');
+  userInput.disabled = true;
+  userInput.placeholder = victory ? "You have escaped! Congratulations!" : "Game Over - The forest has claimed you.";
+  
+  // Create restart button
+  const restartButton = document.createElement('button');
+  restartButton.textContent = 'Start New Game';
+  restartButton.className = 'mt-4 px-4 py-2 bg-green-600 text-white border border-green-400 hover:bg-green-700';
+  restartButton.onclick = () => window.location.reload();
+  
+  userInput.parentNode.appendChild(restartButton);
+}
@@ -0,0 +1,295 @@
+"""
+Game state storage for Wonder of U
+A compact, fixed-shape GameState plus a write-behind store, so the session
+cookie only carries a game ID and each turn costs one indexed read and, only
+when something changed, one batched write
+"""
+import atexit
+import json
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Append new fields at the end: games stored before they existed still decode
+FIELDS = (
+    'current_area', 'items', 'escape_attempts', 'recent_actions',
+    'discovered_areas', 'game_over', 'victory', 'last_input', 'creative_attempts',
+    'summary',
+)
+_FIELD_SET = frozenset(FIELDS)
+
+class GameState:
+    """Fixed set of slots with the dict-style access the game code already uses
+
+    ``state['items']`` and ``state.get('escape_attempts', 0)`` keep working,
+    but unknown keys raise KeyError instead of silently growing the state.
+    Serializes to a positional JSON array (see ``encode``).
+    """
+
+    __slots__ = FIELDS + ('_snapshot',)
+
+    def __init__(self, **values):
+        unknown = set(values) - _FIELD_SET
+        if unknown:
+            raise KeyError(f"Unknown game state fields: {', '.join(sorted(unknown))}")
+
+        self.current_area = values.get('current_area', 'dark_forest')
+        self.items = list(values.get('items', []))
+        self.escape_attempts = values.get('escape_attempts', 0)
+        self.recent_actions = list(values.get('recent_actions', []))
+        self.discovered_areas = list(values.get('discovered_areas', ['dark_forest']))
+        self.game_over = values.get('game_over', False)
+        self.victory = values.get('victory', False)
+        self.last_input = values.get('last_input', '')
+        self.creative_attempts = values.get('creative_attempts', 0)
+        self.summary = dict(values.get('summary', {}))
+        self._snapshot = None
+
+    def get(self, key, default=None):
+        if key in _FIELD_SET:
+            return getattr(self, key)
+        return default
+
+    def __getitem__(self, key):
+        if key not in _FIELD_SET:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in _FIELD_SET:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in _FIELD_SET
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in FIELDS}
+
+    def encode(self):
+        """Positional JSON: field names are implied by FIELDS order"""
+
+        return json.dumps([getattr(self, field) for field in FIELDS], separators=(',', ':'))
+
+    @classmethod
+    def decode(cls, data):
+        values = json.loads(data)
+        return cls(**dict(zip(FIELDS, values)))
+
+    @property
+    def dirty(self):
+        """True if the state changed since it was loaded or last saved"""
+
+        return self.encode() != self._snapshot
+
+class GameStateStore:
+    """WAL-mode SQLite store with dirty-only, write-behind batched saves
+
+    ``save`` only queues a write when the encoded state differs from what was
+    loaded, and a background thread commits queued writes in one transaction
+    every ``flush_interval`` seconds (or as soon as ``batch_size`` games are
+    pending). Saves are visible to later loads in the same process right
+    away; other worker processes see them after the next flush. With
+    ``flush_interval=0`` every save is written through synchronously.
+    Games idle for longer than ``max_age`` seconds are purged.
+
+    The store also keeps per-game turn leases so only one process plays a
+    game's turn at a time. Releasing a lease is committed in the same flush
+    as the turn's state, so the next holder never reads a stale game.
+    """
+
+    def __init__(self, path, flush_interval=0.05, batch_size=256, max_age=3600):
+        self.path = str(path)
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_age = max_age
+
+        self._local = threading.local()
+        self._pending = {}
+        self._pending_releases = {}
+        self._pending_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._writer = None
+        self._writer_pid = None
+        self._last_purge = 0.0
+        self.stats = {'loads': 0, 'saves': 0, 'clean_skips': 0, 'flushes': 0, 'rows_written': 0}
+
+        atexit.register(self.flush)
+
+    def _connect(self):
+        """Return this thread's connection, reopening it after a fork"""
+
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS game_states (
+                    game_id TEXT PRIMARY KEY,
+                    state TEXT NOT NULL,
+                    updated REAL NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS game_states_updated ON game_states (updated)')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS turn_leases (
+                    game_id TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    token TEXT NOT NULL,
+                    command TEXT NOT NULL,
+                    expires REAL NOT NULL
+                )
+            ''')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def new_id(self):
+        return secrets.token_urlsafe(16)
+
+    def load(self, game_id):
+        """Return the game's state, or a fresh GameState if none is stored"""
+
+        self.stats['loads'] += 1
+        with self._pending_lock:
+            encoded = self._pending.get(game_id)
+
+        if encoded is None:
+            row = self._connect().execute(
+                'SELECT state FROM game_states WHERE game_id = ?', (game_id,)
+            ).fetchone()
+            encoded = row[0] if row else None
+
+        state = GameState.decode(encoded) if encoded is not None else GameState()
+        state._snapshot = encoded
+        return state
+
+    def save(self, game_id, state):
+        """Persist the state if it changed; returns True if a write was queued"""
+
+        encoded = state.encode()
+        if encoded == state._snapshot:
+            self.stats['clean_skips'] += 1
+            return False
+
+        state._snapshot = encoded
+        self.stats['saves'] += 1
+
+        if self.flush_interval <= 0:
+            self._write({game_id: encoded})
+            return True
+
+        with self._pending_lock:
+            self._pending[game_id] = encoded
+            pending = len(self._pending)
+
+        self._ensure_writer()
+        if pending >= self.batch_size:
+            self._wake.set()
+        return True
+
+    def claim_turn(self, game_id, owner, token, command, ttl):
+        """Take the game's turn lease for ``owner`` (one per process)
+
+        Returns None when the lease was taken, otherwise the command the
+        current holder is playing. Leases already held by the same owner or
+        past their expiry are taken over.
+        """
+
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                'SELECT owner, command, expires FROM turn_leases WHERE game_id = ?', (game_id,)
+            ).fetchone()
+            if row is not None and row[0] != owner and row[2] > now:
+                return row[1]
+            conn.execute(
+                'INSERT OR REPLACE INTO turn_leases (game_id, owner, token, command, expires) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (game_id, owner, token, command, now + ttl)
+            )
+        return None
+
+    def release_turn(self, game_id, token):
+        """Release a turn lease once the turn's state is durable"""
+
+        if self.flush_interval <= 0:
+            self._write({}, {game_id: token})
+            return
+
+        with self._pending_lock:
+            self._pending_releases[game_id] = token
+        self._ensure_writer()
+
+    def flush(self):
+        """Write every pending save (and the lease releases behind them) now"""
+
+        with self._pending_lock:
+            batch, self._pending = self._pending, {}
+            releases, self._pending_releases = self._pending_releases, {}
+        if not batch and not releases:
+            return
+
+        try:
+            self._write(batch, releases)
+        except Exception:
+            # Put the batch back unless a newer save has superseded it
+            with self._pending_lock:
+                for game_id, encoded in batch.items():
+                    self._pending.setdefault(game_id, encoded)
+                for game_id, token in releases.items():
+                    self._pending_releases.setdefault(game_id, token)
+            raise
+
+    def _write(self, batch, releases=None):
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.executemany(
+                'INSERT INTO game_states (game_id, state, updated) VALUES (?, ?, ?) '
+                'ON CONFLICT(game_id) DO UPDATE SET state = excluded.state, updated = excluded.updated',
+                [(game_id, encoded, now) for game_id, encoded in batch.items()]
+            )
+            if releases:
+                # Only the claim that queued the release may delete the lease
+                conn.executemany(
+                    'DELETE FROM turn_leases WHERE game_id = ? AND token = ?',
+                    list(releases.items())
+                )
+            if now - self._last_purge > 60:
+                conn.execute('DELETE FROM game_states WHERE updated < ?', (now - self.max_age,))
+                conn.execute('DELETE FROM turn_leases WHERE expires < ?', (now,))
+                self._last_purge = now
+        self.stats['flushes'] += 1
+        self.stats['rows_written'] += len(batch)
+
+    def _ensure_writer(self):
+        """Start the writer thread on first use in each (forked) process"""
+
+        if self._writer_pid == os.getpid() and self._writer.is_alive():
+            return
+        with self._pending_lock:
+            if self._writer_pid == os.getpid() and self._writer.is_alive():
+                return
+            self._writer = threading.Thread(target=self._run_writer, name='game-state-writer', daemon=True)
+            self._writer_pid = os.getpid()
+            self._writer.start()
+
+    def _run_writer(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning("Game state flush error: %s", e)
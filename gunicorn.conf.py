@@ -0,0 +1,54 @@
+"""
+Production gunicorn settings for Wonder of U
+gunicorn reads this file from the working directory, so the start command
+is just:
+
+    gunicorn                                                  # WSGI
+    gunicorn -k uvicorn_worker.UvicornWorker asgi:application   # ASGI
+
+The app is imported once in the master and the workers are forked from it,
+sharing its memory copy-on-write; each worker then opens its own upstream
+connections. Command line options override the settings here.
+"""
+import gc
+import os
+import time
+
+from settings import MISTRAL_CONNECT_TIMEOUT, MISTRAL_READ_TIMEOUT
+
+import startup
+
+_started = time.perf_counter()
+os.environ[startup.PRELOAD_ENV] = 'True'
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+wsgi_app = 'wsgi:application'
+preload_app = True
+
+# A turn spends nearly all its time waiting on the LLM, so a few processes
+# with many threads each: a request thread waits while one of the worker's
+# upstream threads (MISTRAL_POOL_SIZE, at least ADMISSION_MAX_CONCURRENT)
+# makes the call
+worker_class = 'gthread'
+workers = int(os.getenv('WEB_CONCURRENCY', str(max(2, os.cpu_count() or 1))))
+threads = int(os.getenv('GUNICORN_THREADS', '16'))
+
+# Let in-flight upstream calls finish on restarts and deploys
+graceful_timeout = int(MISTRAL_CONNECT_TIMEOUT + MISTRAL_READ_TIMEOUT) + 5
+timeout = graceful_timeout + 30
+keepalive = 5
+loglevel = os.getenv('LOG_LEVEL', 'info').lower()
+
+# Heartbeat files in memory rather than on a possibly slow disk
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+def when_ready(server):
+    # Everything the master has imported is shared with the workers. Keep
+    # the garbage collector from writing to (and so copying) those pages.
+    gc.collect()
+    gc.freeze()
+    server.log.info("App preloaded in %.2fs", time.perf_counter() - _started)
+
+def post_worker_init(worker):
+    startup.warm_up()
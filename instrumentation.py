@@ -0,0 +1,344 @@
+"""
+Instrumentation for Wonder of U
+Per-request timing spans (returned in a Server-Timing header), counters and
+histograms shared by every worker for a Prometheus-style /metrics endpoint,
+and a queue-backed log handler so request threads never wait on log output
+"""
+import atexit
+import contextvars
+import logging
+import logging.handlers
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+# Seconds; covers a cache hit (~ms) up to the upstream read timeout
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+HELP = {
+    'wonderofu_request_seconds': 'Time to produce the response (headers, for streams), by view',
+    'wonderofu_stage_seconds': 'Time spent in each stage of a turn',
+    'wonderofu_turns_total': 'Commands played, by source (ai, rules, error, shared with a duplicate)',
+    'wonderofu_responses_total': 'Forest responses, by source (ai, cache, local, fallback)',
+    'wonderofu_intent_total': 'Commands by classified intent and route (local, or llm)',
+    'wonderofu_games_started_total': 'New games',
+    'wonderofu_games_finished_total': 'Finished games, by result',
+    'wonderofu_upstream_responses_total': 'Upstream LLM calls, by endpoint and HTTP status (or error/timeout)',
+    'wonderofu_upstream_routes_total': 'Endpoints picked for upstream calls, by endpoint and tier (none when all were unusable)',
+    'wonderofu_upstream_hedged_total': 'Upstream calls that exceeded their latency budget',
+    'wonderofu_upstream_tokens_total': 'Tokens reported by the upstream, by kind',
+    'wonderofu_admission_total': 'Upstream call admission decisions, by outcome',
+    'wonderofu_admission_wait_seconds': 'Time admitted calls spent queued for an upstream slot',
+    'wonderofu_calamity_pool_total': 'Fallback lookups in the calamity pool, by category and result',
+    'wonderofu_speculations_total': 'Speculative turns, by outcome (started, capped, hit, miss, replaced, expired, failed)',
+    'wonderofu_transcript_turns_total': 'Turns queued for the transcript store, or dropped because its queue was full',
+}
+
+# --- Timing spans ----------------------------------------------------------
+
+# Stage name -> seconds for the request being served; None outside requests.
+# Context variables follow the request into sync_to_async threads, tasks and
+# (via copy_context) the upstream executor.
+_timings = contextvars.ContextVar('wonderofu_timings', default=None)
+
+@contextmanager
+def span(stage):
+    """Time a block as one stage of the current request"""
+
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - started)
+
+def record(stage, seconds):
+    """Add an externally measured duration to a stage"""
+
+    timings = _timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+    metrics.observe('wonderofu_stage_seconds', seconds, stage=stage)
+
+def server_timing(timings):
+    return ', '.join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items())
+
+class ServerTimingMiddleware:
+    """Collects the request's spans and returns them in ``Server-Timing``
+
+    Streaming responses send their headers before the body runs, so their
+    header only covers the stages before streaming starts; stages inside
+    the stream still reach the metrics.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        timings = {}
+        token = _timings.set(timings)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _timings.reset(token)
+        return self._finish(request, response, timings, started)
+
+    async def __acall__(self, request):
+        timings = {}
+        token = _timings.set(timings)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _timings.reset(token)
+        return self._finish(request, response, timings, started)
+
+    def _finish(self, request, response, timings, started):
+        total = time.perf_counter() - started
+        match = getattr(request, 'resolver_match', None)
+        view = match.url_name if match is not None and match.url_name else 'other'
+        metrics.observe('wonderofu_request_seconds', total, view=view)
+
+        if settings.SERVER_TIMING:
+            timings['total'] = total
+            response['Server-Timing'] = server_timing(timings)
+        return response
+
+# --- Metrics ---------------------------------------------------------------
+
+class Metrics:
+    """Counters and histograms aggregated across every worker on the host
+
+    Updates only touch an in-memory dict. A background thread adds the
+    accumulated deltas to a shared SQLite file every ``flush_interval``
+    seconds, and ``render`` reads the totals from there, so whichever
+    worker answers a scrape reports the whole host.
+    """
+
+    def __init__(self, path, flush_interval=5.0, enabled=True):
+        self.path = str(path)
+        self.flush_interval = flush_interval
+        self.enabled = enabled
+
+        self._pending = {}
+        self._kinds = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._writer = None
+        self._writer_pid = None
+
+        atexit.register(self.flush)
+
+    def _connect(self):
+        """Return this thread's connection, reopening it after a fork"""
+
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS metrics (
+                    name TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    labels TEXT NOT NULL,
+                    field TEXT NOT NULL,
+                    value REAL NOT NULL,
+                    PRIMARY KEY (name, labels, field)
+                )
+            ''')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def inc(self, name, amount=1, **labels):
+        """Increment a counter"""
+
+        if not self.enabled:
+            return
+        key = (name, _labels(labels), '')
+        with self._lock:
+            self._kinds[name] = 'counter'
+            self._pending[key] = self._pending.get(key, 0) + amount
+        self._ensure_writer()
+
+    def observe(self, name, value, buckets=DEFAULT_BUCKETS, **labels):
+        """Record one observation in a histogram"""
+
+        if not self.enabled:
+            return
+        labels = _labels(labels)
+        bucket = next((bound for bound in buckets if value <= bound), None)
+        with self._lock:
+            self._kinds[name] = 'histogram'
+            pending = self._pending
+            for field, amount in (('count', 1), ('sum', value)):
+                key = (name, labels, field)
+                pending[key] = pending.get(key, 0) + amount
+            # Buckets are stored non-cumulative and summed up when rendering
+            if bucket is not None:
+                key = (name, labels, repr(float(bucket)))
+                pending[key] = pending.get(key, 0) + 1
+        self._ensure_writer()
+
+    def flush(self):
+        """Add this process's pending deltas to the shared totals"""
+
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            kinds = dict(self._kinds)
+        if not pending:
+            return
+
+        try:
+            conn = self._connect()
+            with conn:
+                conn.execute('BEGIN IMMEDIATE')
+                conn.executemany(
+                    'INSERT INTO metrics (name, kind, labels, field, value) VALUES (?, ?, ?, ?, ?) '
+                    'ON CONFLICT(name, labels, field) DO UPDATE SET value = value + excluded.value',
+                    [(name, kinds[name], labels, field, value) for (name, labels, field), value in pending.items()]
+                )
+        except Exception:
+            with self._lock:
+                for key, value in pending.items():
+                    self._pending[key] = self._pending.get(key, 0) + value
+            raise
+
+    def render(self):
+        """Prometheus text exposition of the totals of every worker"""
+
+        self.flush()
+        rows = self._connect().execute(
+            'SELECT name, kind, labels, field, value FROM metrics ORDER BY name, labels'
+        ).fetchall()
+
+        series = {}
+        for name, kind, labels, field, value in rows:
+            series.setdefault((name, kind), {}).setdefault(labels, {})[field] = value
+
+        lines = []
+        for (name, kind), by_labels in series.items():
+            if name in HELP:
+                lines.append(f"# HELP {name} {HELP[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, fields in by_labels.items():
+                if kind == 'counter':
+                    lines.append(f"{name}{_braces(labels)} {_number(fields.get('', 0))}")
+                    continue
+                cumulative = 0
+                bounds = sorted(float(field) for field in fields if field not in ('count', 'sum'))
+                for bound in bounds:
+                    cumulative += fields[repr(bound)]
+                    lines.append(f'{name}_bucket{_braces(labels, f"le={_quote(_number(bound))}")} {_number(cumulative)}')
+                lines.append(f'{name}_bucket{_braces(labels, "le=" + _quote("+Inf"))} {_number(fields.get("count", 0))}')
+                lines.append(f"{name}_sum{_braces(labels)} {fields.get('sum', 0):.6f}")
+                lines.append(f"{name}_count{_braces(labels)} {_number(fields.get('count', 0))}")
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        with self._lock:
+            self._pending = {}
+        conn = self._connect()
+        with conn:
+            conn.execute('DELETE FROM metrics')
+
+    def _ensure_writer(self):
+        """Start the flush thread on first use in each (forked) process"""
+
+        if self._writer_pid == os.getpid():
+            return
+        with self._lock:
+            if self._writer_pid == os.getpid():
+                return
+            self._writer = threading.Thread(target=self._run_writer, name='metrics-writer', daemon=True)
+            self._writer_pid = os.getpid()
+            self._writer.start()
+
+    def _run_writer(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logging.getLogger(__name__).warning("Metrics flush failed: %s", e)
+
+def _labels(labels):
+    return ','.join(f'{key}={_quote(str(value))}' for key, value in sorted(labels.items()))
+
+def _quote(value):
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+
+def _braces(*parts):
+    labels = ','.join(part for part in parts if part)
+    return '{' + labels + '}' if labels else ''
+
+def _number(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+metrics = Metrics(
+    settings.METRICS_PATH,
+    flush_interval=settings.METRICS_FLUSH_INTERVAL,
+    enabled=settings.METRICS_ENABLED,
+)
+
+# --- Logging ---------------------------------------------------------------
+
+class QueueLogHandler(logging.handlers.QueueHandler):
+    """Logging handler that only enqueues; a listener thread does the writing
+
+    Formatting and the stderr write happen on the listener thread. The
+    listener starts on first use and again in each forked worker.
+    """
+
+    def __init__(self, stream=None):
+        super().__init__(queue.SimpleQueue())
+        self.target = logging.StreamHandler(stream or sys.stderr)
+        self._listener = None
+        self._listener_pid = None
+        self._start_lock = threading.Lock()
+
+    def setFormatter(self, fmt):
+        # Formatting is the listener's job
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        # Resolve the message now (its arguments may change later) but leave
+        # formatting, tracebacks included, to the listener thread
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def emit(self, record):
+        if self._listener_pid != os.getpid():
+            self._start_listener()
+        super().emit(record)
+
+    def _start_listener(self):
+        with self._start_lock:
+            if self._listener_pid == os.getpid():
+                return
+            # A forked child gets a fresh queue; the parent's listener thread
+            # did not survive the fork
+            self.queue = queue.SimpleQueue()
+            self._listener = logging.handlers.QueueListener(self.queue, self.target)
+            self._listener.start()
+            self._listener_pid = os.getpid()
+            atexit.register(self._listener.stop)
@@ -0,0 +1,324 @@
+#!/usr/bin/env python
+"""
+Intent classifier for Wonder of U
+Labels a player command (movement, look, escape, creative, ...) with a
+confidence in a few microseconds, so routine commands can be answered
+locally and only novel or ambiguous ones go to the LLM. Features are hashed
+word and character n-grams; the model is a NumPy softmax regression trained
+on the seed commands below plus the commands in the transcript store.
+
+    python intent.py train             # train on seeds + transcripts, save to INTENT_MODEL_PATH
+    python intent.py eval [THRESHOLD]  # cross-validated accuracy and bypass precision
+    python intent.py classify COMMAND...
+"""
+import logging
+import os
+import re
+import threading
+import time
+from zlib import crc32
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+INTENTS = [
+    'escape', 'creative', 'movement', 'look', 'wait', 'inventory', 'combat',
+    'fire', 'climbing', 'shouting', 'darkness', 'signal', 'other',
+]
+
+# Pool category (calamity_pool.CATEGORIES) that answers each intent locally
+POOL_CATEGORIES = {
+    'movement': 'movement', 'look': 'generic', 'wait': 'generic', 'combat': 'weapon',
+    'fire': 'fire', 'climbing': 'climbing', 'shouting': 'shouting', 'darkness': 'darkness',
+    'signal': 'signal',
+}
+
+# Keyword category -> intent, for labelling recorded commands
+KEYWORD_INTENTS = {
+    'escape': 'escape', 'return_home': 'escape', 'creative': 'creative',
+    'fire': 'fire', 'weapon': 'combat', 'movement': 'movement', 'climbing': 'climbing',
+    'shouting': 'shouting', 'darkness': 'darkness', 'signal': 'signal',
+    'item_search': 'inventory', 'item_pocket': 'inventory', 'item_ground': 'inventory',
+    'use_flashlight': 'inventory',
+}
+
+SEED_COMMANDS = {
+    'escape': [
+        'leave the forest', 'find the exit', 'escape', 'look for a way out', 'get out of here',
+        'go home', 'run out of the forest', 'return to the road', 'find my way back to the car',
+        'break out of the forest', 'try to escape', 'exit the woods', 'head back home',
+        'follow the path out', 'i want to leave', 'run back the way i came', 'search for the way out',
+    ],
+    'creative': [
+        'thank the forest', 'sing a song', 'dance with the trees', 'tell the forest a joke',
+        'meditate', 'close my eyes and dream', 'apologize to the trees', 'plant a seed',
+        'befriend the spirit', 'tell a story', 'walk backwards', 'look in the mirror',
+        'forgive the forest', 'hug a tree', 'recite a poem', 'heal the wounded tree',
+        'pretend i am a tree', 'remember my childhood', 'ask the forest a riddle',
+    ],
+    'movement': [
+        'go north', 'go south', 'go east', 'go west', 'walk forward', 'move ahead',
+        'head north', 'walk east', 'keep walking', 'follow the trail', 'go left', 'turn right',
+        'walk deeper into the forest', 'go towards the clearing', 'step forward', 'n', 'walk north',
+        'move west', 'wander around', 'continue down the path', 'cross the stream', 'go down the hill',
+    ],
+    'look': [
+        'look around', 'look', 'examine the trees', 'inspect the ground', 'observe', 'l',
+        'look at the sky', 'check my surroundings', 'what do i see', 'study the bark',
+        'peer into the darkness', 'look behind me', 'examine the moss', 'scan the area',
+        'look closer', 'inspect the clearing', 'where am i', 'describe the forest',
+    ],
+    'wait': [
+        'wait', 'rest', 'sit down', 'do nothing', 'stand still', 'wait a moment', 'take a break',
+        'sit on a log', 'catch my breath', 'pause', 'stay here', 'lie down', 'idle', 'z',
+        'wait and listen', 'listen', 'listen carefully', 'breathe deeply',
+    ],
+    'inventory': [
+        'search my pocket', 'check my pockets', 'inventory', 'i', 'what do i have',
+        'search the ground', 'pick up a branch', 'use flashlight', 'turn on the flashlight',
+        'look for a stick', 'grab the branch', 'check my bag', 'take the stick', 'open my backpack',
+        'search for items', 'drop the stick', 'hold the flashlight',
+    ],
+    'combat': [
+        'shoot the shadows', 'attack the tree', 'fight the spirit', 'punch the tree', 'kick the root',
+        'draw my gun', 'stab the darkness', 'hit it with the stick', 'fire my pistol', 'attack',
+        'swing the branch at it', 'fight back', 'shoot', 'use my weapon', 'strike the creature',
+    ],
+    'fire': [
+        'light a fire', 'burn the trees', 'start a fire', 'set the forest on fire', 'make a campfire',
+        'light a match', 'burn it down', 'make a torch', 'strike a flame', 'build a fire',
+        'use my lighter', 'set fire to the branch', 'blow smoke',
+    ],
+    'climbing': [
+        'climb a tree', 'climb up', 'climb the tallest tree', 'scale the cliff', 'climb the rocks',
+        'go up the tree', 'get to higher ground', 'climb onto the branch', 'climb higher',
+        'pull myself up', 'scramble up the slope', 'reach the top of the tree',
+    ],
+    'shouting': [
+        'shout for help', 'scream', 'yell', 'call for help', 'shout hello', 'call out',
+        'scream as loud as i can', 'yell for rescue', 'cry for help', 'holler', 'shout',
+        'call my friends', 'is anyone there', 'hello?',
+    ],
+    'darkness': [
+        'step into the shadows', 'face the darkness', 'hide in the dark', 'walk into the darkness',
+        'chase the shadow', 'touch the shadow', 'wait for the darkness to pass', 'stare into the dark',
+        'embrace the dark', 'follow the shadows',
+    ],
+    'signal': [
+        'wave my arms', 'send a signal', 'wave a flag', 'signal for help', 'make an sos',
+        'flash my light at the sky', 'wave at the helicopter', 'build a signal fire', 'use a mirror to signal',
+        'write sos on the ground', 'raise a flag',
+    ],
+    'other': [
+        'eat the mushroom', 'talk to the owl', 'what is this place', 'who are you', 'taste the water',
+        'drink from the stream', 'smell the flowers', 'count the trees', 'check my phone',
+        'tie my shoes', 'read the sign', 'open the door', 'knock on the tree', 'pet the fox',
+        'ask the crow for directions', 'cut my hair', 'write in my journal', 'play the harmonica',
+    ],
+}
+
+DIMENSIONS = 1 << 12
+_MASK = DIMENSIONS - 1
+_WORDS = re.compile(r"[a-z0-9']+")
+
+def features(text):
+    """Hashed feature indexes: words, word pairs and character trigrams"""
+
+    words = _WORDS.findall(text.lower())
+    grams = ['w ' + word for word in words]
+    grams += [f'b {first} {second}' for first, second in zip(words, words[1:])]
+    for word in words:
+        padded = f'<{word}>'
+        grams += [padded[start:start + 3] for start in range(len(padded) - 2)]
+    # crc32, not hash(): indexes must match across processes and runs
+    return [crc32(gram.encode()) & _MASK for gram in grams]
+
+def label_commands(commands):
+    """Label recorded commands by keyword when that gives exactly one intent"""
+
+    import keywords
+
+    labelled = []
+    for command in commands:
+        intents = {KEYWORD_INTENTS[category] for category in keywords.classify(command) if category in KEYWORD_INTENTS}
+        if any(category.startswith('solution_') for category in keywords.classify(command)):
+            intents.add('creative')
+        if len(intents) == 1:
+            labelled.append((command, intents.pop()))
+    return labelled
+
+def seed_examples():
+    return [(command, intent) for intent, commands in SEED_COMMANDS.items() for command in commands]
+
+class IntentClassifier:
+    """Softmax regression over hashed n-grams
+
+    Each command's feature counts are scaled by 1/sqrt(number of n-grams),
+    so long and short commands produce logits on the same scale.
+    """
+
+    def __init__(self, weights=None, bias=None, labels=INTENTS):
+        self.labels = list(labels)
+        self.weights = weights if weights is not None else np.zeros((DIMENSIONS, len(self.labels)), np.float32)
+        self.bias = bias if bias is not None else np.zeros(len(self.labels), np.float32)
+
+    def predict(self, text):
+        """Return ``(intent, confidence)`` for one command"""
+
+        indexes = features(text)
+        if not indexes:
+            return 'other', 1.0
+        logits = self.weights.take(indexes, axis=0).sum(axis=0)
+        logits *= len(indexes) ** -0.5
+        logits += self.bias
+        best = int(logits.argmax())
+        # Softmax probability of the best label alone
+        return self.labels[best], float(1.0 / np.exp(logits - logits[best]).sum())
+
+    def predict_batch(self, texts):
+        """Score many commands at once; returns ``(intents, confidences)``"""
+
+        probabilities = self.probabilities(texts)
+        best = probabilities.argmax(axis=1)
+        return [self.labels[index] for index in best], probabilities[np.arange(len(texts)), best]
+
+    def probabilities(self, texts):
+        rows = [features(text) for text in texts]
+        empty = np.fromiter((not row for row in rows), bool, len(rows))
+        # A placeholder index keeps reduceat's segments non-empty; zeroed below
+        rows = [row or [0] for row in rows]
+        lengths = np.fromiter((len(row) for row in rows), np.int64, len(rows))
+        flat = np.fromiter((index for row in rows for index in row), np.int64, int(lengths.sum()))
+        offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        logits = np.add.reduceat(self.weights[flat], offsets, axis=0)
+        logits[empty] = 0.0
+        logits = logits * (lengths ** -0.5)[:, None] + self.bias
+        logits = np.exp(logits - logits.max(axis=1, keepdims=True))
+        return logits / logits.sum(axis=1, keepdims=True)
+
+    def fit(self, examples, epochs=150, learning_rate=0.5, l2=1e-4):
+        """Train on ``(command, intent)`` pairs with full-batch Adam"""
+
+        index = {label: position for position, label in enumerate(self.labels)}
+        samples = [(features(command), index[intent]) for command, intent in examples]
+        samples = [(indexes, label) for indexes, label in samples if indexes]
+
+        x = np.zeros((len(samples), DIMENSIONS), np.float32)
+        for row, (indexes, _) in enumerate(samples):
+            np.add.at(x[row], indexes, len(indexes) ** -0.5)
+        y = np.zeros((len(samples), len(self.labels)), np.float32)
+        y[np.arange(len(samples)), [label for _, label in samples]] = 1.0
+
+        # Only the features that occur can have non-zero weights
+        used = np.flatnonzero(x.any(axis=0))
+        x = x[:, used]
+        weights = np.zeros((len(used), len(self.labels)), np.float32)
+        bias = np.zeros(len(self.labels), np.float32)
+        moments = [np.zeros_like(weights), np.zeros_like(weights), np.zeros_like(bias), np.zeros_like(bias)]
+        for step in range(1, epochs + 1):
+            logits = x @ weights + bias
+            logits = np.exp(logits - logits.max(axis=1, keepdims=True))
+            error = (logits / logits.sum(axis=1, keepdims=True) - y) / len(samples)
+            gradients = (x.T @ error + l2 * weights, error.sum(axis=0))
+            for parameter, gradient, first, second in zip((weights, bias), gradients, moments[::2], moments[1::2]):
+                first *= 0.9
+                first += 0.1 * gradient
+                second *= 0.999
+                second += 0.001 * gradient * gradient
+                parameter -= learning_rate * (first / (1 - 0.9 ** step)) / (np.sqrt(second / (1 - 0.999 ** step)) + 1e-8)
+
+        self.weights = np.zeros((DIMENSIONS, len(self.labels)), np.float32)
+        self.weights[used] = weights
+        self.bias = bias
+        return self
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(str(path)) or '.', exist_ok=True)
+        tmp = f'{path}.{os.getpid()}.tmp.npz'
+        np.savez_compressed(tmp, weights=self.weights, bias=self.bias, labels=np.array(self.labels))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            if data['weights'].shape[0] != DIMENSIONS:
+                raise ValueError(f"{path} was trained with different features")
+            return cls(data['weights'], data['bias'], [str(label) for label in data['labels']])
+
+_default = None
+_default_lock = threading.Lock()
+
+def load_or_train(path):
+    """The saved model at ``path``, or one trained on the seed commands
+
+    Training on the seeds takes a fraction of a second and gives the same
+    model in every worker; ``python intent.py train`` adds the transcripts.
+    """
+
+    global _default
+    with _default_lock:
+        if _default is None:
+            try:
+                _default = IntentClassifier.load(path)
+            except FileNotFoundError:
+                _default = IntentClassifier().fit(seed_examples())
+            except Exception as e:
+                logger.warning("Could not load intent model %s: %s", path, e)
+                _default = IntentClassifier().fit(seed_examples())
+        return _default
+
+def cross_validate(examples, threshold, local_intents, folds=5):
+    """Accuracy, plus how often a local answer would have been right"""
+
+    examples = sorted(examples, key=lambda example: crc32(example[0].encode()))
+    correct = routed = routed_correct = 0
+    for fold in range(folds):
+        train = [example for position, example in enumerate(examples) if position % folds != fold]
+        test = [example for position, example in enumerate(examples) if position % folds == fold]
+        model = IntentClassifier().fit(train)
+        predicted, confidence = model.predict_batch([command for command, _ in test])
+        for (command, actual), intent, score in zip(test, predicted, confidence):
+            correct += intent == actual
+            if intent in local_intents and score >= threshold:
+                routed += 1
+                routed_correct += intent == actual
+    return {
+        'examples': len(examples),
+        'accuracy': round(correct / len(examples), 3),
+        'routed_locally': routed,
+        'routing_precision': round(routed_correct / routed, 3) if routed else None,
+    }
+
+if __name__ == '__main__':
+    import json
+    import sys
+    import django
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
+    django.setup()
+
+    from django.conf import settings
+    from transcripts import TranscriptStore
+
+    def examples():
+        store = TranscriptStore(settings.TRANSCRIPTS_PATH)
+        recorded = store.commands()
+        labelled = label_commands(recorded)
+        print(f"{len(labelled)} of {len(recorded)} recorded commands labelled by keyword", file=sys.stderr)
+        return seed_examples() + labelled
+
+    command, args = (sys.argv[1], sys.argv[2:]) if len(sys.argv) > 1 else ('classify', [])
+    if command == 'train':
+        started = time.perf_counter()
+        model = IntentClassifier().fit(examples())
+        model.save(settings.INTENT_MODEL_PATH)
+        print(f"Saved {settings.INTENT_MODEL_PATH} ({time.perf_counter() - started:.2f}s)")
+    elif command == 'eval':
+        threshold = float(args[0]) if args else settings.INTENT_BYPASS_THRESHOLD
+        print(json.dumps(cross_validate(examples(), threshold, settings.INTENT_LOCAL_INTENTS), indent=2))
+    else:
+        model = load_or_train(settings.INTENT_MODEL_PATH)
+        intents, confidences = model.predict_batch(args)
+        for text, intent, confidence in zip(args, intents, confidences):
+            print(f"{confidence:5.2f}  {intent:10s} {text}")
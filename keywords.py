@@ -0,0 +1,170 @@
+"""
+Keyword vocabularies for Wonder of U - every word list the game reacts to
+All categories are compiled once into a single matcher, so classifying a
+command or AI response is one pass over the text instead of a scan per word
+"""
+import re
+from functools import lru_cache
+
+# Category name -> phrases. Matching is case-insensitive substring matching,
+# exactly like the ``phrase in text.lower()`` checks it replaces.
+VOCABULARIES = {
+    # Direct escape attempts (counted against the player)
+    'escape': ['leave', 'exit', 'escape', 'way out', 'get out'],
+    'return_home': ['go home', 'return'],
+
+    # Creative/unexpected solution keywords in user input
+    'creative': [
+        'mirror', 'reflection', 'backwards', 'reverse', 'opposite',
+        'dance', 'sing', 'laugh', 'joke', 'riddle', 'poem',
+        'meditate', 'sleep', 'dream', 'imagine', 'pretend',
+        'befriend', 'thank', 'apologize', 'forgive', 'love',
+        'plant', 'grow', 'nurture', 'heal', 'help',
+        'memory', 'forget', 'remember', 'story', 'truth'
+    ],
+
+    # Victory indicators in AI response
+    'victory_phrase': [
+        'you succeed', 'you escape', 'you break free', 'you outsmart',
+        'the forest yields', 'you find a way', 'you discover',
+        'brilliant', 'clever', 'unexpected', 'creative solution',
+        'the spirit is impressed', 'even the forest', 'you win'
+    ],
+
+    # Action categories for fallback responses
+    'fire': ['fire', 'burn', 'flame', 'smoke'],
+    'weapon': ['gun', 'shoot', 'weapon', 'pistol'],
+    'movement': ['north', 'south', 'east', 'west', 'walk', 'go', 'move'],
+    'climbing': ['climb', 'tree', 'up'],
+    'shouting': ['shout', 'scream', 'yell', 'call', 'help'],
+    'darkness': ['shadow', 'darkness', 'dark'],
+    'signal': ['signal', 'flag', 'wave'],
+
+    # Creative solutions that can win the game outright
+    # Psychological/philosophical approaches
+    'solution_acceptance': ['embrace the forest', 'accept being lost', 'become one with forest'],
+    'solution_gratitude': ['thank the forest', 'appreciate the forest', 'respect the forest'],
+    'solution_dialogue': ['ask forest what it wants', 'communicate with forest', 'talk to forest'],
+    # Meta-gaming approaches
+    'solution_visualize': ['close my eyes and think of home', 'meditate on home', 'visualize escape'],
+    'solution_refusal': ['refuse to play the game', 'ignore the forest', 'pretend forest isn\'t real'],
+    # Reverse psychology
+    'solution_staying': ['decide to stay forever', 'make this my home', 'never want to leave'],
+    'solution_nurture': ['plant a tree', 'help the forest grow', 'nurture the forest'],
+    # Unexpected creative actions
+    'solution_performance': ['sing to the forest', 'dance with the trees', 'tell forest a story'],
+    'solution_humility': ['apologize for intruding', 'ask for forgiveness', 'show humility'],
+
+    # Inventory interactions
+    'item_search': ['search', 'look for'],
+    'item_pocket': ['pocket'],
+    'item_ground': ['ground', 'branch'],
+    'use_flashlight': ['use flashlight'],
+}
+
+# Fallback action categories, in the order they take precedence
+FALLBACK_CATEGORIES = ['fire', 'weapon', 'movement', 'climbing', 'shouting', 'darkness', 'signal']
+
+# Winning solution groups, in the order they are counted
+SOLUTION_CATEGORIES = [category for category in VOCABULARIES if category.startswith('solution_')]
+
+class KeywordMatcher:
+    """Multi-pattern matcher that finds every category in a single pass
+
+    The phrases are merged into one trie-shaped regex, so each search reports
+    the longest phrase starting at the first position where any phrase
+    matches. Any shorter phrase matching at that same position is
+    necessarily a prefix of it, so each phrase carries the categories of its
+    registered prefixes too; resuming one character after each match start
+    then reproduces plain substring semantics, overlaps included.
+    """
+
+    def __init__(self, vocabularies):
+        phrase_categories = {}
+        for category, phrases in vocabularies.items():
+            for phrase in phrases:
+                phrase_categories.setdefault(phrase.lower(), set()).add(category)
+
+        self._categories = {}
+        for phrase in phrase_categories:
+            categories = set()
+            for end in range(1, len(phrase) + 1):
+                categories |= phrase_categories.get(phrase[:end], set())
+            self._categories[phrase] = frozenset(categories)
+
+        self._pattern = re.compile(_trie_pattern(phrase_categories))
+
+    def classify(self, text):
+        """Return the frozenset of every category whose phrases occur in text"""
+
+        text = text.lower()
+        search = self._pattern.search
+        table = self._categories
+
+        match = search(text)
+        if match is None:
+            return frozenset()
+
+        categories = table[match.group()]
+        match = search(text, match.start() + 1)
+        while match is not None:
+            categories = categories | table[match.group()]
+            match = search(text, match.start() + 1)
+        return categories
+
+def _trie_pattern(phrases):
+    """Build a regex matching any of the phrases, longest alternative first"""
+
+    trie = {}
+    for phrase in phrases:
+        node = trie
+        for char in phrase:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        if '' in node:
+            # Greedy optional: the longer phrase wins when both match
+            return '(?:%s)?' % '|'.join(branches)
+        if len(branches) == 1:
+            return branches[0]
+        return '(?:%s)' % '|'.join(branches)
+
+    return build(trie)
+
+matcher = KeywordMatcher(VOCABULARIES)
+
+# A turn classifies the same command from several places (victory checks,
+# items, escape counting, fallback); memoizing makes that a single scan.
+# Short texts go through an LRU; only the most recent long text is kept so
+# oversized input can't pin memory.
+MEMO_MAX_LENGTH = 256
+
+_classify_memo = lru_cache(maxsize=1024)(matcher.classify)
+_last_long = (None, frozenset())
+
+def classify(text):
+    """Classify a command or AI response against every vocabulary at once"""
+
+    global _last_long
+
+    if len(text) <= MEMO_MAX_LENGTH:
+        return _classify_memo(text)
+
+    last_text, last_categories = _last_long
+    if text == last_text:
+        return last_categories
+
+    categories = matcher.classify(text)
+    _last_long = (text, categories)
+    return categories
+
+def clear_memo():
+    """Forget memoized classifications (used by benchmarks)"""
+
+    global _last_long
+    _classify_memo.cache_clear()
+    _last_long = (None, frozenset())
@@ -0,0 +1,120 @@
+"""
+LLM backends for Wonder of U
+Everything that differs between chat-completions providers - endpoint,
+model, auth and wire format - lives here, so MistralAI can talk to the real
+API or to the bundled stand-in server (standin_server.py) unchanged
+"""
+import json
+
+class ChatBackend:
+    """An OpenAI-compatible chat completions endpoint
+
+    Subclasses set the defaults; ``base_url``, ``model`` and ``max_tokens``
+    can be overridden per deployment (LLM_BASE_URL / LLM_MODEL, or per
+    endpoint in LLM_ENDPOINTS).
+    """
+
+    name = None
+    default_url = None
+    default_model = None
+    requires_api_key = True
+
+    def __init__(self, base_url=None, model=None, api_key=None, max_tokens=80):
+        self.url = base_url or self.default_url
+        self.model = model or self.default_model
+        self.api_key = api_key
+        self.max_tokens = max_tokens
+
+    @property
+    def available(self):
+        """False when the backend cannot be called (e.g. no API key)"""
+
+        return bool(self.api_key) or not self.requires_api_key
+
+    def headers(self):
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        return headers
+
+    def payload(self, system_prompt, user_prompt, stream=False):
+        """Build the chat completions request body"""
+
+        payload = {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            "temperature": 0.7,
+            "max_tokens": self.max_tokens,
+            "top_p": 0.9
+        }
+        if stream:
+            payload["stream"] = True
+        return payload
+
+    def parse_completion(self, data):
+        """Extract the response text from a (non-streaming) completion"""
+
+        return data['choices'][0]['message']['content'].strip()
+
+    def parse_usage(self, data):
+        """Return ``(prompt_tokens, completion_tokens)``, or None if not reported"""
+
+        usage = data.get('usage')
+        if not usage:
+            return None
+        return usage.get('prompt_tokens', 0), usage.get('completion_tokens', 0)
+
+    def parse_stream_line(self, line):
+        """Parse one SSE line; returns ``(finished, token_or_None, usage_or_None)``
+
+        Usage is reported once, typically on the final chunk.
+        """
+
+        if not line or not line.startswith('data:'):
+            return False, None, None
+
+        data = line[len('data:'):].strip()
+        if data == '[DONE]':
+            return True, None, None
+
+        chunk = json.loads(data)
+        usage = self.parse_usage(chunk)
+        choices = chunk.get('choices') or []
+        if not choices:
+            return False, None, usage
+
+        return False, (choices[0].get('delta') or {}).get('content'), usage
+
+class MistralBackend(ChatBackend):
+    """The hosted Mistral API"""
+
+    name = 'mistral'
+    default_url = "https://api.mistral.ai/v1/chat/completions"
+    # Updated model name for 2025
+    default_model = "mistral-small-latest"  # Use latest stable model
+
+class StandInBackend(ChatBackend):
+    """The local stand-in server (``python standin_server.py``)
+
+    Speaks the same protocol with configurable latency and failures, for
+    offline development, benchmarks and load tests. Needs no API key.
+    """
+
+    name = 'standin'
+    default_url = "http://127.0.0.1:8088/v1/chat/completions"
+    default_model = "forest-standin"
+    requires_api_key = False
+
+BACKENDS = {backend.name: backend for backend in (MistralBackend, StandInBackend)}
+
+def get_backend(name, base_url=None, model=None, api_key=None, max_tokens=80):
+    """Instantiate the backend registered under ``name``"""
+
+    try:
+        backend_class = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown LLM_BACKEND {name!r}; choose one of: {', '.join(BACKENDS)}")
+    return backend_class(base_url=base_url, model=model, api_key=api_key, max_tokens=max_tokens)
@@ -0,0 +1,237 @@
+"""
+Upstream routing for Wonder of U
+Several chat-completions endpoints (API keys, model tiers or base URLs)
+behind one MistralAI. Each endpoint has its own circuit breaker, request
+rate limit and live latency and error figures, and each call goes to the
+endpoint expected to answer fastest. Under pressure calls move to the
+cheaper, faster economy tier.
+"""
+import random
+import threading
+import time
+
+from llm_backends import get_backend
+from resilience import CircuitBreaker
+
+# Standard endpoints answer by default, economy ones under pressure
+TIERS = ('standard', 'economy')
+
+class LocalLimiter:
+    """In-process token buckets, for routers without a host-wide limiter"""
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, key, rate, burst):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            if tokens < 1:
+                return False
+            self._buckets[key] = (tokens - 1, now)
+            return True
+
+class Endpoint:
+    """One backend with its own health, limits and latency figures
+
+    ``rate`` and ``burst`` are the provider's request limit for this key
+    (0 for none). ``max_concurrent`` caps this process's calls in flight
+    (0 for no cap). Latency and error rate are exponentially weighted
+    averages; latency is kept separately for full completions and for time
+    to first token of a stream.
+    """
+
+    def __init__(self, name, backend, tier='standard', rate=0.0, burst=10, max_concurrent=0,
+                 failure_threshold=5, reset_timeout=30.0, smoothing=0.2):
+        if tier not in TIERS:
+            raise ValueError(f"Unknown tier {tier!r} for endpoint {name}; choose one of: {', '.join(TIERS)}")
+        self.name = name
+        self.backend = backend
+        self.tier = tier
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrent = max_concurrent
+        self.smoothing = smoothing
+        self.breaker = CircuitBreaker(failure_threshold=failure_threshold, reset_timeout=reset_timeout)
+
+        self.in_flight = 0
+        self.latency = {}
+        self.error_rate = 0.0
+        self.stats = {'calls': 0, 'errors': 0, 'rate_limited': 0}
+        self._lock = threading.Lock()
+
+    @property
+    def label(self):
+        return f"{self.backend.name}:{self.backend.model}"
+
+    def expected_latency(self, kind):
+        """Seconds a call is expected to take, or None before the first one
+
+        The average latency, stretched by the calls already in flight and
+        by the chance of an error (which costs a retry or a fallback).
+        """
+
+        with self._lock:
+            latency = self.latency.get(kind)
+            if latency is None:
+                return None
+            return latency * (1 + self.in_flight) / max(0.05, 1 - self.error_rate)
+
+    def record_success(self, kind, seconds):
+        with self._lock:
+            previous = self.latency.get(kind)
+            self.latency[kind] = seconds if previous is None else previous + self.smoothing * (seconds - previous)
+            self.error_rate -= self.smoothing * self.error_rate
+        self.breaker.record_success()
+
+    def record_failure(self, retry_after=None, rate_limited=False):
+        with self._lock:
+            self.error_rate += self.smoothing * (1 - self.error_rate)
+            self.stats['errors'] += 1
+            if rate_limited:
+                self.stats['rate_limited'] += 1
+        self.breaker.record_failure(retry_after=retry_after)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'name': self.name,
+                'backend': self.label,
+                'tier': self.tier,
+                'in_flight': self.in_flight,
+                'latency': dict(self.latency),
+                'error_rate': round(self.error_rate, 3),
+                'circuit': self.breaker.snapshot(),
+                **self.stats,
+            }
+
+class Router:
+    """Picks the endpoint for each upstream call
+
+    ``acquire`` returns the usable endpoint with the lowest expected latency
+    in the preferred tier, or in the other tier when none is usable, and
+    counts it as in flight until ``release``. An endpoint is usable when its
+    breaker lets a call through, it is below ``max_concurrent`` and its rate
+    limit (checked with ``limiter``, host-wide when given one) has a token
+    left. Endpoints without a latency figure yet are tried first, and
+    ``explore`` of the calls go to a random usable endpoint so the figures
+    of slow endpoints stay current.
+
+    The economy tier is preferred when the caller says it is under pressure
+    (e.g. it had to queue for admission) or the best standard endpoint is
+    expected to take longer than ``slow_after`` seconds.
+    """
+
+    def __init__(self, endpoints, limiter=None, slow_after=2.5, explore=0.05):
+        self.endpoints = list(endpoints)
+        self.limiter = limiter or LocalLimiter()
+        self.slow_after = slow_after
+        self.explore = explore
+        self._lock = threading.Lock()
+
+    @property
+    def primary(self):
+        return self.endpoints[0] if self.endpoints else None
+
+    def available(self):
+        """True if some endpoint's breaker would let a call through"""
+
+        return any(endpoint.breaker.ready() for endpoint in self.endpoints)
+
+    def healthy(self):
+        """True if some endpoint's breaker is closed"""
+
+        return any(endpoint.breaker.state == CircuitBreaker.CLOSED for endpoint in self.endpoints)
+
+    def under_pressure(self, kind='complete'):
+        """True when the standard tier is expected to be slower than ``slow_after``"""
+
+        expected = [endpoint.expected_latency(kind) for endpoint in self.endpoints
+                    if endpoint.tier == 'standard' and endpoint.breaker.ready()]
+        expected = [seconds for seconds in expected if seconds is not None]
+        return bool(expected) and min(expected) > self.slow_after
+
+    def acquire(self, kind='complete', pressure=False):
+        """Take the best usable endpoint for a call, or None if there is none"""
+
+        preferred = 'economy' if pressure or self.under_pressure(kind) else 'standard'
+        for tier in sorted(TIERS, key=lambda tier: tier != preferred):
+            for endpoint in self._ranked(tier, kind):
+                if self._take(endpoint):
+                    return endpoint
+        return None
+
+    def release(self, endpoint):
+        if endpoint is not None:
+            with self._lock:
+                endpoint.in_flight -= 1
+
+    def _ranked(self, tier, kind):
+        candidates = [endpoint for endpoint in self.endpoints
+                      if endpoint.tier == tier and endpoint.breaker.ready()]
+        if len(candidates) > 1 and random.random() < self.explore:
+            random.shuffle(candidates)
+            return candidates
+
+        def expected(endpoint):
+            seconds = endpoint.expected_latency(kind)
+            return -1.0 if seconds is None else seconds
+
+        return sorted(candidates, key=expected)
+
+    def _take(self, endpoint):
+        with self._lock:
+            if endpoint.max_concurrent and endpoint.in_flight >= endpoint.max_concurrent:
+                return False
+            endpoint.in_flight += 1
+        try:
+            taken = endpoint.rate <= 0 or self.limiter(f'endpoint:{endpoint.name}', endpoint.rate, endpoint.burst)
+        except Exception:
+            # A failing limiter must not take the upstream down with it
+            taken = True
+        if taken and endpoint.breaker.allow():
+            endpoint.stats['calls'] += 1
+            return True
+        self.release(endpoint)
+        return False
+
+    def snapshot(self):
+        return {
+            'slow_after': self.slow_after,
+            'under_pressure': self.under_pressure(),
+            'endpoints': [endpoint.snapshot() for endpoint in self.endpoints],
+        }
+
+def build_endpoints(specs, api_key=None, failure_threshold=5, reset_timeout=30.0):
+    """Endpoints from LLM_ENDPOINTS-style dicts, skipping unusable ones
+
+    Each spec needs a ``backend`` ('mistral' or 'standin') and may set
+    ``name``, ``base_url``, ``model``, ``api_key`` (defaults to ``api_key``),
+    ``max_tokens``, ``tier``, ``rate``, ``burst`` and ``max_concurrent``.
+    Endpoints that cannot be called (no API key) are left out.
+    """
+
+    endpoints = []
+    for number, spec in enumerate(specs, 1):
+        backend = get_backend(
+            spec.get('backend', 'mistral'),
+            base_url=spec.get('base_url'),
+            model=spec.get('model'),
+            api_key=spec.get('api_key', api_key),
+            max_tokens=int(spec.get('max_tokens', 80)),
+        )
+        if not backend.available:
+            continue
+        endpoints.append(Endpoint(
+            spec.get('name') or f"{backend.name}-{number}",
+            backend,
+            tier=spec.get('tier', 'standard'),
+            rate=float(spec.get('rate', 0)),
+            burst=int(spec.get('burst', 10)),
+            max_concurrent=int(spec.get('max_concurrent', 0)),
+            failure_threshold=failure_threshold,
+            reset_timeout=reset_timeout,
+        ))
+    return endpoints
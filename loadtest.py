@@ -0,0 +1,410 @@
+#!/usr/bin/env python
+"""
+End-to-end load test for Wonder of U
+Boots the real app under gunicorn (WSGI threads or ASGI/uvicorn workers)
+against the local stand-in LLM server, drives concurrent simulated players
+through index and process-input with real session cookies and CSRF tokens,
+and reports latency percentiles, throughput and error rates per worker
+configuration. Results are saved as JSON so runs on different commits can
+be compared.
+
+    python loadtest.py run --configs wsgi:2x8,asgi:2 --players 10,50,100
+    python loadtest.py compare loadtest-results/before.json loadtest-results/after.json
+
+Worker configurations are ``wsgi:<workers>x<threads>`` or ``asgi:<workers>``.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+import requests
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Scripted players: exploring, brute-forcing the exit (reaches game over),
+# creative (tends to win) and a mix. Each ends early on game over.
+TRANSCRIPTS = [
+    ['look around', 'search my pocket', 'use flashlight', 'go north', 'climb tree',
+     'find the exit', 'shout for help', 'escape the forest'],
+    ['escape the forest', 'run away', 'get out', 'find the exit', 'leave', 'go home',
+     'walk west', 'return to the road', 'find a way out', 'exit', 'escape'],
+    ['listen to the wind', 'thank the forest', 'sing to the forest', 'plant a tree',
+     'apologize for intruding'],
+    ['search the ground for a branch', 'light a fire', 'wave a flag', 'walk east',
+     'meditate', 'dance with the trees'],
+]
+
+CONFIG_PATTERN = re.compile(r'^(wsgi|asgi):(\d+)(?:x(\d+))?$')
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def wait_for(url, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(url, timeout=2).status_code < 500:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+
+def git_revision():
+    def git(*args):
+        return subprocess.run(['git', *args], cwd=BASE_DIR, capture_output=True, text=True).stdout.strip()
+    return {'commit': git('rev-parse', 'HEAD') or None, 'dirty': bool(git('status', '--porcelain', '--untracked-files=no'))}
+
+def server_command(config, port):
+    """gunicorn command line for a worker configuration string"""
+
+    match = CONFIG_PATTERN.match(config)
+    if not match:
+        raise ValueError(f"Bad worker configuration {config!r}; use wsgi:<workers>x<threads> or asgi:<workers>")
+    kind, workers, threads = match.group(1), match.group(2), match.group(3) or '1'
+
+    command = [sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}',
+               '--workers', workers, '--timeout', '120', '--log-level', 'warning']
+    if kind == 'wsgi':
+        command += ['--threads', threads, 'wsgi:application']
+    else:
+        command += ['-k', 'uvicorn_worker.UvicornWorker', 'asgi:application']
+    return command
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def summarize(latencies):
+    values = sorted(latencies)
+    return {
+        'count': len(values),
+        'mean': sum(values) / len(values) if values else None,
+        'p50': percentile(values, 50),
+        'p95': percentile(values, 95),
+        'p99': percentile(values, 99),
+        'max': values[-1] if values else None,
+    }
+
+class Recorder:
+    """Thread-safe collection of request outcomes inside the measured window"""
+
+    OUTCOMES = ('ok', 'processing', 'app_error', 'http_error', 'exception')
+
+    def __init__(self, measure_from):
+        self.measure_from = measure_from
+        self.samples = []
+        self._lock = threading.Lock()
+
+    def add(self, endpoint, started, latency, outcome, first_byte=None):
+        if started < self.measure_from:
+            return
+        with self._lock:
+            self.samples.append((endpoint, latency, outcome, first_byte))
+
+class Player(threading.Thread):
+    """One simulated player replaying scripted transcripts until the deadline"""
+
+    def __init__(self, index, base_url, recorder, deadline, think_time, stream, seed):
+        super().__init__(name=f'player-{index}', daemon=True)
+        self.base_url = base_url
+        self.recorder = recorder
+        self.deadline = deadline
+        self.think_time = think_time
+        self.stream = stream
+        self.rng = random.Random(seed + index)
+
+    def run(self):
+        while time.monotonic() < self.deadline:
+            self.play_game(self.rng.choice(TRANSCRIPTS))
+
+    def play_game(self, transcript):
+        session = requests.Session()
+        started = time.monotonic()
+        try:
+            response = session.get(self.base_url + '/', timeout=60)
+            outcome = 'ok' if response.status_code == 200 else 'http_error'
+        except requests.RequestException:
+            outcome = 'exception'
+        self.recorder.add('index', started, time.monotonic() - started, outcome)
+        if outcome != 'ok':
+            time.sleep(0.5)
+            return
+
+        token = session.cookies.get('csrftoken', '')
+        path = '/process-input/stream/' if self.stream else '/process-input/'
+
+        for command in transcript:
+            if time.monotonic() >= self.deadline:
+                return
+            started = time.monotonic()
+            first_byte = None
+            data = {}
+            try:
+                response = session.post(
+                    self.base_url + path,
+                    data={'user_input': command, 'csrfmiddlewaretoken': token},
+                    headers={'X-CSRFToken': token, 'Referer': self.base_url + '/'},
+                    stream=self.stream,
+                    timeout=120,
+                )
+                if response.status_code != 200:
+                    outcome = 'http_error'
+                else:
+                    if self.stream and response.headers.get('Content-Type', '').startswith('text/event-stream'):
+                        data, first_byte = self.read_events(response, started)
+                    else:
+                        data = response.json()
+                    if data.get('processing'):
+                        outcome = 'processing'
+                    elif data.get('success'):
+                        outcome = 'ok'
+                    else:
+                        outcome = 'app_error'
+            except (requests.RequestException, ValueError):
+                outcome = 'exception'
+            self.recorder.add('turn', started, time.monotonic() - started, outcome, first_byte)
+
+            if outcome in ('http_error', 'exception') or data.get('game_over'):
+                return
+            time.sleep(self.think_time * self.rng.uniform(0.5, 1.5))
+
+    def read_events(self, response, started):
+        """Return the ``done`` payload and the time to the first event"""
+
+        first_byte = None
+        event = None
+        for line in response.iter_lines(decode_unicode=True):
+            if first_byte is None and line:
+                first_byte = time.monotonic() - started
+            if line.startswith('event:'):
+                event = line[len('event:'):].strip()
+            elif line.startswith('data:') and event == 'done':
+                return json.loads(line[len('data:'):]), first_byte
+        return {}, first_byte
+
+def run_load(base_url, players, duration, warmup, think_time, stream, seed):
+    """Drive ``players`` concurrent players; returns the summary for this step"""
+
+    start = time.monotonic()
+    recorder = Recorder(measure_from=start + warmup)
+    deadline = start + warmup + duration
+    threads = [Player(index, base_url, recorder, deadline, think_time, stream, seed) for index in range(players)]
+    for thread in threads:
+        thread.start()
+        # Ramp up over the first second rather than a thundering herd
+        time.sleep(min(1.0 / players, 0.05))
+    for thread in threads:
+        thread.join(120)
+
+    window = time.monotonic() - recorder.measure_from
+    result = {'players': players, 'window': window, 'endpoints': {}}
+    total = 0
+    errors = 0
+    for endpoint in ('index', 'turn'):
+        samples = [sample for sample in recorder.samples if sample[0] == endpoint]
+        outcomes = {outcome: 0 for outcome in Recorder.OUTCOMES}
+        for sample in samples:
+            outcomes[sample[2]] += 1
+        summary = summarize([sample[1] for sample in samples if sample[2] == 'ok'])
+        summary['outcomes'] = outcomes
+        summary['rps'] = len(samples) / window if window > 0 else 0.0
+        summary['error_rate'] = (len(samples) - outcomes['ok']) / len(samples) if samples else 0.0
+        first_bytes = [sample[3] for sample in samples if sample[3] is not None]
+        if first_bytes:
+            summary['first_byte'] = summarize(first_bytes)
+        result['endpoints'][endpoint] = summary
+        total += len(samples)
+        errors += len(samples) - outcomes['ok']
+
+    result['rps'] = total / window if window > 0 else 0.0
+    result['error_rate'] = errors / total if total else 0.0
+    return result
+
+def start_process(command, env, log_path):
+    log = open(log_path, 'w')
+    return subprocess.Popen(command, cwd=BASE_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+def stop_process(process):
+    process.terminate()
+    try:
+        process.wait(15)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+def run(args):
+    configs = [config.strip() for config in args.configs.split(',') if config.strip()]
+    player_steps = [int(players) for players in args.players.split(',')]
+    for config in configs:
+        server_command(config, 0)
+
+    workdir = tempfile.mkdtemp(prefix='wonderofu-loadtest-')
+    standin_port = free_port()
+    standin = start_process([
+        sys.executable, os.path.join(BASE_DIR, 'standin_server.py'),
+        '--port', str(standin_port),
+        '--latency-median', str(args.latency_median),
+        '--latency-p95', str(args.latency_p95),
+        '--tokens-per-second', str(args.tokens_per_second),
+        '--error-rate', str(args.error_rate),
+        '--rate-limit-rate', str(args.rate_limit_rate),
+        '--seed', str(args.seed),
+    ], dict(os.environ), os.path.join(workdir, 'standin.log'))
+
+    report = {
+        'version': 1,
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        **git_revision(),
+        'host': {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count()},
+        'parameters': {key: value for key, value in vars(args).items() if key != 'func'},
+        'runs': [],
+    }
+
+    try:
+        wait_for(f'http://127.0.0.1:{standin_port}/health')
+
+        for config in configs:
+            port = free_port()
+            env = dict(
+                os.environ,
+                DJANGO_SETTINGS_MODULE='settings',
+                LLM_BACKEND='standin',
+                LLM_BASE_URL=f'http://127.0.0.1:{standin_port}/v1/chat/completions',
+                RUNTIME_DIR=os.path.join(workdir, config.replace(':', '-')),
+                RESPONSE_CACHE_ENABLED='True' if args.cache else 'False',
+                DEBUG='False',
+            )
+            server = start_process(server_command(config, port), env,
+                                   os.path.join(workdir, f"{config.replace(':', '-')}.log"))
+            base_url = f'http://127.0.0.1:{port}'
+            try:
+                wait_for(base_url + '/')
+                for players in player_steps:
+                    print(f"{config}: {players} players for {args.duration:g}s ...", flush=True)
+                    result = run_load(base_url, players, args.duration, args.warmup,
+                                      args.think_time, args.stream, args.seed)
+                    result['config'] = config
+                    report['runs'].append(result)
+                    print_run(result)
+            finally:
+                stop_process(server)
+    finally:
+        stop_process(standin)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)) or '.', exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to {args.output} (server logs in {workdir})")
+
+def _ms(value):
+    return f"{value * 1000:8.0f}" if value is not None else f"{'-':>8}"
+
+def print_run(result):
+    print(f"  {'endpoint':<8}{'count':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req/s':>8}{'errors':>8}")
+    for endpoint, summary in result['endpoints'].items():
+        print(f"  {endpoint:<8}{summary['outcomes']['ok']:>7}{_ms(summary['p50'])} {_ms(summary['p95'])} "
+              f"{_ms(summary['p99'])}{summary['rps']:>8.1f}{summary['error_rate']:>8.1%}")
+
+def compare(args):
+    """Compare two result files; exits non-zero if the threshold is exceeded"""
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+
+    def index(report):
+        return {(run['config'], run['players']): run for run in report['runs']}
+
+    before, after = index(baseline), index(current)
+    print(f"baseline {str(baseline.get('commit'))[:10]}  vs  current {str(current.get('commit'))[:10]}")
+    print(f"{'config':<12}{'players':>8}  {'metric':<10}{'baseline':>10}{'current':>10}{'change':>9}")
+
+    regressions = []
+    for key in sorted(set(before) & set(after)):
+        old_run, new_run = before[key], after[key]
+        turn_before, turn_after = old_run['endpoints']['turn'], new_run['endpoints']['turn']
+        rows = [(f'turn {pct}', turn_before[pct], turn_after[pct]) for pct in ('p50', 'p95', 'p99')]
+        rows.append(('req/s', old_run['rps'], new_run['rps']))
+
+        for metric, old, new in rows:
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = change < -args.threshold if metric == 'req/s' else change > args.threshold
+            if metric == 'req/s':
+                old_text, new_text = f"{old:.1f}", f"{new:.1f}"
+            else:
+                old_text, new_text = f"{old * 1000:.0f}ms", f"{new * 1000:.0f}ms"
+            print(f"{key[0]:<12}{key[1]:>8}  {metric:<10}{old_text:>10}{new_text:>10}{change:>+9.1%}"
+                  f"{'  REGRESSION' if worse else ''}")
+            if worse:
+                regressions.append((key, metric))
+
+        # Error rates are compared in absolute percentage points
+        old, new = old_run['error_rate'], new_run['error_rate']
+        worse = new - old > 0.01
+        print(f"{key[0]:<12}{key[1]:>8}  {'errors':<10}{old:>10.1%}{new:>10.1%}{(new - old) * 100:>+8.1f}p"
+              f"{'  REGRESSION' if worse else ''}")
+        if worse:
+            regressions.append((key, 'errors'))
+
+    missing = sorted(set(before) ^ set(after))
+    if missing:
+        print(f"Not compared (present in only one file): {missing}")
+    if regressions:
+        print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}")
+        sys.exit(1)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help="run the load test and save results")
+    run_parser.add_argument('--configs', default='wsgi:1x4,wsgi:2x8,asgi:2',
+                            help="comma-separated worker configurations")
+    run_parser.add_argument('--players', default='10,50',
+                            help="comma-separated concurrent player counts, run in turn")
+    run_parser.add_argument('--duration', type=float, default=20.0, help="measured seconds per step")
+    run_parser.add_argument('--warmup', type=float, default=3.0, help="unmeasured seconds before each step")
+    run_parser.add_argument('--think-time', type=float, default=1.0,
+                            help="mean seconds a player waits between commands")
+    run_parser.add_argument('--stream', action='store_true', help="use the streaming endpoint")
+    run_parser.add_argument('--cache', action='store_true', help="leave the response cache enabled")
+    run_parser.add_argument('--latency-median', type=float, default=0.8, help="stand-in median first-token seconds")
+    run_parser.add_argument('--latency-p95', type=float, default=2.0, help="stand-in p95 first-token seconds")
+    run_parser.add_argument('--tokens-per-second', type=float, default=40.0)
+    run_parser.add_argument('--error-rate', type=float, default=0.0)
+    run_parser.add_argument('--rate-limit-rate', type=float, default=0.0)
+    run_parser.add_argument('--seed', type=int, default=1)
+    run_parser.add_argument('--output', default=os.path.join(
+        BASE_DIR, 'loadtest-results', datetime.now().strftime('%Y%m%d-%H%M%S') + '.json'))
+    run_parser.set_defaults(func=run)
+
+    compare_parser = commands.add_parser('compare', help="compare two saved result files")
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.10,
+                                help="relative change that counts as a regression")
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == '__main__':
+    main()
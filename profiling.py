@@ -0,0 +1,381 @@
+"""
+Request profiling for Wonder of U
+A sampling profiler an operator switches on for single requests (with the
+PROFILE_TOKEN in an ``X-Profile`` header or a ``?profile=`` query flag) or
+for a fraction of all traffic, without restarting workers. Each profiled
+request's stacks are written to PROFILE_DIR as a speedscope or
+collapsed-stack file (open them at https://www.speedscope.app or feed them
+to flamegraph.pl), keeping only the slowest sampled requests.
+
+    python profiling.py list                 # kept profiles, slowest first
+    python profiling.py top FILE [N]         # functions with the most samples
+    python profiling.py sample 0.01          # profile 1% of requests from now on
+    python profiling.py sample default       # back to PROFILE_SAMPLE_RATE
+"""
+import functools
+import hmac
+import itertools
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from inspect import iscoroutinefunction
+from pathlib import Path
+
+from django.utils.cache import patch_cache_control
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {'speedscope': 'speedscope.json', 'collapsed': 'collapsed.txt'}
+
+# File in the profile directory holding the sample rate set at runtime
+SAMPLE_RATE_FILE = 'sample-rate'
+
+class Sampler(threading.Thread):
+    """Samples one thread's stack every ``interval`` seconds until ``finish``
+
+    The samples are written out by this thread once the request is over,
+    so the request never waits on the profile.
+    """
+
+    def __init__(self, profiler, thread_id, view, lane, profile_id):
+        super().__init__(name=f'profile-{profile_id}', daemon=True)
+        self.profiler = profiler
+        self.thread_id = thread_id
+        self.view = view
+        self.lane = lane
+        self.profile_id = profile_id
+        self.stacks = Counter()
+        self.started = time.perf_counter()
+        self.seconds = None
+        self._done = threading.Event()
+
+    def run(self):
+        names = {}
+        interval = self.profiler.interval
+        while not self._done.wait(interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                name = names.get(code)
+                if name is None:
+                    name = names[code] = (code.co_name, code.co_filename, code.co_firstlineno)
+                stack.append(name)
+                frame = frame.f_back
+            if stack:
+                self.stacks[tuple(reversed(stack))] += 1
+        try:
+            self.profiler.save(self)
+        except Exception as e:
+            logger.warning("Could not save profile %s: %s", self.profile_id, e)
+
+    def finish(self):
+        if self.seconds is None:
+            self.seconds = time.perf_counter() - self.started
+            self._done.set()
+
+    def attach(self, response):
+        """Name the profile in the response; a stream is profiled until it ends"""
+
+        response['X-Profile'] = self.profile_id
+        # Never let a shared cache hand the profiled response to others
+        patch_cache_control(response, private=True)
+        if not response.streaming:
+            self.finish()
+        elif response.is_async:
+            response.streaming_content = self._afinish_after(response.streaming_content)
+        else:
+            response.streaming_content = self._finish_after(response.streaming_content)
+        return response
+
+    def _finish_after(self, content):
+        try:
+            yield from content
+        finally:
+            self.finish()
+
+    async def _afinish_after(self, content):
+        try:
+            async for chunk in content:
+                yield chunk
+        finally:
+            self.finish()
+
+class RequestProfiler:
+    """Decides which requests to profile and keeps their profiles
+
+    ``wrap`` decorates a view. A request is profiled when it carries
+    ``token`` (``X-Profile`` header or ``profile`` query parameter; an empty
+    token turns this off), or else with probability ``sample_rate``. The
+    rate can be changed at runtime through the ``sample-rate`` file in
+    ``directory`` (see ``set_sample_rate``), which every worker checks at
+    most once a second. With neither configured a request costs one clock
+    read.
+
+    The request's thread is sampled every ``interval`` seconds. Requested
+    profiles are always written and the newest ``keep`` kept; sampled ones
+    only while among the ``keep`` slowest. Async views are sampled on the
+    event loop's thread, so their profiles include whatever else the loop
+    ran meanwhile and not work handed to other threads.
+    """
+
+    def __init__(self, directory, token='', sample_rate=0.0, interval=0.005, keep=50, format='speedscope'):
+        if format not in FORMATS:
+            raise ValueError(f"Unknown profile format {format!r}; use one of {', '.join(FORMATS)}")
+        self.directory = Path(directory)
+        self.token = token
+        self.default_rate = sample_rate
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.keep = keep
+        self.format = format
+        self._checked = 0.0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def wrap(self, view):
+        """Profile ``view`` (sync or async) for the requests ``wanted`` picks"""
+
+        name = view.__name__
+
+        if iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def profiled(request, *args, **kwargs):
+                lane = self.wanted(request)
+                if lane is None:
+                    return await view(request, *args, **kwargs)
+                sampler = self.start(name, lane)
+                try:
+                    response = await view(request, *args, **kwargs)
+                except BaseException:
+                    sampler.finish()
+                    raise
+                return sampler.attach(response)
+        else:
+            @functools.wraps(view)
+            def profiled(request, *args, **kwargs):
+                lane = self.wanted(request)
+                if lane is None:
+                    return view(request, *args, **kwargs)
+                sampler = self.start(name, lane)
+                try:
+                    response = view(request, *args, **kwargs)
+                except BaseException:
+                    sampler.finish()
+                    raise
+                return sampler.attach(response)
+        return profiled
+
+    def wanted(self, request):
+        """``requested``, ``sampled`` or None (not profiled)"""
+
+        if self.token:
+            presented = request.headers.get('X-Profile') or request.GET.get('profile')
+            if presented and hmac.compare_digest(presented.encode(), self.token.encode()):
+                return 'requested'
+
+        now = time.monotonic()
+        if now - self._checked >= 1.0:
+            self._checked = now
+            self._reload_rate()
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return 'sampled'
+        return None
+
+    def start(self, view, lane):
+        with self._lock:
+            number = next(self._ids)
+        profile_id = f"{int(time.time())}-{os.getpid()}-{number}"
+        sampler = Sampler(self, threading.get_ident(), view, lane, profile_id)
+        sampler.start()
+        return sampler
+
+    def save(self, sampler):
+        """Write a finished profile, then drop those beyond ``keep``"""
+
+        # Imported here so the command line works without Django settings
+        from instrumentation import metrics
+
+        milliseconds = round(sampler.seconds * 1000)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        kept = self.profiles(sampler.lane)
+
+        # Sampled profiles only replace faster ones
+        if (sampler.lane == 'sampled' and len(kept) >= self.keep
+                and milliseconds <= min(profile['milliseconds'] for profile in kept)):
+            metrics.inc('wonderofu_profiles_total', lane=sampler.lane, result='skipped')
+            return None
+
+        path = self.directory / (f"{sampler.lane}-{milliseconds:08d}ms-{sampler.profile_id}-{sampler.view}"
+                                 f".{FORMATS[self.format]}")
+        writer = speedscope if self.format == 'speedscope' else collapsed
+        temporary = path.with_name(f".{path.name}")
+        temporary.write_text(writer(sampler.stacks, sampler, self.interval))
+        os.replace(temporary, path)
+        metrics.inc('wonderofu_profiles_total', lane=sampler.lane, result='written')
+        logger.info("Profiled %s in %dms: %s", sampler.view, milliseconds, path.name)
+
+        kept = self.profiles(sampler.lane)
+        order = 'milliseconds' if sampler.lane == 'sampled' else 'modified'
+        for profile in sorted(kept, key=lambda profile: profile[order], reverse=True)[self.keep:]:
+            try:
+                os.remove(profile['path'])
+            except FileNotFoundError:
+                pass  # Another worker pruned it first
+        return path
+
+    def profiles(self, lane=None):
+        """Kept profiles: dicts with ``path``, ``lane``, ``milliseconds``, ``id``, ``view`` and ``modified``"""
+
+        found = []
+        try:
+            entries = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return found
+        for entry in entries:
+            parts = entry.name.split('.', 1)[0].split('-')
+            if len(parts) < 6 or parts[0] not in ('requested', 'sampled') or entry.name.startswith('.'):
+                continue
+            if lane is not None and parts[0] != lane:
+                continue
+            try:
+                modified = entry.stat().st_mtime
+            except FileNotFoundError:
+                continue
+            found.append({
+                'path': entry.path,
+                'lane': parts[0],
+                'milliseconds': int(parts[1].rstrip('ms')),
+                'id': '-'.join(parts[2:5]),
+                'view': '-'.join(parts[5:]),
+                'modified': modified,
+            })
+        return found
+
+    def set_sample_rate(self, rate):
+        """Change the sample rate of every worker (None: back to the configured one)"""
+
+        path = self.directory / SAMPLE_RATE_FILE
+        if rate is None:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        else:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            path.write_text(f"{float(rate)}\n")
+        self._checked = 0.0
+
+    def _reload_rate(self):
+        try:
+            self.sample_rate = float((self.directory / SAMPLE_RATE_FILE).read_text())
+        except FileNotFoundError:
+            self.sample_rate = self.default_rate
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring the profile sample rate file: %s", e)
+            self.sample_rate = self.default_rate
+
+def _frame_name(frame):
+    name, filename, line = frame
+    return f"{name} ({os.path.basename(filename)}:{line})"
+
+def collapsed(stacks, sampler, interval):
+    """One ``root;...;leaf count`` line per distinct stack (Brendan Gregg's format)"""
+
+    lines = [f"{';'.join(_frame_name(frame) for frame in stack)} {count}" for stack, count in stacks.items()]
+    return '\n'.join(sorted(lines)) + '\n'
+
+def speedscope(stacks, sampler, interval):
+    """A speedscope ``sampled`` profile, weighted in milliseconds"""
+
+    frames, index = [], {}
+    samples, weights = [], []
+    for stack, count in stacks.items():
+        sample = []
+        for frame in stack:
+            if frame not in index:
+                index[frame] = len(frames)
+                name, filename, line = frame
+                frames.append({'name': name, 'file': filename, 'line': line})
+            sample.append(index[frame])
+        samples.append(sample)
+        weights.append(count * interval * 1000)
+
+    title = f"{sampler.view} {sampler.profile_id} ({sampler.seconds * 1000:.0f}ms, {sampler.lane})"
+    return json.dumps({
+        '$schema': 'https://www.speedscope.app/file-format-schema.json',
+        'name': title,
+        'exporter': 'wonderofu profiling.py',
+        'activeProfileIndex': 0,
+        'shared': {'frames': frames},
+        'profiles': [{
+            'type': 'sampled',
+            'name': title,
+            'unit': 'milliseconds',
+            'startValue': 0,
+            'endValue': sum(weights),
+            'samples': samples,
+            'weights': weights,
+        }],
+    })
+
+def read_stacks(path):
+    """``{stack tuple: weight}`` from a profile file in either format"""
+
+    stacks = Counter()
+    text = Path(path).read_text()
+    if path.endswith('.json'):
+        document = json.loads(text)
+        frames = [_frame_name((frame['name'], frame.get('file', ''), frame.get('line', 0)))
+                  for frame in document['shared']['frames']]
+        for profile in document['profiles']:
+            for sample, weight in zip(profile['samples'], profile['weights']):
+                stacks[tuple(frames[number] for number in sample)] += weight
+    else:
+        for line in text.splitlines():
+            stack, _, count = line.rpartition(' ')
+            if stack:
+                stacks[tuple(stack.split(';'))] += float(count)
+    return stacks
+
+def top(stacks, count=20):
+    """``(function, self share, total share)`` for the functions with the most samples"""
+
+    total = sum(stacks.values()) or 1
+    own, inclusive = Counter(), Counter()
+    for stack, weight in stacks.items():
+        own[stack[-1]] += weight
+        for frame in set(stack):
+            inclusive[frame] += weight
+    rows = [(frame, own[frame] / total, inclusive[frame] / total) for frame in inclusive]
+    return sorted(rows, key=lambda row: (row[1], row[2]), reverse=True)[:count]
+
+if __name__ == '__main__':
+    import django
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
+    django.setup()
+
+    from django.conf import settings
+
+    profiler = RequestProfiler(settings.PROFILE_DIR, sample_rate=settings.PROFILE_SAMPLE_RATE)
+    command, args = (sys.argv[1], sys.argv[2:]) if len(sys.argv) > 1 else ('list', [])
+
+    if command == 'top':
+        for frame, own, inclusive in top(read_stacks(args[0]), int(args[1]) if len(args) > 1 else 20):
+            print(f"{own:6.1%} self  {inclusive:6.1%} total  {frame}")
+    elif command == 'sample':
+        if args:
+            profiler.set_sample_rate(None if args[0] == 'default' else float(args[0]))
+        profiler._reload_rate()
+        print(f"Sample rate: {profiler.sample_rate:g} (configured: {profiler.default_rate:g})")
+    else:
+        for profile in sorted(profiler.profiles(), key=lambda profile: profile['milliseconds'], reverse=True):
+            modified = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(profile['modified']))
+            print(f"{profile['milliseconds']:7d}ms  {profile['lane']:<9} {profile['view']:<28} {modified}  "
+                  f"{os.path.basename(profile['path'])}")
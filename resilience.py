@@ -0,0 +1,176 @@
+"""
+Resilience helpers for Wonder of U's upstream AI calls
+Latency-based deadlines and a circuit breaker, so a slow or failing Mistral
+endpoint costs players a fallback response instead of a long wait
+"""
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+
+class LatencyTracker:
+    """Rolling window of successful call latencies that sets the call budget
+
+    The budget is ``multiplier`` times the configured percentile of the last
+    ``window`` calls, clamped to ``[floor, ceiling]``. Until ``min_samples``
+    calls have been observed the budget is the ceiling.
+    """
+
+    def __init__(self, window=200, min_samples=20, percentile=95, multiplier=1.5,
+                 floor=1.0, ceiling=10.0):
+        self.min_samples = min_samples
+        self.percentile = percentile
+        self.multiplier = multiplier
+        self.floor = floor
+        self.ceiling = ceiling
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, percentile):
+        """Return the given percentile of the window, or None if it is empty"""
+
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(len(samples) * percentile / 100))
+        return samples[index]
+
+    def budget(self):
+        """Seconds a call may take before the player gets a fallback"""
+
+        if len(self._samples) < self.min_samples:
+            return self.ceiling
+        budget = self.quantile(self.percentile) * self.multiplier
+        return max(self.floor, min(self.ceiling, budget))
+
+    def snapshot(self):
+        return {
+            'samples': len(self._samples),
+            'p50': self.quantile(50),
+            'p95': self.quantile(95),
+            'p99': self.quantile(99),
+            'budget': self.budget(),
+        }
+
+class CircuitBreaker:
+    """Classic closed / open / half-open breaker
+
+    Opens after ``failure_threshold`` consecutive failures (or immediately
+    when the upstream sends a ``Retry-After``) and rejects calls until the
+    reset timeout passes. Then a single probe call is let through: success
+    closes the breaker, failure re-opens it with the timeout doubled, up to
+    ``max_reset_timeout``.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, max_reset_timeout=300.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.open_until = 0.0
+        self.stats = {'opened': 0, 'rejected': 0, 'probes': 0}
+
+        self._current_timeout = reset_timeout
+        self._probe_in_flight = False
+        self._probe_started = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Return True if a call may be made now"""
+
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+
+            now = time.time()
+            if self.state == self.OPEN and now >= self.open_until:
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+
+            # A probe that never reported back (e.g. an abandoned stream)
+            # must not wedge the breaker half-open
+            probe_stale = now - self._probe_started > self._current_timeout
+            if self.state == self.HALF_OPEN and (not self._probe_in_flight or probe_stale):
+                self._probe_in_flight = True
+                self._probe_started = now
+                self.stats['probes'] += 1
+                return True
+
+            self.stats['rejected'] += 1
+            return False
+
+    def ready(self):
+        """True if ``allow`` could let a call through now; takes no probe"""
+
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                return time.time() >= self.open_until
+            return not self._probe_in_flight or time.time() - self._probe_started > self._current_timeout
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.opened_at = None
+            self._current_timeout = self.reset_timeout
+            self._probe_in_flight = False
+
+    def record_failure(self, retry_after=None):
+        """Count a failed call; ``retry_after`` (seconds) opens the breaker at once"""
+
+        with self._lock:
+            self.failures += 1
+
+            if self.state == self.HALF_OPEN:
+                self._current_timeout = min(self._current_timeout * 2, self.max_reset_timeout)
+                self._open(retry_after)
+            elif retry_after is not None or self.failures >= self.failure_threshold:
+                self._open(retry_after)
+
+    def _open(self, retry_after):
+        now = time.time()
+        if self.state != self.OPEN:
+            self.stats['opened'] += 1
+            self.opened_at = now
+        self.state = self.OPEN
+        self._probe_in_flight = False
+        wait = self._current_timeout if retry_after is None else min(retry_after, self.max_reset_timeout)
+        self.open_until = max(self.open_until, now + wait)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.failures,
+                'opened_at': self.opened_at,
+                'retry_in': max(0.0, self.open_until - time.time()) if self.state != self.CLOSED else 0.0,
+                **self.stats,
+            }
+
+def parse_retry_after(value):
+    """Parse a Retry-After header (delta seconds or HTTP date) into seconds"""
+
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
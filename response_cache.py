@@ -0,0 +1,278 @@
+"""
+Response cache for Wonder of U - shares forest responses between workers
+Players repeat the same commands constantly; this keeps a small pool of AI
+responses per (command, game situation) so repeats skip the Mistral round trip
+"""
+import atexit
+import hashlib
+import json
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+
+# Words that don't change what the player is trying to do
+FILLER_WORDS = {'a', 'an', 'the', 'please', 'i', 'to', 'try'}
+
+def normalize_command(user_input):
+    """The command's words, lowercased and without punctuation or filler"""
+
+    words = re.sub(r"[^a-z0-9' ]+", ' ', user_input.lower()).split()
+    return ' '.join(word for word in words if word not in FILLER_WORDS)
+
+class ResponseCache:
+    """SQLite-backed LRU cache shared by every worker process on the host
+
+    Each key holds up to ``variants`` raw AI responses. Until that pool is
+    full a lookup counts as a miss, so the caller asks the AI again and adds
+    the answer; after that, hits return a random variant so repeats don't
+    read as canned. Entries expire after ``ttl`` seconds and the least
+    recently used ones are evicted once the stored text exceeds
+    ``max_bytes``. Hit/miss counters live in the same database, so they
+    cover all workers.
+
+    Lookups only read (WAL readers never wait on the write lock). Their
+    hit/miss counts and recency updates are kept in memory and written with
+    the next ``put``, or by the first lookup after ``flush_interval``
+    seconds. An expired entry reads as a miss and is refilled by ``put``.
+    """
+
+    def __init__(self, path, ttl=3600, max_bytes=8 * 1024 * 1024, variants=3,
+                 escape_bucket_size=3, enabled=True, namespace='', flush_interval=1.0):
+        self.path = str(path)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.variants = variants
+        self.escape_bucket_size = escape_bucket_size
+        self.enabled = enabled
+        # Keeps responses from different backends/models apart
+        self.namespace = namespace
+        self.flush_interval = flush_interval
+        self._local = threading.local()
+        self._pending_counts = {}
+        self._pending_accessed = {}
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        atexit.register(self.flush)
+
+    def _connect(self):
+        """Return this thread's connection, reopening it after a fork"""
+
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    variants TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created REAL NOT NULL,
+                    accessed REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed);
+                CREATE TABLE IF NOT EXISTS counters (
+                    name TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
+                );
+            ''')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def make_key(self, user_input, game_state):
+        """Build the cache key from the normalized command and game situation"""
+
+        command = normalize_command(user_input)
+
+        escape_bucket = game_state.get('escape_attempts', 0) // self.escape_bucket_size
+        items = ','.join(sorted(game_state.get('items', [])))
+        area = game_state.get('current_area', 'dark_forest')
+
+        raw = f"{self.namespace}|{command}|{area}|{items}|{escape_bucket}"
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Return a cached response, or None if the AI should be asked"""
+
+        if not self.enabled:
+            return None
+
+        now = time.time()
+        row = self._connect().execute(
+            'SELECT variants, created FROM responses WHERE key = ?', (key,)
+        ).fetchone()
+
+        variants = json.loads(row[0]) if row is not None and row[1] + self.ttl >= now else []
+        with self._lock:
+            if len(variants) < self.variants:
+                self._add_pending('misses')
+                variants = None
+            else:
+                self._add_pending('hits')
+                self._pending_accessed[key] = now
+            due = time.monotonic() - self._last_flush >= self.flush_interval
+
+        if due:
+            self.flush()
+        return random.choice(variants) if variants else None
+
+    def _add_pending(self, name, amount=1):
+        self._pending_counts[name] = self._pending_counts.get(name, 0) + amount
+
+    def flush(self):
+        """Write this process's pending counters and recency updates"""
+
+        with self._lock:
+            self._last_flush = time.monotonic()
+            counts, self._pending_counts = self._pending_counts, {}
+            accessed, self._pending_accessed = self._pending_accessed, {}
+        if not counts and not accessed:
+            return
+
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            self._write_pending(conn, counts, accessed)
+
+    def _write_pending(self, conn, counts, accessed):
+        conn.executemany('UPDATE responses SET accessed = max(accessed, ?) WHERE key = ?',
+                         [(when, key) for key, when in accessed.items()])
+        for name, amount in counts.items():
+            self._bump(conn, name, amount)
+
+    def put(self, key, content):
+        """Add a response variant to the key's pool and enforce the size cap"""
+
+        if not self.enabled:
+            return
+
+        now = time.time()
+        with self._lock:
+            self._last_flush = time.monotonic()
+            counts, self._pending_counts = self._pending_counts, {}
+            accessed, self._pending_accessed = self._pending_accessed, {}
+
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            # Lookups since the last write go out with this one
+            self._write_pending(conn, counts, accessed)
+
+            row = conn.execute(
+                'SELECT variants, size, created FROM responses WHERE key = ?', (key,)
+            ).fetchone()
+
+            if row is not None and row[2] + self.ttl < now:
+                # Expired: start the pool over
+                conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+                self._bump(conn, 'bytes', -row[1])
+                self._bump(conn, 'expired')
+                row = None
+
+            variants = json.loads(row[0]) if row is not None else []
+            # Duplicates still fill the pool; otherwise a deterministic
+            # backend would never produce a hit
+            if len(variants) >= self.variants:
+                return
+            variants.append(content)
+
+            encoded = json.dumps(variants)
+            size = len(encoded.encode('utf-8'))
+            if row is None:
+                conn.execute(
+                    'INSERT INTO responses (key, variants, size, created, accessed) VALUES (?, ?, ?, ?, ?)',
+                    (key, encoded, size, now, now)
+                )
+                self._bump(conn, 'bytes', size)
+            else:
+                conn.execute(
+                    'UPDATE responses SET variants = ?, size = ?, accessed = ? WHERE key = ?',
+                    (encoded, size, now, key)
+                )
+                self._bump(conn, 'bytes', size - row[1])
+
+            self._evict(conn)
+
+    def _evict(self, conn):
+        """Drop least recently used entries until under the memory cap"""
+
+        total = self._counter(conn, 'bytes')
+        while total > self.max_bytes:
+            victims = conn.execute(
+                'SELECT key, size FROM responses ORDER BY accessed LIMIT 32'
+            ).fetchall()
+            if not victims:
+                break
+            for key, size in victims:
+                conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+                self._bump(conn, 'bytes', -size)
+                self._bump(conn, 'evictions')
+                total -= size
+                if total <= self.max_bytes:
+                    break
+
+    def _bump(self, conn, name, amount=1):
+        conn.execute(
+            'INSERT INTO counters (name, value) VALUES (?, ?) '
+            'ON CONFLICT(name) DO UPDATE SET value = value + excluded.value',
+            (name, amount)
+        )
+
+    def _counter(self, conn, name):
+        row = conn.execute('SELECT value FROM counters WHERE name = ?', (name,)).fetchone()
+        return row[0] if row else 0
+
+    def stats(self):
+        """Return the shared hit/miss counters and current size"""
+
+        self.flush()
+        conn = self._connect()
+        counters = dict(conn.execute('SELECT name, value FROM counters').fetchall())
+        entries = conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+        hits = counters.get('hits', 0)
+        misses = counters.get('misses', 0)
+        return {
+            'enabled': self.enabled,
+            'entries': entries,
+            'bytes': counters.get('bytes', 0),
+            'max_bytes': self.max_bytes,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / (hits + misses) if hits + misses else 0.0,
+            'evictions': counters.get('evictions', 0),
+            'expired': counters.get('expired', 0),
+        }
+
+    def clear(self):
+        """Remove every cached response and reset the counters"""
+
+        with self._lock:
+            self._pending_counts = {}
+            self._pending_accessed = {}
+
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('DELETE FROM responses')
+            conn.execute('DELETE FROM counters')
+
+if __name__ == '__main__':
+    import sys
+    import django
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
+    django.setup()
+
+    import ai_service
+
+    cache = ai_service.mistral_ai.response_cache
+    if sys.argv[1:] == ['clear']:
+        cache.clear()
+        print("Response cache cleared")
+    else:
+        print(json.dumps(cache.stats(), indent=2))
@@ -1,6 +1,7 @@
 """
 Django settings for Wonder of U - AI-powered text adventure
 """
+import json
 import os
 from pathlib import Path
 from dotenv import load_dotenv
@@ -28,6 +29,103 @@ MISTRAL_API_KEY = os.getenv('MISTRAL_API_KEY')
 GAME_DIFFICULTY = os.getenv('GAME_DIFFICULTY', 'normal')
 MAX_ESCAPE_ATTEMPTS = int(os.getenv('MAX_ESCAPE_ATTEMPTS', '10'))
 
+# LLM backend: 'mistral' (the hosted API) or 'standin' (the local stand-in
+# server, see standin_server.py). Base URL and model default per backend.
+LLM_BACKEND = os.getenv('LLM_BACKEND', 'mistral')
+LLM_BASE_URL = os.getenv('LLM_BASE_URL') or None
+LLM_MODEL = os.getenv('LLM_MODEL') or None
+
+# Upstream endpoints calls are routed between (llm_router.py). By default
+# the backend above, plus an economy tier on the same backend when
+# LLM_ECONOMY_MODEL is set; LLM_ENDPOINTS (a JSON list) replaces both to
+# spread calls over several keys, models or base URLs. Calls move to the
+# economy tier when the best standard endpoint is expected to take longer
+# than LLM_ROUTER_SLOW_AFTER seconds, or when they had to queue.
+LLM_ECONOMY_MODEL = os.getenv('LLM_ECONOMY_MODEL') or None
+LLM_ENDPOINTS = json.loads(os.getenv('LLM_ENDPOINTS') or 'null') or [
+    {'name': 'primary', 'backend': LLM_BACKEND, 'base_url': LLM_BASE_URL, 'model': LLM_MODEL},
+] + ([
+    {'name': 'economy', 'backend': LLM_BACKEND, 'base_url': LLM_BASE_URL, 'model': LLM_ECONOMY_MODEL, 'tier': 'economy'},
+] if LLM_ECONOMY_MODEL else [])
+LLM_ROUTER_SLOW_AFTER = float(os.getenv('LLM_ROUTER_SLOW_AFTER', '2.5'))
+LLM_ROUTER_EXPLORE = float(os.getenv('LLM_ROUTER_EXPLORE', '0.05'))
+
+# Mistral HTTP connection pool (per worker process)
+MISTRAL_POOL_SIZE = int(os.getenv('MISTRAL_POOL_SIZE', '10'))
+MISTRAL_KEEP_ALIVE = os.getenv('MISTRAL_KEEP_ALIVE', 'True').lower() == 'true'
+MISTRAL_CONNECT_TIMEOUT = float(os.getenv('MISTRAL_CONNECT_TIMEOUT', '3.05'))
+MISTRAL_READ_TIMEOUT = float(os.getenv('MISTRAL_READ_TIMEOUT', '30'))
+MISTRAL_WARM_UP = os.getenv('MISTRAL_WARM_UP', 'True').lower() == 'true'
+
+# Latency budget: a call slower than MULTIPLIER x the observed percentile
+# (clamped to MIN..MAX seconds) is answered with a fallback response
+MISTRAL_BUDGET_PERCENTILE = float(os.getenv('MISTRAL_BUDGET_PERCENTILE', '95'))
+MISTRAL_BUDGET_MULTIPLIER = float(os.getenv('MISTRAL_BUDGET_MULTIPLIER', '1.5'))
+MISTRAL_BUDGET_MIN = float(os.getenv('MISTRAL_BUDGET_MIN', '1.0'))
+MISTRAL_BUDGET_MAX = float(os.getenv('MISTRAL_BUDGET_MAX', '10.0'))
+
+# Circuit breaker: stop calling Mistral after this many consecutive
+# failures, probing again after RESET seconds
+MISTRAL_BREAKER_FAILURES = int(os.getenv('MISTRAL_BREAKER_FAILURES', '5'))
+MISTRAL_BREAKER_RESET = float(os.getenv('MISTRAL_BREAKER_RESET', '30'))
+
+# Async request path (enabled by asgi.py). One ASGI worker multiplexes many
+# in-flight upstream calls, so its pool is sized by concurrent players.
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS', 'False').lower() == 'true'
+MISTRAL_ASYNC_MAX_CONNECTIONS = int(os.getenv('MISTRAL_ASYNC_MAX_CONNECTIONS', '200'))
+
+# Runtime data shared by all workers on this host (caches, stores)
+RUNTIME_DIR = Path(os.getenv('RUNTIME_DIR', BASE_DIR / 'var'))
+
+# Response cache in front of the AI call
+RESPONSE_CACHE_ENABLED = os.getenv('RESPONSE_CACHE_ENABLED', 'True').lower() == 'true'
+RESPONSE_CACHE_PATH = RUNTIME_DIR / 'response_cache.sqlite3'
+RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL', '3600'))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv('RESPONSE_CACHE_MAX_BYTES', str(8 * 1024 * 1024)))
+RESPONSE_CACHE_VARIANTS = int(os.getenv('RESPONSE_CACHE_VARIANTS', '3'))
+RESPONSE_CACHE_ESCAPE_BUCKET = int(os.getenv('RESPONSE_CACHE_ESCAPE_BUCKET', '3'))
+
+# Admission control for upstream calls, shared by every worker on the host:
+# at most MAX_CONCURRENT calls in flight and RATE calls a second (0 = no
+# limit, BURST at once), and each game SESSION_RATE a second (SESSION_BURST
+# at once). Others queue (QUEUE_SIZE, most escape attempts first) for up to
+# QUEUE_TIMEOUT seconds, then get a fallback response.
+ADMISSION_ENABLED = os.getenv('ADMISSION_ENABLED', 'True').lower() == 'true'
+ADMISSION_PATH = RUNTIME_DIR / 'admission.sqlite3'
+ADMISSION_MAX_CONCURRENT = int(os.getenv('ADMISSION_MAX_CONCURRENT', '16'))
+ADMISSION_RATE = float(os.getenv('ADMISSION_RATE', '0'))
+ADMISSION_BURST = int(os.getenv('ADMISSION_BURST', '10'))
+ADMISSION_QUEUE_SIZE = int(os.getenv('ADMISSION_QUEUE_SIZE', '32'))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv('ADMISSION_QUEUE_TIMEOUT', '2'))
+ADMISSION_SESSION_RATE = float(os.getenv('ADMISSION_SESSION_RATE', '0.5'))
+ADMISSION_SESSION_BURST = int(os.getenv('ADMISSION_SESSION_BURST', '5'))
+
+# Speculative turns (speculation.py, opt-in): once the typed command has not
+# changed for DEBOUNCE_MS, it is played ahead of submit. At most
+# MAX_IN_FLIGHT at once per worker, RATE a second across the host (BURST at
+# once) and SESSION_RATE a second per game (SESSION_BURST at once); unsent
+# ones are dropped after TTL seconds.
+SPECULATION_ENABLED = os.getenv('SPECULATION_ENABLED', 'False').lower() == 'true'
+SPECULATION_DEBOUNCE_MS = int(os.getenv('SPECULATION_DEBOUNCE_MS', '600'))
+SPECULATION_MAX_IN_FLIGHT = int(os.getenv('SPECULATION_MAX_IN_FLIGHT', '4'))
+SPECULATION_RATE = float(os.getenv('SPECULATION_RATE', '2'))
+SPECULATION_BURST = int(os.getenv('SPECULATION_BURST', '10'))
+SPECULATION_SESSION_RATE = float(os.getenv('SPECULATION_SESSION_RATE', '0.2'))
+SPECULATION_SESSION_BURST = int(os.getenv('SPECULATION_SESSION_BURST', '3'))
+SPECULATION_TTL = float(os.getenv('SPECULATION_TTL', '60'))
+
+# Calamity pool: pre-generated fallback responses per command category and
+# escape bucket. Slots below LOW_WATER fresh responses are refilled up to
+# SIZE, at most REFILL_RATE generations a minute and only once no player
+# call has started for IDLE_SECONDS; a response wears out after MAX_USES.
+CALAMITY_POOL_ENABLED = os.getenv('CALAMITY_POOL_ENABLED', 'True').lower() == 'true'
+CALAMITY_POOL_PATH = RUNTIME_DIR / 'calamity_pool.sqlite3'
+CALAMITY_POOL_SIZE = int(os.getenv('CALAMITY_POOL_SIZE', '12'))
+CALAMITY_POOL_LOW_WATER = int(os.getenv('CALAMITY_POOL_LOW_WATER', '4'))
+CALAMITY_POOL_MAX_USES = int(os.getenv('CALAMITY_POOL_MAX_USES', '3'))
+CALAMITY_POOL_REFILL_RATE = float(os.getenv('CALAMITY_POOL_REFILL_RATE', '6'))
+CALAMITY_POOL_IDLE_SECONDS = float(os.getenv('CALAMITY_POOL_IDLE_SECONDS', '0.5'))
+
 INSTALLED_APPS = [
     'django.contrib.contenttypes',
     'django.contrib.sessions',
@@ -36,6 +134,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Outermost, so its total covers the whole middleware stack
+    'instrumentation.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -47,6 +147,7 @@ MIDDLEWARE = [
 ROOT_URLCONF = 'urls'
 
 WSGI_APPLICATION = 'wsgi.application'
+ASGI_APPLICATION = 'asgi.application'
 
 TEMPLATES = [
     {
@@ -69,9 +170,99 @@ DATABASES = {
     }
 }
 
-# Session configuration for game state
+# Session configuration: the signed cookie carries only the game ID, the
+# game state itself lives in the game state store below
+SESSION_ENGINE = 'django.contrib.sessions.backends.signed_cookies'
 SESSION_COOKIE_AGE = 3600  # 1 hour
-SESSION_SAVE_EVERY_REQUEST = True
+# Only requests that touch the game refresh the cookie (see views.get_game_id);
+# the game page must never carry one, since shared caches may store it
+SESSION_SAVE_EVERY_REQUEST = False
+
+# The game page is the same for every player and may be cached (by browsers
+# and proxies) for INDEX_MAX_AGE seconds before it is revalidated
+INDEX_MAX_AGE = int(os.getenv('INDEX_MAX_AGE', '60'))
+
+# Intent routing: commands the classifier (intent.py) puts in one of
+# INTENT_LOCAL_INTENTS with at least INTENT_BYPASS_THRESHOLD confidence are
+# answered from the calamity pool without calling the LLM
+INTENT_ROUTING_ENABLED = os.getenv('INTENT_ROUTING_ENABLED', 'True').lower() == 'true'
+INTENT_MODEL_PATH = Path(os.getenv('INTENT_MODEL_PATH', RUNTIME_DIR / 'intent_model.npz'))
+INTENT_BYPASS_THRESHOLD = float(os.getenv('INTENT_BYPASS_THRESHOLD', '0.85'))
+INTENT_LOCAL_INTENTS = [name.strip() for name in os.getenv('INTENT_LOCAL_INTENTS', 'movement,look,wait').split(',') if name.strip()]
+
+# Prompt context (context_window.py): tokens of game memory sent with each
+# action - recent turns verbatim plus a rolling summary of older ones
+CONTEXT_TOKEN_BUDGET = int(os.getenv('CONTEXT_TOKEN_BUDGET', '176'))
+CONTEXT_SUMMARY_TOKENS = int(os.getenv('CONTEXT_SUMMARY_TOKENS', '80'))
+CONTEXT_TURN_TOKENS = int(os.getenv('CONTEXT_TURN_TOKENS', '48'))
+CONTEXT_INPUT_TOKENS = int(os.getenv('CONTEXT_INPUT_TOKENS', '40'))
+
+# Game state store (WAL-mode SQLite shared by all workers, write-behind)
+GAME_STATE_PATH = RUNTIME_DIR / 'game_state.sqlite3'
+GAME_STATE_FLUSH_INTERVAL = float(os.getenv('GAME_STATE_FLUSH_INTERVAL', '0.05'))
+GAME_STATE_BATCH_SIZE = int(os.getenv('GAME_STATE_BATCH_SIZE', '256'))
+
+# Transcripts of every turn (WAL-mode SQLite, written in the background) for
+# analysis and replay; see transcripts.py
+TRANSCRIPTS_ENABLED = os.getenv('TRANSCRIPTS_ENABLED', 'True').lower() == 'true'
+TRANSCRIPTS_PATH = RUNTIME_DIR / 'transcripts.sqlite3'
+TRANSCRIPTS_FLUSH_INTERVAL = float(os.getenv('TRANSCRIPTS_FLUSH_INTERVAL', '1'))
+TRANSCRIPTS_RETENTION_DAYS = float(os.getenv('TRANSCRIPTS_RETENTION_DAYS', '30'))
+TRANSCRIPTS_MAX_TURNS = int(os.getenv('TRANSCRIPTS_MAX_TURNS', '500000'))
+
+# How long a command waits for the same game's previous turn to finish
+# before the player is told the forest is still processing
+TURN_WAIT_TIMEOUT = float(os.getenv('TURN_WAIT_TIMEOUT', '5'))
+
+# Instrumentation: per-stage timings in a Server-Timing response header, and
+# metrics from all workers (flushed every METRICS_FLUSH_INTERVAL seconds)
+# served at /metrics in Prometheus text format
+SERVER_TIMING = os.getenv('SERVER_TIMING', 'True').lower() == 'true'
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True').lower() == 'true'
+METRICS_PATH = RUNTIME_DIR / 'metrics.sqlite3'
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '5'))
+
+# /metrics and /status/ai/ answer only requests carrying STATUS_TOKEN (an
+# Authorization: Bearer header or ?token= flag); empty turns them off
+STATUS_TOKEN = os.getenv('STATUS_TOKEN', '')
+
+# Request profiling (profiling.py): requests carrying PROFILE_TOKEN (an
+# X-Profile header or ?profile= flag; empty turns it off) and a
+# SAMPLE_RATE fraction of all requests are sampled every INTERVAL_MS and
+# written to PROFILE_DIR in FORMAT (speedscope or collapsed), keeping KEEP
+# of each
+PROFILE_DIR = Path(os.getenv('PROFILE_DIR', RUNTIME_DIR / 'profiles'))
+PROFILE_TOKEN = os.getenv('PROFILE_TOKEN', '')
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', '5'))
+PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', '50'))
+PROFILE_FORMAT = os.getenv('PROFILE_FORMAT', 'speedscope')
+
+# Logging goes through a queue so request threads never block on stderr
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'plain': {
+            'format': '%(asctime)s %(levelname)s [%(process)d] %(name)s: %(message)s',
+        },
+    },
+    'handlers': {
+        'queue': {
+            '()': 'instrumentation.QueueLogHandler',
+            'formatter': 'plain',
+        },
+    },
+    'root': {
+        'handlers': ['queue'],
+        'level': LOG_LEVEL,
+    },
+    'loggers': {
+        # One line per upstream request otherwise; the metrics count them
+        'httpx': {'level': 'WARNING'},
+    },
+}
 
 # Static files (CSS, JavaScript, Images)
 STATIC_URL = '/static/'
@@ -79,8 +270,24 @@ STATICFILES_DIRS = [
     BASE_DIR / 'static',
 ]
 STATIC_ROOT = BASE_DIR / 'staticfiles'
+STATICFILES_FINDERS = [
+    'django.contrib.staticfiles.finders.FileSystemFinder',
+    'django.contrib.staticfiles.finders.AppDirectoriesFinder',
+    # The minified app.css / app.js bundles (see frontend.py)
+    'frontend.BundleFinder',
+]
+FRONTEND_BUILD_DIR = BASE_DIR / 'build'
 
-# Whitenoise configuration for production static files
-STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+# Whitenoise configuration for production static files: collectstatic
+# fingerprints every file (app.<hash>.css) and writes .br/.gz copies, and
+# WhiteNoise serves the fingerprinted names with an immutable Cache-Control
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage',
+    },
+}
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
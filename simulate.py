@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+"""
+Batch simulation of Wonder of U playthroughs
+Plays thousands of scripted or randomized games through the game engine
+(engine.py) on a process pool, with no server, AI or database, and reports
+how games end, how long they take and how fast they ran. Every game has its
+own seeded RNG, so a run is reproducible whatever the number of workers.
+Use it to check a balance change before shipping it:
+
+    python simulate.py --games 20000
+    python simulate.py --games 20000 --breakthrough-chance 0 --max-escape-attempts 8
+    python simulate.py --policy escaper --source fallback
+    python simulate.py --script playthroughs.txt --source mymodule:make_source
+
+Sources answer each command the way the AI would. ``standin`` uses the
+stand-in server's templates (creative commands sometimes concede, like the
+real model), ``stubborn`` never concedes, ``fallback`` has no AI at all, and
+``module:function`` loads your own: ``function(rng)`` must return a
+``respond(command, state)`` callable (see ``GameEngine.play``).
+"""
+import argparse
+import importlib
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BASE_DIR)
+
+import intent
+import standin_server
+from engine import GENERIC_RESPONSES, GameEngine, Rules
+from game_state import GameState
+
+# Player styles: how often each kind of command (intent.SEED_COMMANDS) is typed
+POLICIES = {
+    'random': {name: 1 for name in intent.SEED_COMMANDS},
+    'escaper': {'escape': 6, 'movement': 2, 'look': 1, 'climbing': 1},
+    'creative': {'creative': 5, 'escape': 2, 'look': 1, 'inventory': 1, 'other': 1},
+    'explorer': {'movement': 4, 'look': 3, 'inventory': 2, 'wait': 1, 'other': 2, 'climbing': 1},
+}
+
+OUTCOMES = ('solution', 'conceded', 'persistence', 'breakthrough', 'fallback_persistence', 'exhausted')
+
+# --- Response sources -------------------------------------------------------
+
+def standin_source(rng):
+    """The stand-in server's templated answers"""
+
+    def respond(command, state):
+        return standin_server.forest_response(f"PLAYER ACTION: {command}", rng), 'ai'
+    return respond
+
+def stubborn_source(rng):
+    """A forest that never concedes: only the rules can end the game"""
+
+    def respond(command, state):
+        return rng.choice(GENERIC_RESPONSES), 'ai'
+    return respond
+
+def fallback_source(rng):
+    """No AI at all: every turn gets a fallback"""
+
+    def respond(command, state):
+        return None
+    return respond
+
+SOURCES = {'standin': standin_source, 'stubborn': stubborn_source, 'fallback': fallback_source}
+
+def load_source(name):
+    if name in SOURCES:
+        return SOURCES[name]
+    module, _, attribute = name.partition(':')
+    if not attribute:
+        raise SystemExit(f"Unknown source {name!r}; use one of {', '.join(SOURCES)} or module:function")
+    return getattr(importlib.import_module(module), attribute)
+
+# --- Players ----------------------------------------------------------------
+
+def random_player(policy, rng, max_turns):
+    """Commands drawn from the policy's intents, ``max_turns`` at most"""
+
+    names = list(policy)
+    weights = [policy[name] for name in names]
+    for _ in range(max_turns):
+        yield rng.choice(intent.SEED_COMMANDS[rng.choices(names, weights)[0]])
+
+def load_scripts(path):
+    """Playthroughs from a file: one per line, commands separated by ';'"""
+
+    with open(path) as f:
+        scripts = [[command.strip() for command in line.split(';') if command.strip()]
+                   for line in f if line.strip() and not line.startswith('#')]
+    if not scripts:
+        raise SystemExit(f"No playthroughs in {path}")
+    return scripts
+
+# --- Simulation -------------------------------------------------------------
+
+def play_game(index, config):
+    """Play one game; returns (outcome or None if unfinished, turns played)"""
+
+    rng = random.Random(f"{config['seed']}:{index}")
+    engine = GameEngine(rules=Rules(**config['rules']), rng=rng)
+    respond = load_source(config['source'])(rng)
+
+    if config['scripts']:
+        commands = config['scripts'][index % len(config['scripts'])]
+    else:
+        policy = config['policy']
+        if policy == 'mixed':
+            policy = rng.choice(sorted(POLICIES))
+        commands = random_player(POLICIES[policy], rng, config['max_turns'])
+
+    state = GameState()
+    turns = 0
+    for command in commands:
+        turn = engine.play(state, command, respond)
+        state = turn.state
+        turns += 1
+        if turn.outcome is not None:
+            return turn.outcome, turns
+    return None, turns
+
+def play_batch(start, stop, config):
+    """Play games ``start`` to ``stop``; returns the batch's tallies"""
+
+    ended = {outcome: [] for outcome in OUTCOMES}
+    unfinished = 0
+    turns = 0
+    for index in range(start, stop):
+        outcome, played = play_game(index, config)
+        turns += played
+        if outcome is None:
+            unfinished += 1
+        else:
+            ended[outcome].append(played)
+    return ended, unfinished, turns
+
+def simulate(config, games, workers, batch_size=250):
+    """Play ``games`` games on ``workers`` processes; returns the report dict"""
+
+    batches = [(start, min(start + batch_size, games)) for start in range(0, games, batch_size)]
+    ended = {outcome: [] for outcome in OUTCOMES}
+    unfinished = 0
+    turns = 0
+
+    started = time.perf_counter()
+    if workers <= 1:
+        tallies = [play_batch(start, stop, config) for start, stop in batches]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(play_batch, start, stop, config) for start, stop in batches]
+            tallies = [future.result() for future in futures]
+    elapsed = time.perf_counter() - started
+
+    for batch_ended, batch_unfinished, batch_turns in tallies:
+        for outcome, lengths in batch_ended.items():
+            ended[outcome].extend(lengths)
+        unfinished += batch_unfinished
+        turns += batch_turns
+
+    finished = [length for lengths in ended.values() for length in lengths]
+    wins = sum(len(ended[outcome]) for outcome in OUTCOMES if outcome != 'exhausted')
+    return {
+        'config': {key: value for key, value in config.items() if key != 'scripts'},
+        'games': games,
+        'workers': workers,
+        'won': wins / games,
+        'lost': len(ended['exhausted']) / games,
+        'unfinished': unfinished / games,
+        'outcomes': {outcome: len(lengths) / games for outcome, lengths in ended.items()},
+        'turns_to_end': _summary(finished),
+        'turns_by_outcome': {outcome: _summary(lengths) for outcome, lengths in ended.items() if lengths},
+        'seconds': elapsed,
+        'games_per_second': games / elapsed,
+        'turns_per_second': turns / elapsed,
+    }
+
+def _summary(lengths):
+    if not lengths:
+        return None
+    ordered = sorted(lengths)
+    return {
+        'mean': statistics.fmean(ordered),
+        'median': statistics.median(ordered),
+        'p90': ordered[min(len(ordered) - 1, int(len(ordered) * 0.9))],
+        'max': ordered[-1],
+    }
+
+def print_report(report):
+    config = report['config']
+    player = f"script {config['script']}" if config['script'] else f"policy {config['policy']}"
+    print(f"{report['games']} games on {report['workers']} worker(s), seed {config['seed']}, "
+          f"{player}, source {config['source']}")
+    print(f"rules: {', '.join(f'{name}={value}' for name, value in config['rules'].items())}\n")
+
+    wins = [f"{outcome} {report['outcomes'][outcome]:.1%}" for outcome in OUTCOMES if outcome != 'exhausted']
+    print(f"  won         {report['won']:6.1%}  ({', '.join(wins)})")
+    print(f"  lost        {report['lost']:6.1%}  (escape attempts exhausted)")
+    print(f"  unfinished  {report['unfinished']:6.1%}  (out of commands)")
+
+    ended = report['turns_to_end']
+    if ended:
+        print(f"\n  turns to end: mean {ended['mean']:.1f}, median {ended['median']:g}, "
+              f"p90 {ended['p90']}, max {ended['max']}")
+        for outcome, lengths in report['turns_by_outcome'].items():
+            print(f"    {outcome:<22}mean {lengths['mean']:.1f}, median {lengths['median']:g}")
+    print(f"\n  {report['games_per_second']:.0f} games/s, {report['turns_per_second']:.0f} turns/s "
+          f"({report['seconds']:.2f}s)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate Wonder of U playthroughs through the game engine")
+    parser.add_argument('--games', type=int, default=10000)
+    parser.add_argument('--workers', type=int, default=0, help="processes (default: one per CPU)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--policy', choices=sorted(POLICIES) + ['mixed'], default='mixed',
+                        help="player style for randomized games (mixed: a random style per game)")
+    parser.add_argument('--script', help="play these playthroughs instead (one per line, ';' between commands)")
+    parser.add_argument('--max-turns', type=int, default=40, help="commands per randomized game")
+    parser.add_argument('--source', default='standin',
+                        help=f"response source: {', '.join(SOURCES)} or module:function")
+    parser.add_argument('--output', help="also save the report as JSON")
+
+    rules = parser.add_argument_group('rules (defaults are the live game\'s)')
+    defaults = Rules(max_escape_attempts=int(os.getenv('MAX_ESCAPE_ATTEMPTS', '10')))
+    for name, value in defaults.to_dict().items():
+        rules.add_argument(f"--{name.replace('_', '-')}", type=type(value), default=value)
+
+    args = parser.parse_args()
+    load_source(args.source)
+
+    config = {
+        'seed': args.seed,
+        'policy': args.policy,
+        'script': args.script,
+        'scripts': load_scripts(args.script) if args.script else None,
+        'max_turns': args.max_turns,
+        'source': args.source,
+        'rules': {name: getattr(args, name) for name in defaults.to_dict()},
+    }
+    report = simulate(config, args.games, args.workers or os.cpu_count() or 1)
+    print_report(report)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+"""
+Per-game single-flight for Wonder of U turns
+Double submits and impatient retries must not trigger a second AI call or
+race on the game state: identical concurrent commands share one result and
+different commands for the same game are played one after another
+"""
+import asyncio
+import logging
+import os
+import secrets
+import threading
+import time
+from asgiref.sync import sync_to_async
+
+logger = logging.getLogger(__name__)
+
+STILL_PROCESSING = {
+    'success': False,
+    'processing': True,
+    'error': 'The forest is still answering your last command...'
+}
+
+class Turn:
+    """One request's place in a game's turn queue"""
+
+    __slots__ = ('game_id', 'command', 'leader', 'result', 'token', '_done')
+
+    def __init__(self, game_id, command, leader):
+        self.game_id = game_id
+        self.command = command
+        self.leader = leader
+        self.result = None
+        self.token = None
+        self._done = threading.Event()
+
+class TurnGate:
+    """Coalesces identical in-flight commands and serializes distinct ones
+
+    Within a process, a request whose command matches the game's in-flight
+    command waits for that turn and reuses its response payload; a
+    different command waits for the turn to finish and then plays its own.
+    Across processes (gunicorn workers) the game's turn lease in the
+    ``GameStateStore`` decides who plays; a request that cannot get the
+    lease before ``wait_timeout`` (or that duplicates the command another
+    worker is playing) gets ``STILL_PROCESSING`` instead of an AI call.
+    """
+
+    def __init__(self, store, wait_timeout=5.0, lease_ttl=45.0, poll_interval=0.05):
+        self.store = store
+        self.wait_timeout = wait_timeout
+        self.lease_ttl = lease_ttl
+        self.poll_interval = poll_interval
+        self.stats = {'leaders': 0, 'coalesced': 0, 'serialized': 0, 'rejected': 0}
+
+        self._lock = threading.Lock()
+        self._turns = {}
+        self._owner = None
+        self._owner_pid = None
+        self._sequence = 0
+
+    def _owner_id(self):
+        """A random ID per process, regenerated after a fork"""
+
+        if self._owner_pid != os.getpid():
+            self._owner = secrets.token_hex(8)
+            self._owner_pid = os.getpid()
+        return self._owner
+
+    def normalize(self, command):
+        return ' '.join(command.lower().split())
+
+    def enter(self, game_id, command):
+        """Join the game's turn queue
+
+        Returns a leader Turn (play it, then call ``finish``) or a follower
+        Turn whose ``result`` is the coalesced payload or STILL_PROCESSING.
+        """
+
+        command = self.normalize(command)
+        deadline = time.monotonic() + self.wait_timeout
+
+        while True:
+            turn, current = self._join(game_id, command)
+            if turn is not None:
+                break
+            remaining = deadline - time.monotonic()
+            finished = remaining > 0 and current._done.wait(remaining)
+            follower = self._follow(game_id, command, current, finished)
+            if follower is not None:
+                return follower
+
+        while True:
+            holder = self.store.claim_turn(game_id, self._owner_id(), turn.token, command, self.lease_ttl)
+            if self._claimed(turn, holder, deadline):
+                return turn
+            time.sleep(self.poll_interval)
+
+    async def aenter(self, game_id, command):
+        """Async ``enter``: waits on the event loop instead of parking a thread
+
+        Blocking waits in ``sync_to_async`` threads would starve the small
+        default executor that the leader needs to finish its own turn.
+        """
+
+        command = self.normalize(command)
+        deadline = time.monotonic() + self.wait_timeout
+
+        while True:
+            turn, current = self._join(game_id, command)
+            if turn is not None:
+                break
+            while not current._done.is_set() and time.monotonic() < deadline:
+                await asyncio.sleep(self.poll_interval)
+            follower = self._follow(game_id, command, current, current._done.is_set())
+            if follower is not None:
+                return follower
+
+        claim_turn = sync_to_async(self.store.claim_turn, thread_sensitive=False)
+        while True:
+            holder = await claim_turn(game_id, self._owner_id(), turn.token, command, self.lease_ttl)
+            if self._claimed(turn, holder, deadline):
+                return turn
+            await asyncio.sleep(self.poll_interval)
+
+    def _join(self, game_id, command):
+        """Become the game's in-process leader, or return the current turn"""
+
+        with self._lock:
+            current = self._turns.get(game_id)
+            if current is not None:
+                return None, current
+            turn = Turn(game_id, command, leader=True)
+            self._turns[game_id] = turn
+            self._sequence += 1
+            turn.token = f"{self._owner_id()}:{self._sequence}"
+            return turn, None
+
+    def _follow(self, game_id, command, current, finished):
+        """Outcome of waiting on another turn; None means try to lead again"""
+
+        if current.command == command:
+            follower = Turn(game_id, command, leader=False)
+            if finished and current.result is not None and current.result is not STILL_PROCESSING:
+                self.stats['coalesced'] += 1
+                follower.result = current.result
+            else:
+                self.stats['rejected'] += 1
+                follower.result = STILL_PROCESSING
+            return follower
+
+        if not finished:
+            self.stats['rejected'] += 1
+            follower = Turn(game_id, command, leader=False)
+            follower.result = STILL_PROCESSING
+            return follower
+
+        self.stats['serialized'] += 1
+        return None
+
+    def _claimed(self, turn, holder, deadline):
+        """Settle a lease claim; False means poll again"""
+
+        if holder is None:
+            self.stats['leaders'] += 1
+            return True
+
+        if holder == turn.command or time.monotonic() >= deadline:
+            # Another worker is playing this game; give up the local slot
+            self.stats['rejected'] += 1
+            turn.token = None
+            turn.leader = False
+            turn.result = STILL_PROCESSING
+            self._retire(turn)
+            return True
+
+        return False
+
+    def finish(self, turn, result):
+        """Publish the leader's payload to followers and release the game
+
+        The lease release may write to the store (always, when
+        GAME_STATE_FLUSH_INTERVAL is 0), so async views use ``afinish``.
+        """
+
+        if not turn.leader:
+            return
+        turn.result = result
+        if turn.token is not None:
+            try:
+                self.store.release_turn(turn.game_id, turn.token)
+            except Exception as e:
+                # The lease expires on its own after lease_ttl
+                logger.warning("Turn lease release failed: %s", e)
+        self._retire(turn)
+
+    async def afinish(self, turn, result):
+        """Async ``finish``: the lease release runs off the event loop"""
+
+        if turn.leader:
+            await sync_to_async(self.finish, thread_sensitive=False)(turn, result)
+
+    def _retire(self, turn):
+        with self._lock:
+            if self._turns.get(turn.game_id) is turn:
+                del self._turns[turn.game_id]
+        turn._done.set()
@@ -0,0 +1,221 @@
+"""
+Speculative turns for Wonder of U
+While the player is still typing, the command in the input box is played
+ahead of time on a copy of the game, so pressing Enter on it picks up a
+finished (or already running) turn instead of only then starting the
+upstream call. Nothing is saved until the command is submitted; a draft
+that changes or is never sent is dropped.
+"""
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from instrumentation import metrics
+from response_cache import normalize_command
+
+logger = logging.getLogger(__name__)
+
+class Speculation:
+    """One draft being played ahead of its submit"""
+
+    __slots__ = ('game_id', 'command', 'fingerprint', 'future', 'started')
+
+    def __init__(self, game_id, command, fingerprint, future):
+        self.game_id = game_id
+        self.command = command
+        self.fingerprint = fingerprint
+        self.future = future
+        self.started = time.monotonic()
+
+class Speculator:
+    """Plays drafts ahead of submit and hands the turn to the matching submit
+
+    ``start`` runs ``play(draft, state)`` on a background thread, where
+    ``state`` is a copy of the game and ``fingerprint`` the encoded game it
+    was copied from. ``claim`` returns what ``play`` returned when the
+    submitted command normalizes to the same words as the draft (see
+    ``response_cache.normalize_command``) and the game still matches the
+    fingerprint, waiting up to ``max_wait`` seconds for a turn still being
+    played. Any other submit drops the speculation, as does a ``play`` that
+    returns None or raises.
+
+    A game has one speculation at a time; a newer draft replaces it. Each
+    game may start ``session_burst`` speculations, refilled at
+    ``session_rate`` per second, and the whole host ``burst`` refilled at
+    ``rate`` per second; ``limiter`` is a ``take_token(key, rate, burst)``
+    such as admission control's, so both limits hold across workers. At
+    most ``max_in_flight`` drafts are played at once in this process.
+    Unclaimed speculations expire after ``ttl`` seconds.
+
+    A replaced draft whose upstream call has already started cannot stop
+    it; its answer still goes into the response cache.
+    """
+
+    OUTCOMES = ('started', 'capped', 'hit', 'miss', 'replaced', 'expired', 'failed')
+
+    def __init__(self, limiter, max_in_flight=4, rate=2.0, burst=10, session_rate=0.2,
+                 session_burst=3, max_wait=10.0, ttl=60.0, enabled=True):
+        self.limiter = limiter
+        self.max_in_flight = max_in_flight
+        self.rate = rate
+        self.burst = burst
+        self.session_rate = session_rate
+        self.session_burst = session_burst
+        self.max_wait = max_wait
+        self.ttl = ttl
+        self.enabled = enabled
+        self.stats = dict.fromkeys(self.OUTCOMES, 0)
+
+        self._games = {}
+        self._running = 0
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def start(self, game_id, draft, fingerprint, state, play):
+        """Start playing ``draft``; returns False if it was not started"""
+
+        command = normalize_command(draft)
+        if not self.enabled or not command:
+            return False
+
+        with self._lock:
+            self._expire()
+            current = self._games.get(game_id)
+            if current is not None and current.command == command and current.fingerprint == fingerprint:
+                return True
+            reserved = self._running < self.max_in_flight
+            if reserved:
+                self._running += 1
+
+        if not reserved or not self._allowed(game_id):
+            if reserved:
+                self._finished(None)
+            self._count('capped')
+            return False
+
+        # A fresh context per draft: the response source a turn reports must
+        # not carry over from the previous draft played on the same thread
+        future = self._pool().submit(contextvars.Context().run, play, draft, state)
+        future.add_done_callback(self._finished)
+
+        with self._lock:
+            previous = self._games.pop(game_id, None)
+            self._games[game_id] = Speculation(game_id, command, fingerprint, future)
+        if previous is not None:
+            self._drop(previous, 'replaced')
+        self._count('started')
+        return True
+
+    def claim(self, game_id, command, fingerprint):
+        """The speculated turn for this submit, or None to play it normally"""
+
+        speculation = self._take(game_id, command, fingerprint)
+        if speculation is None:
+            return None
+        try:
+            result = speculation.future.result(timeout=self.max_wait)
+        except Exception as e:
+            return self._failed(speculation, e)
+        return self._settle(result)
+
+    async def aclaim(self, game_id, command, fingerprint):
+        """Async ``claim``: waits for an unfinished turn on the event loop"""
+
+        speculation = self._take(game_id, command, fingerprint)
+        if speculation is None:
+            return None
+        try:
+            result = await asyncio.wait_for(asyncio.wrap_future(speculation.future), self.max_wait)
+        except Exception as e:
+            return self._failed(speculation, e)
+        return self._settle(result)
+
+    def snapshot(self):
+        """Counters of this worker; ``hit_rate`` is the share of started drafts that were submitted"""
+
+        with self._lock:
+            stats = dict(self.stats)
+            pending = len(self._games)
+            running = self._running
+        return {
+            'enabled': self.enabled,
+            'in_flight': running,
+            'pending': pending,
+            **stats,
+            'hit_rate': round(stats['hit'] / stats['started'], 3) if stats['started'] else None,
+        }
+
+    def _take(self, game_id, command, fingerprint):
+        """Remove the game's speculation, returning it if this submit may adopt it"""
+
+        if not self.enabled:
+            return None
+        with self._lock:
+            speculation = self._games.pop(game_id, None)
+        if speculation is None:
+            return None
+        if time.monotonic() - speculation.started > self.ttl:
+            self._drop(speculation, 'expired')
+            return None
+        if speculation.command != normalize_command(command) or speculation.fingerprint != fingerprint:
+            self._drop(speculation, 'miss')
+            return None
+        return speculation
+
+    def _settle(self, result):
+        self._count('hit' if result is not None else 'failed')
+        return result
+
+    def _failed(self, speculation, error):
+        logger.info("Speculative turn for %r failed: %s", speculation.command, error)
+        self._count('failed')
+        return None
+
+    def _allowed(self, game_id):
+        """Take a token from the game's and the host's speculation buckets"""
+
+        try:
+            return (self.limiter(f'session:speculate:{game_id}', self.session_rate, self.session_burst)
+                    and self.limiter('speculate', self.rate, self.burst))
+        except Exception as e:
+            # Speculation is optional: without a working limiter, don't
+            logger.warning("Speculation limiter error: %s", e)
+            return False
+
+    def _expire(self):
+        """Drop unclaimed speculations past their ``ttl`` (called with the lock held)"""
+
+        now = time.monotonic()
+        for game_id, speculation in list(self._games.items()):
+            if now - speculation.started > self.ttl:
+                del self._games[game_id]
+                speculation.future.cancel()
+                self._count('expired', locked=True)
+
+    def _drop(self, speculation, outcome):
+        # Only cancels drafts still waiting for a thread
+        speculation.future.cancel()
+        self._count(outcome)
+
+    def _finished(self, future):
+        with self._lock:
+            self._running -= 1
+
+    def _count(self, outcome, locked=False):
+        if locked:
+            self.stats[outcome] += 1
+        else:
+            with self._lock:
+                self.stats[outcome] += 1
+        metrics.inc('wonderofu_speculations_total', outcome=outcome)
+
+    def _pool(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_in_flight,
+                                                        thread_name_prefix='speculate')
+        return self._executor
@@ -0,0 +1,309 @@
+#!/usr/bin/env python
+"""
+Local stand-in for the Mistral chat completions API
+Speaks the same OpenAI-compatible protocol (streaming included) and answers
+with templated forest responses after a realistic, configurable delay, so
+the game can be developed, benchmarked and load-tested fully offline.
+
+    python standin_server.py --latency-median 0.8 --latency-p95 2.5
+    LLM_BACKEND=standin python manage.py runserver
+
+Every option can also be set through the matching STANDIN_* environment
+variable (e.g. STANDIN_ERROR_RATE=0.05).
+"""
+import argparse
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import keywords
+
+# Responses per keyword category, tried in this order; {action} is the
+# player's command. Creative commands sometimes concede, like the real model.
+TEMPLATES = {
+    'escape': [
+        "You run for the treeline, but it recedes with every step. The forest wants you to stay.",
+        "A path opens ahead - then folds shut behind a wall of thorns. Escape is not that simple.",
+        "The exit you saw was painted on the fog. Your hand passes through it into cold mist.",
+    ],
+    'return_home': [
+        "You think of home, and the trees rearrange themselves into its shape - hollow and silent.",
+        "Every road home bends back to the same clearing. The forest hums, amused.",
+    ],
+    'creative': [
+        "The forest pauses, as if listening. Something in the canopy shifts toward you.",
+        "Your gesture confuses the spirit. Roots loosen their grip for a moment.",
+        "Even the forest seems surprised. A narrow trail of moonlight appears.",
+        "The trees sway in time with you. The darkness feels less hostile.",
+    ],
+    'fire': ["The wood hisses and refuses to burn. Smoke coils into a mocking face."],
+    'weapon': ["Your weapon turns to brittle bark in your hands and crumbles away."],
+    'movement': [
+        "You walk for what feels like hours. The same twisted oak greets you again.",
+        "The ground tilts, sliding you gently back to where you started.",
+    ],
+    'climbing': ["Each branch you grab bends downward, lowering you back to the roots."],
+    'shouting': ["Your voice returns to you a moment later, laughing in your own tone."],
+    'darkness': ["The shadows pull back, then gather behind you, thicker than before."],
+    'signal': ["Fog rolls in and swallows your signal whole."],
+}
+GENERIC = [
+    "The forest holds its breath. Then the trees lean closer, watching you {action}.",
+    "You try to {action}. Somewhere underground, something rumbles in disapproval.",
+    "The light dims as you {action}. Whispers circle you, just out of reach.",
+]
+
+class StandInConfig:
+    """Latency, throughput and failure behaviour of the stand-in"""
+
+    def __init__(self, latency_median=0.8, latency_p95=2.0, tokens_per_second=40.0,
+                 error_rate=0.0, rate_limit_rate=0.0, retry_after=1.0, max_concurrency=0,
+                 seed=None):
+        self.latency_median = latency_median
+        self.latency_p95 = latency_p95
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.max_concurrency = max_concurrency
+        self.random = random.Random(seed)
+
+        # Log-normal time to first token with the requested median and p95
+        self._mu = math.log(max(latency_median, 1e-6))
+        spread = max(latency_p95, latency_median) / max(latency_median, 1e-6)
+        self._sigma = math.log(spread) / 1.645 if spread > 1 else 0.0
+
+    def first_token_delay(self):
+        return self.random.lognormvariate(self._mu, self._sigma) if self._sigma else self.latency_median
+
+    def token_interval(self):
+        return 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+def forest_response(user_prompt, rng=random):
+    """Pick a templated response for the player action in the user prompt"""
+
+    match = re.search(r'PLAYER ACTION:\s*(.+)', user_prompt)
+    action = match.group(1).strip() if match else 'move'
+
+    categories = keywords.classify(action)
+    for category, templates in TEMPLATES.items():
+        if category in categories:
+            return rng.choice(templates).format(action=action)
+    return rng.choice(GENERIC).format(action=action)
+
+def tokenize(text):
+    """Split into word-sized tokens that concatenate back to the text"""
+
+    return re.findall(r'\S+\s*', text)
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Chat completions handler; keeps connections alive like the real API"""
+
+    protocol_version = 'HTTP/1.1'
+    server_version = 'ForestStandIn/1.0'
+
+    def do_HEAD(self):
+        # Connection warm-up sends HEAD; answer like the real endpoint does
+        self.send_response(405)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_GET(self):
+        if self.path.rstrip('/') != '/health':
+            return self._send_json(404, {'error': 'not found'})
+        with self.server.lock:
+            stats = dict(self.server.stats)
+        self._send_json(200, stats)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            return self._send_json(400, {'error': 'invalid JSON body'})
+
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            return self._send_json(404, {'error': 'not found'})
+
+        config = self.server.config
+        with self.server.lock:
+            self.server.stats['requests'] += 1
+            over_capacity = config.max_concurrency and self.server.stats['in_flight'] >= config.max_concurrency
+            self.server.stats['in_flight'] += 1
+
+        try:
+            roll = config.random.random()
+            if over_capacity or roll < config.rate_limit_rate:
+                self._count('rate_limited')
+                return self._send_json(429, {'error': 'rate limit exceeded'},
+                                       {'Retry-After': f"{config.retry_after:g}"})
+            if roll < config.rate_limit_rate + config.error_rate:
+                self._count('errors')
+                time.sleep(config.first_token_delay() / 4)
+                return self._send_json(500, {'error': 'internal server error'})
+
+            messages = body.get('messages') or [{}]
+            content = forest_response(messages[-1].get('content', ''), config.random)
+            tokens = tokenize(content)
+            time.sleep(config.first_token_delay())
+
+            if body.get('stream'):
+                self._stream(body, tokens)
+            else:
+                time.sleep(config.token_interval() * len(tokens))
+                self._send_json(200, self._completion(body, content, len(tokens)))
+            self._count('completed')
+        finally:
+            with self.server.lock:
+                self.server.stats['in_flight'] -= 1
+
+    def _usage(self, body, completion_tokens):
+        prompt_tokens = sum(len(tokenize(m.get('content', ''))) for m in body.get('messages', []))
+        return {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens,
+        }
+
+    def _completion(self, body, content, completion_tokens):
+        return {
+            'id': f"cmpl-{uuid.uuid4().hex}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': body.get('model', 'forest-standin'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': content},
+                'finish_reason': 'stop',
+            }],
+            'usage': self._usage(body, completion_tokens),
+        }
+
+    def _stream(self, body, tokens):
+        """Send the response as chat.completion.chunk SSE events, chunked"""
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        completion_id = f"cmpl-{uuid.uuid4().hex}"
+        interval = self.server.config.token_interval()
+
+        def chunk(delta, finish_reason=None, usage=None):
+            event = {
+                'id': completion_id,
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': body.get('model', 'forest-standin'),
+                'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}],
+            }
+            if usage:
+                event['usage'] = usage
+            self._write_chunk(f"data: {json.dumps(event)}\n\n")
+
+        chunk({'role': 'assistant', 'content': ''})
+        for index, token in enumerate(tokens):
+            if index:
+                time.sleep(interval)
+            chunk({'content': token})
+        # Like Mistral, report usage on the final chunk
+        chunk({}, 'stop', self._usage(body, len(tokens)))
+        self._write_chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def _write_chunk(self, text):
+        data = text.encode('utf-8')
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _count(self, name):
+        with self.server.lock:
+            self.server.stats[name] += 1
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address, config, verbose=False):
+        super().__init__(address, StandInHandler)
+        self.config = config
+        self.verbose = verbose
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'completed': 0, 'errors': 0, 'rate_limited': 0, 'in_flight': 0}
+
+def serve(host='127.0.0.1', port=8088, config=None, verbose=False):
+    """Create the stand-in server (call ``serve_forever`` to run it)"""
+
+    return StandInServer((host, port), config or StandInConfig(), verbose=verbose)
+
+def main():
+    def env(name, default):
+        return os.getenv(f"STANDIN_{name.upper()}", default)
+
+    parser = argparse.ArgumentParser(description="Local stand-in for the Mistral chat completions API")
+    parser.add_argument('--host', default=env('host', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(env('port', '8088')))
+    parser.add_argument('--latency-median', type=float, default=float(env('latency_median', '0.8')),
+                        help="median seconds to first token")
+    parser.add_argument('--latency-p95', type=float, default=float(env('latency_p95', '2.0')),
+                        help="95th percentile seconds to first token")
+    parser.add_argument('--tokens-per-second', type=float, default=float(env('tokens_per_second', '40')),
+                        help="generation speed after the first token (0 = instant)")
+    parser.add_argument('--error-rate', type=float, default=float(env('error_rate', '0')),
+                        help="fraction of requests answered with HTTP 500")
+    parser.add_argument('--rate-limit-rate', type=float, default=float(env('rate_limit_rate', '0')),
+                        help="fraction of requests answered with HTTP 429")
+    parser.add_argument('--retry-after', type=float, default=float(env('retry_after', '1')),
+                        help="Retry-After seconds sent with 429s")
+    parser.add_argument('--max-concurrency', type=int, default=int(env('max_concurrency', '0')),
+                        help="answer 429 beyond this many requests in flight (0 = unlimited)")
+    parser.add_argument('--seed', type=int, default=env('seed', None))
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    config = StandInConfig(
+        latency_median=args.latency_median,
+        latency_p95=args.latency_p95,
+        tokens_per_second=args.tokens_per_second,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+        max_concurrency=args.max_concurrency,
+        seed=None if args.seed is None else int(args.seed),
+    )
+    server = serve(args.host, args.port, config, verbose=args.verbose)
+    print(f"Forest stand-in listening on http://{args.host}:{args.port}/v1/chat/completions")
+    print(f"First token: median {args.latency_median}s, p95 {args.latency_p95}s; "
+          f"{args.tokens_per_second:g} tokens/s; errors {args.error_rate:.0%}, 429s {args.rate_limit_rate:.0%}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
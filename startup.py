@@ -0,0 +1,44 @@
+"""
+Process startup for Wonder of U
+What a server process does before its first player. ``prepare`` only
+imports and compiles, so under gunicorn.conf.py it runs once in the master
+and the forked workers share the result copy-on-write. ``warm_up`` opens
+network connections, which must not be shared across a fork, so there it
+runs in each worker instead.
+"""
+import os
+
+# Set by gunicorn.conf.py: the app is imported in the master, then forked
+PRELOAD_ENV = 'WONDEROFU_PRELOAD'
+
+def preloaded():
+    """True when the app is loaded in a pre-forking master"""
+
+    return os.environ.get(PRELOAD_ENV) == 'True'
+
+def prepare():
+    """Import the views and AI service and compile the page template
+
+    Django otherwise does both on the first request. The AI service's
+    connection pools, stores and background threads are all created lazily
+    in whichever process first uses them, so this is safe before a fork.
+    """
+
+    from django.template.loader import get_template
+    from django.urls import get_resolver
+
+    get_resolver().url_patterns
+    get_template('index.html')
+
+def warm_up():
+    """Open pooled connections to the AI backend for this process
+
+    The first player's command then doesn't pay for DNS, TCP and TLS setup.
+    The async views use their own client, created on the event loop.
+    """
+
+    from django.conf import settings
+    import ai_service
+
+    if settings.MISTRAL_WARM_UP and not settings.ASYNC_VIEWS and ai_service.mistral_ai.router.endpoints:
+        ai_service.mistral_ai.warm_up()
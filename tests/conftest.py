@@ -0,0 +1,27 @@
+"""
+Test setup: Django settings with throwaway stores and no upstream
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Nothing under test may reach the upstream or the shared stores
+os.environ.update(
+    DJANGO_SETTINGS_MODULE='settings',
+    RUNTIME_DIR=tempfile.mkdtemp(prefix='wonderofu-tests-'),
+    MISTRAL_API_KEY='',
+    LLM_BACKEND='mistral',
+    LLM_ENDPOINTS='',
+    CALAMITY_POOL_ENABLED='False',
+    RESPONSE_CACHE_ENABLED='False',
+    INTENT_ROUTING_ENABLED='False',
+    METRICS_ENABLED='False',
+    TRANSCRIPTS_ENABLED='False',
+    GAME_STATE_FLUSH_INTERVAL='0',
+)
+
+import django
+
+django.setup()
@@ -0,0 +1,38 @@
+import asyncio
+
+from django.test import override_settings
+
+from ai_service import MistralAI
+from engine import OUTCOME_TEXTS
+from game_state import GameState
+from llm_backends import get_backend
+
+def _limited_service(tmp_path):
+    """A service whose admission control refuses every player's call"""
+
+    with override_settings(ADMISSION_PATH=tmp_path / 'admission.sqlite3',
+                           ADMISSION_SESSION_RATE=0.001, ADMISSION_SESSION_BURST=0):
+        return MistralAI(backend=get_backend('standin'))
+
+def test_a_rate_limited_creative_command_does_not_win(tmp_path):
+    ai = _limited_service(tmp_path)
+    state = GameState(last_input='dance', escape_attempts=2)
+
+    response = ai.generate_response('dance', state, player='game')
+    assert response != OUTCOME_TEXTS['fallback_persistence']
+    assert not state['game_over'] and not state['victory']
+    assert ai.stats['shed'] == 1
+
+def test_a_rate_limited_creative_command_does_not_win_async(tmp_path):
+    ai = _limited_service(tmp_path)
+    state = GameState(last_input='dance', escape_attempts=2)
+
+    asyncio.run(ai.agenerate_response('dance', state, player='game'))
+    assert not state['game_over'] and not state['victory']
+
+def test_an_unanswered_creative_command_still_wins_without_the_ai(tmp_path):
+    ai = MistralAI(backend=get_backend('standin', base_url='http://127.0.0.1:9/v1/chat/completions'))
+    state = GameState(last_input='dance', escape_attempts=2)
+
+    assert ai.generate_response('dance', state) == OUTCOME_TEXTS['fallback_persistence']
+    assert state['victory']
@@ -0,0 +1,31 @@
+import random
+
+import intent
+import standin_server
+from context_window import ContextWindow, count_tokens
+
+def _play(window, state, turns, seed=1):
+    rng = random.Random(seed)
+    commands = [command for examples in intent.SEED_COMMANDS.values() for command in examples]
+    for _ in range(turns):
+        command = rng.choice(commands)
+        window.record(state, command, standin_server.forest_response(f"PLAYER ACTION: {command}", rng))
+
+def test_memory_stays_in_budget_and_size_matches_render():
+    window = ContextWindow()
+    state = {}
+    for _ in range(60):
+        _play(window, state, 1, seed=len(state.get('recent_actions', [])))
+        rendered = count_tokens(window.render(state))
+        assert rendered <= window.budget
+        recent = sum(count_tokens(turn) for turn in state['recent_actions'])
+        assert window.size(count_tokens(window.render_summary(state['summary'])), recent) == rendered
+
+def test_long_history_is_folded_in_one_pass():
+    window = ContextWindow()
+    state = {'recent_actions': [f"Player: {'wander ' * 40}| Forest: {'the trees lean closer ' * 20}"] * 1000}
+    window.record(state, 'look around', 'The trees lean closer.')
+
+    assert state['recent_actions'][-1] == 'Player: look around | Forest: The trees lean closer.'
+    assert count_tokens(window.render(state)) <= window.budget
+    assert state['summary']['notes']
@@ -0,0 +1,246 @@
+import random
+
+import pytest
+
+import keywords
+import simulate
+from context_window import ContextWindow
+from engine import (ERROR_ESCAPE_TEXT, GENERIC_RESPONSES, LOST_TEXT, OUTCOME_TEXTS,
+                    TEMPLATE_RESPONSES, WON_TEXT, GameEngine, Rules)
+from game_state import GameState
+
+def _engine(seed=1, **rules):
+    return GameEngine(rules=Rules(**rules), rng=random.Random(seed))
+
+def _stubborn(command, state):
+    return "The trees lean closer.", 'ai'
+
+def _no_answer(command, state):
+    return None
+
+# --- resolve ----------------------------------------------------------------
+
+def test_a_second_solution_command_wins_before_the_ai_is_asked():
+    engine = _engine()
+    state = GameState()
+    assert engine.resolve('thank the forest', state) is None
+    assert state['creative_attempts'] == 1
+
+    assert engine.resolve('plant a tree', state) == (OUTCOME_TEXTS['solution'], 'solution')
+    assert state['victory'] and state['game_over']
+
+def test_the_game_is_lost_at_the_escape_attempt_limit():
+    engine = _engine(max_escape_attempts=4)
+    assert engine.resolve('look around', GameState(escape_attempts=3)) is None
+
+    state = GameState(escape_attempts=4)
+    assert engine.resolve('look around', state) == (OUTCOME_TEXTS['exhausted'], 'exhausted')
+    assert state['game_over'] and not state['victory']
+
+def test_a_winning_solution_beats_the_attempt_limit():
+    state = GameState(escape_attempts=10, creative_attempts=1)
+    assert _engine().resolve('thank the forest', state)[1] == 'solution'
+
+def test_commands_after_the_end_only_repeat_the_result():
+    engine = _engine()
+    assert engine.resolve('leave', GameState(game_over=True, victory=True)) == (WON_TEXT, 'over')
+    assert engine.resolve('leave', GameState(game_over=True)) == (LOST_TEXT, 'over')
+
+# --- apply_response ---------------------------------------------------------
+
+def test_an_answer_that_concedes_wins():
+    engine = _engine()
+    state = GameState(last_input='look around')
+    response, outcome = engine.apply_response("Brilliant. You break free of the roots.", state)
+    assert outcome == 'conceded'
+    assert response == OUTCOME_TEXTS['outsmarted']
+    assert state['victory'] and state['game_over']
+
+def test_a_creative_command_wins_after_enough_escape_attempts():
+    engine = _engine()
+    state = GameState(last_input='dance', escape_attempts=2)
+    assert engine.apply_response("The trees sway.", state)[1] is None
+
+    state = GameState(last_input='dance', escape_attempts=3)
+    assert engine.apply_response("The trees sway.", state)[1] == 'persistence'
+
+def test_breakthroughs_follow_the_rules_and_the_seeded_rng():
+    always = _engine(breakthrough_chance=1.0)
+    assert always.apply_response("Silence.", GameState(last_input='wait', escape_attempts=4))[1] is None
+    assert always.apply_response("Silence.", GameState(last_input='wait', escape_attempts=5))[1] == 'breakthrough'
+
+    never = _engine(breakthrough_chance=0.0)
+    assert never.apply_response("Silence.", GameState(last_input='wait', escape_attempts=9))[1] is None
+
+    def outcomes(seed):
+        engine = _engine(seed)
+        return [engine.apply_response("Silence.", GameState(last_input='wait', escape_attempts=6))[1]
+                for _ in range(200)]
+    assert outcomes(7) == outcomes(7)
+    assert 'breakthrough' in outcomes(7)
+
+def test_escape_attempts_are_counted_and_the_turn_remembered():
+    engine = _engine()
+    state = GameState(last_input='find the way out')
+    engine.apply_response("The path loops back.", state)
+    state['last_input'] = 'go home'
+    engine.apply_response("There is no home here.", state)
+    state['last_input'] = 'look around'
+    engine.apply_response("Trees, and more trees.", state)
+
+    assert state['escape_attempts'] == 2
+    assert len(state['recent_actions']) == 3
+    assert state['recent_actions'][0].startswith('Player: find the way out | Forest: ')
+
+# --- update_items -----------------------------------------------------------
+
+def test_items_are_picked_up_once():
+    engine = _engine()
+    state = GameState()
+    engine.update_items('search my pockets', state)
+    engine.update_items('search my pockets', state)
+    engine.update_items('search the ground', state)
+    engine.update_items('search the ground', state)
+    assert state['items'] == ['flashlight', 'stick']
+
+def test_the_forest_breaks_the_flashlight_after_enough_escape_attempts():
+    engine = _engine()
+    state = GameState(items=['flashlight', 'stick'], escape_attempts=3)
+    engine.update_items('use flashlight', state)
+    assert state['items'] == ['flashlight', 'stick']
+
+    state['escape_attempts'] = 4
+    engine.update_items('use flashlight', state)
+    assert state['items'] == ['stick']
+
+# --- whole turns ------------------------------------------------------------
+
+def test_an_unknown_command_changes_nothing_but_the_memory():
+    turn = _engine().play(GameState(escape_attempts=2, items=['stick']), 'xyzzy plugh', _stubborn)
+    assert turn.outcome is None
+    assert turn.source == 'ai'
+    assert turn.state['escape_attempts'] == 2
+    assert turn.state['items'] == ['stick']
+    assert turn.state['recent_actions'] == ["Player: xyzzy plugh | Forest: The trees lean closer."]
+
+def test_an_unknown_command_without_an_answer_gets_a_seeded_generic_fallback():
+    def response(seed):
+        return _engine(seed).play(GameState(), 'xyzzy plugh', _no_answer).response
+
+    assert response(3) in GENERIC_RESPONSES
+    assert response(3) == response(3)
+    assert _engine().play(GameState(), 'climb a tree', _no_answer).response == TEMPLATE_RESPONSES['climbing']
+
+def test_play_leaves_the_given_state_alone():
+    state = GameState(escape_attempts=1)
+    turn = _engine().play(state, 'leave', _stubborn)
+    assert turn.state['escape_attempts'] == 2
+    assert state['escape_attempts'] == 1
+    assert state['recent_actions'] == []
+
+def test_a_failed_turn_still_counts_an_escape_attempt():
+    state = GameState()
+    assert _engine().error_response('escape', state) == ERROR_ESCAPE_TEXT
+    assert state['escape_attempts'] == 1
+
+# --- regression against the rules before the engine ------------------------
+
+def legacy_turn(state, command, respond, rng, context):
+    """One turn as views.py and ai_service.py played it before engine.py
+
+    resolve_without_ai, MistralAI._post_process_response and
+    _fallback_response (with no calamity pool), then update_player_items,
+    with the module-level ``random`` swapped for the game's RNG.
+    """
+
+    state['last_input'] = command
+    if state.get('game_over', False):
+        return 'over'
+
+    categories = keywords.classify(command)
+    for solution_group in keywords.SOLUTION_CATEGORIES:
+        if solution_group in categories:
+            state['creative_attempts'] = state.get('creative_attempts', 0) + 1
+            if state['creative_attempts'] >= 2:
+                state['victory'] = True
+                state['game_over'] = True
+                return 'solution'
+
+    if state.get('escape_attempts', 0) >= 10:
+        state['game_over'] = True
+        return 'exhausted'
+
+    outcome = None
+    reply = respond(command, state)
+    if reply is None:
+        if 'creative' in categories and state.get('escape_attempts', 0) >= 2:
+            state['game_over'] = True
+            state['victory'] = True
+            outcome = 'fallback_persistence'
+        else:
+            category = next((name for name in keywords.FALLBACK_CATEGORIES if name in categories), 'generic')
+            if category not in TEMPLATE_RESPONSES:
+                rng.choice(GENERIC_RESPONSES)
+    else:
+        content, _ = reply
+        escape_attempts = state.get('escape_attempts', 0)
+        if 'victory_phrase' in keywords.classify(content):
+            outcome = 'conceded'
+        elif 'creative' in keywords.classify(command.lower()) and escape_attempts >= 3:
+            outcome = 'persistence'
+        elif escape_attempts >= 5 and rng.random() < 0.05:
+            outcome = 'breakthrough'
+        if outcome is not None:
+            state['game_over'] = True
+            state['victory'] = True
+            content = OUTCOME_TEXTS['outsmarted']
+        if 'escape' in categories or 'return_home' in categories:
+            state['escape_attempts'] = state.get('escape_attempts', 0) + 1
+        context.record(state, command, content)
+
+    items = state.get('items', [])
+    if 'item_search' in categories:
+        if 'flashlight' not in items and 'item_pocket' in categories:
+            items.append('flashlight')
+        elif 'stick' not in items and 'item_ground' in categories:
+            items.append('stick')
+    if 'use_flashlight' in categories and 'flashlight' in items:
+        if state.get('escape_attempts', 0) > 3:
+            items.remove('flashlight')
+    state['items'] = items
+    return outcome
+
+def legacy_play_game(index, config):
+    """``simulate.play_game`` with every turn played by ``legacy_turn``"""
+
+    rng = random.Random(f"{config['seed']}:{index}")
+    respond = simulate.load_source(config['source'])(rng)
+    policy = config['policy']
+    if policy == 'mixed':
+        policy = rng.choice(sorted(simulate.POLICIES))
+    commands = simulate.random_player(simulate.POLICIES[policy], rng, config['max_turns'])
+
+    state = GameState()
+    context = ContextWindow()
+    turns = 0
+    for command in commands:
+        outcome = legacy_turn(state, command, respond, rng, context)
+        turns += 1
+        if outcome is not None:
+            return outcome, turns
+    return None, turns
+
+@pytest.mark.parametrize('source', sorted(simulate.SOURCES))
+def test_simulated_games_end_as_they_did_before_the_engine(source):
+    config = {
+        'seed': 1,
+        'policy': 'mixed',
+        'script': None,
+        'scripts': None,
+        'max_turns': 40,
+        'source': source,
+        'rules': Rules().to_dict(),
+    }
+    games = range(300)
+    assert [simulate.play_game(index, config) for index in games] == \
+        [legacy_play_game(index, config) for index in games]
@@ -0,0 +1,48 @@
+import sqlite3
+import time
+
+from response_cache import ResponseCache
+
+def _cache(tmp_path, **options):
+    return ResponseCache(tmp_path / 'cache.sqlite3', variants=2, flush_interval=3600, **options)
+
+def test_lookups_read_while_another_worker_holds_the_write_lock(tmp_path):
+    cache = _cache(tmp_path)
+    cache.put('key', 'one')
+    cache.put('key', 'two')
+
+    writer = sqlite3.connect(cache.path, isolation_level=None)
+    writer.execute('BEGIN IMMEDIATE')
+    try:
+        started = time.monotonic()
+        assert cache.get('key') in ('one', 'two')
+        assert cache.get('other') is None
+        assert time.monotonic() - started < 1
+    finally:
+        writer.execute('ROLLBACK')
+
+def test_counters_are_flushed_in_batches(tmp_path):
+    cache = _cache(tmp_path)
+    cache.put('key', 'one')
+    assert cache.get('key') is None
+    cache.put('key', 'two')
+    assert cache.get('key') is not None
+
+    stored = dict(cache._connect().execute('SELECT name, value FROM counters').fetchall())
+    assert stored.get('misses') == 1
+    assert 'hits' not in stored
+
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses']) == (1, 1)
+
+def test_expired_entries_miss_and_are_refilled(tmp_path):
+    cache = _cache(tmp_path, ttl=0.5)
+    cache.put('key', 'old')
+    cache.put('key', 'old')
+    time.sleep(0.6)
+    assert cache.get('key') is None
+
+    cache.put('key', 'new')
+    row = cache._connect().execute('SELECT variants FROM responses WHERE key = ?', ('key',)).fetchone()
+    assert row[0] == '["new"]'
+    assert cache.stats()['expired'] == 1
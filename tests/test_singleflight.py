@@ -0,0 +1,26 @@
+import asyncio
+import threading
+
+from game_state import GameStateStore
+from singleflight import TurnGate
+
+class RecordingStore(GameStateStore):
+    """A write-through store noting which thread releases each lease"""
+
+    def release_turn(self, game_id, token):
+        self.released_on = threading.current_thread()
+        super().release_turn(game_id, token)
+
+def test_async_finish_releases_the_lease_off_the_event_loop(tmp_path):
+    store = RecordingStore(tmp_path / 'games.sqlite3', flush_interval=0)
+    gate = TurnGate(store)
+
+    async def play():
+        turn = await gate.aenter('game', 'look around')
+        assert turn.leader
+        await gate.afinish(turn, {'success': True})
+        return threading.current_thread()
+
+    loop_thread = asyncio.run(play())
+    assert store.released_on is not loop_thread
+    assert gate.enter('game', 'look around').leader
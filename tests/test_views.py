@@ -0,0 +1,51 @@
+from django.test import Client, override_settings
+
+def test_index_carries_no_session():
+    client = Client()
+    client.post('/process-input/', {'user_input': 'search my pockets'})
+    assert client.cookies.get('sessionid')
+
+    first = client.get('/')
+    again = client.get('/', HTTP_IF_NONE_MATCH=first['ETag'])
+
+    assert first.status_code == 200
+    assert again.status_code == 304
+    for response in (first, again):
+        assert 'sessionid' not in response.cookies
+        assert 'Cookie' not in response.get('Vary', '')
+        assert 'public' in response['Cache-Control']
+
+def test_state_revalidates_and_follows_the_game():
+    client = Client()
+    fresh = client.get('/state/')
+    assert fresh.json()['items'] == []
+    assert client.get('/state/', HTTP_IF_NONE_MATCH=fresh['ETag']).status_code == 304
+
+    client.post('/process-input/', {'user_input': 'search my pockets'})
+    played = client.get('/state/', HTTP_IF_NONE_MATCH=fresh['ETag'])
+    assert played.status_code == 200
+    assert played.json()['items'] == ['flashlight']
+
+def test_commands_renew_the_session_cookie():
+    client = Client()
+    client.post('/process-input/', {'user_input': 'look around'})
+    response = client.post('/process-input/', {'user_input': 'look around again'})
+    assert 'sessionid' in response.cookies
+
+def test_index_preloads_only_the_regular_font():
+    html = Client().get('/').content.decode()
+    preloads = [line for line in html.splitlines() if 'rel="preload"' in line]
+    assert len(preloads) == 1
+    assert 'space-mono-400' in preloads[0] and 'type="font/woff2"' in preloads[0]
+
+def test_status_endpoints_need_the_token():
+    client = Client()
+    with override_settings(STATUS_TOKEN='s3cret'):
+        for path in ('/metrics', '/status/ai/'):
+            assert client.get(path).status_code == 404
+            assert client.get(path, {'token': 'wrong'}).status_code == 404
+            assert client.get(path, HTTP_AUTHORIZATION='Bearer s3cret').status_code == 200
+            assert client.get(path, {'token': 's3cret'}).status_code == 200
+
+    with override_settings(STATUS_TOKEN=''):
+        assert client.get('/metrics', {'token': ''}).status_code == 404
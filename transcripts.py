@@ -0,0 +1,293 @@
+"""
+Game transcripts for Wonder of U
+Every turn - the command, the full response, what it changed in the game,
+how long it took and where the answer came from - appended to a WAL-mode
+SQLite log by a background writer, so games can be analyzed and replayed
+against any backend without the request path ever waiting on disk
+
+    python transcripts.py stats
+    python transcripts.py games [N]
+    python transcripts.py show GAME_ID
+    python transcripts.py replay GAME_ID [BACKEND [BASE_URL [MODEL]]]
+    python transcripts.py compact
+"""
+import atexit
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from game_state import FIELDS, GameState
+
+logger = logging.getLogger(__name__)
+
+def state_delta(before, after):
+    """The fields that differ between two encoded game states, with their new values"""
+
+    return {field: new for field, old, new in zip(FIELDS, json.loads(before), json.loads(after)) if old != new}
+
+class TranscriptStore:
+    """Append-only turn log with batched, write-behind inserts
+
+    ``append`` only queues the turn in memory; a writer thread inserts the
+    queue in one transaction every ``flush_interval`` seconds (or as soon as
+    ``batch_size`` turns are waiting). At most ``max_pending`` turns wait in
+    memory; beyond that new turns are dropped and counted rather than ever
+    blocking a player. Turns older than ``retention`` seconds, and the
+    oldest beyond ``max_turns``, are deleted every ``compact_interval``
+    seconds, and the freed pages returned to the file system.
+    """
+
+    def __init__(self, path, flush_interval=1.0, batch_size=500, max_pending=10000,
+                 retention=30 * 86400, max_turns=500000, compact_interval=300, enabled=True):
+        self.path = str(path)
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.retention = retention
+        self.max_turns = max_turns
+        self.compact_interval = compact_interval
+        self.enabled = enabled
+
+        self._local = threading.local()
+        self._pending = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._writer = None
+        self._writer_pid = None
+        self._last_compact = time.time()
+        self.stats = {'appended': 0, 'dropped': 0, 'written': 0, 'flushes': 0}
+
+        atexit.register(self.flush)
+
+    def _connect(self):
+        """Return this thread's connection, reopening it after a fork"""
+
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            # Only takes effect on a new file, before the first table exists
+            conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS turns (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    game_id TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    user_input TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    source TEXT NOT NULL,
+                    backend TEXT NOT NULL,
+                    latency_ms REAL NOT NULL,
+                    delta TEXT NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS turns_game ON turns (game_id, id)')
+            conn.execute('CREATE INDEX IF NOT EXISTS turns_created ON turns (created)')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def append(self, game_id, user_input, response, source, backend, latency, before, after):
+        """Queue one turn; ``before``/``after`` are the game's encoded states around it
+
+        Returns False if the turn was dropped because the queue is full.
+        """
+
+        if not self.enabled:
+            return True
+        row = (game_id, time.time(), user_input, response or '', source, backend, round(latency * 1000, 1), before, after)
+        with self._lock:
+            if len(self._pending) >= self.max_pending:
+                self.stats['dropped'] += 1
+                return False
+            self._pending.append(row)
+            pending = len(self._pending)
+        self.stats['appended'] += 1
+
+        self._ensure_writer()
+        if pending >= self.batch_size:
+            self._wake.set()
+        return True
+
+    def flush(self):
+        """Insert every queued turn now"""
+
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        rows = [
+            (*row[:7], json.dumps(state_delta(row[7], row[8]), separators=(',', ':')))
+            for row in batch
+        ]
+        try:
+            conn = self._connect()
+            with conn:
+                conn.execute('BEGIN IMMEDIATE')
+                conn.executemany(
+                    'INSERT INTO turns (game_id, created, user_input, response, source, backend, latency_ms, delta) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    rows
+                )
+        except Exception:
+            # Keep the batch (ahead of newer turns) for the next flush
+            with self._lock:
+                self._pending[:0] = batch[:max(0, self.max_pending - len(self._pending))]
+            raise
+        self.stats['flushes'] += 1
+        self.stats['written'] += len(batch)
+
+    def compact(self):
+        """Apply the retention limits and give the freed space back"""
+
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            deleted = conn.execute('DELETE FROM turns WHERE created < ?', (time.time() - self.retention,)).rowcount
+            newest = conn.execute('SELECT MAX(id) FROM turns').fetchone()[0]
+            if newest is not None and self.max_turns > 0:
+                # AUTOINCREMENT ids never go back, so the newest max_turns ids are the ones to keep
+                deleted += conn.execute('DELETE FROM turns WHERE id <= ?', (newest - self.max_turns,)).rowcount
+        # executescript steps the pragma to completion (execute frees one page)
+        conn.executescript('PRAGMA incremental_vacuum;')
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        return deleted
+
+    def _ensure_writer(self):
+        """Start the writer thread on first use in each (forked) process"""
+
+        if self._writer_pid == os.getpid() and self._writer.is_alive():
+            return
+        with self._lock:
+            if self._writer_pid == os.getpid() and self._writer.is_alive():
+                return
+            self._writer = threading.Thread(target=self._run_writer, name='transcript-writer', daemon=True)
+            self._writer_pid = os.getpid()
+            self._writer.start()
+
+    def _run_writer(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+                if time.time() - self._last_compact > self.compact_interval:
+                    self._last_compact = time.time()
+                    self.compact()
+            except Exception as e:
+                logger.warning("Transcript flush error: %s", e)
+
+    # --- Reading -----------------------------------------------------------
+
+    def turns(self, game_id):
+        """The game's turns, oldest first, as dicts (``delta`` decoded)"""
+
+        rows = self._connect().execute(
+            'SELECT id, created, user_input, response, source, backend, latency_ms, delta '
+            'FROM turns WHERE game_id = ? ORDER BY id', (game_id,)
+        ).fetchall()
+        keys = ('id', 'created', 'user_input', 'response', 'source', 'backend', 'latency_ms', 'delta')
+        turns = [dict(zip(keys, row)) for row in rows]
+        for turn in turns:
+            turn['delta'] = json.loads(turn['delta'])
+        return turns
+
+    def commands(self):
+        """Every distinct command recorded"""
+
+        return [row[0] for row in self._connect().execute('SELECT DISTINCT user_input FROM turns')]
+
+    def games(self, limit=20):
+        """The most recently played games: ``(game_id, turns, last_played)``"""
+
+        return self._connect().execute(
+            'SELECT game_id, COUNT(*), MAX(created) FROM turns GROUP BY game_id '
+            'ORDER BY MAX(created) DESC LIMIT ?', (limit,)
+        ).fetchall()
+
+    def summary(self):
+        conn = self._connect()
+        turns, games, oldest = conn.execute(
+            'SELECT COUNT(*), COUNT(DISTINCT game_id), MIN(created) FROM turns'
+        ).fetchone()
+        page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+        pages = conn.execute('PRAGMA page_count').fetchone()[0]
+        return {
+            'turns': turns,
+            'games': games,
+            'oldest_age': round(time.time() - oldest) if oldest else None,
+            'bytes': page_size * pages,
+            'by_source': dict(conn.execute('SELECT source, COUNT(*) FROM turns GROUP BY source').fetchall()),
+        }
+
+def replay(store, game_id, service):
+    """Re-run a stored game's commands against ``service`` (a MistralAI)
+
+    Each command is sent with the game state as it was recorded before that
+    turn, so every answer can be compared with the original one regardless
+    of how the replayed answers would have changed the game. Turns settled
+    by the game rules are yielded as recorded. Yields
+    ``(turn, response, seconds)``.
+    """
+
+    state = GameState().to_dict()
+    for turn in store.turns(game_id):
+        response, seconds = turn['response'], 0.0
+        if turn['source'] != 'rules':
+            game_state = GameState(**{**state, 'last_input': turn['user_input']})
+            started = time.perf_counter()
+            response = service.generate_response(turn['user_input'], game_state)
+            seconds = time.perf_counter() - started
+        yield turn, response, seconds
+        state.update(turn['delta'])
+
+if __name__ == '__main__':
+    import sys
+    import django
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
+    django.setup()
+
+    from django.conf import settings
+
+    store = TranscriptStore(settings.TRANSCRIPTS_PATH, retention=settings.TRANSCRIPTS_RETENTION_DAYS * 86400,
+                            max_turns=settings.TRANSCRIPTS_MAX_TURNS)
+    command, args = (sys.argv[1], sys.argv[2:]) if len(sys.argv) > 1 else ('stats', [])
+
+    if command == 'games':
+        for game_id, count, last_played in store.games(int(args[0]) if args else 20):
+            print(f"{game_id}  {count:4d} turns  {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(last_played))}")
+    elif command == 'show':
+        for number, turn in enumerate(store.turns(args[0]), 1):
+            print(f"#{number} [{turn['source']} via {turn['backend']}, {turn['latency_ms']:.0f}ms] > {turn['user_input']}")
+            print(f"   {turn['response']}")
+            if turn['delta']:
+                print(f"   {json.dumps(turn['delta'])}")
+    elif command == 'replay':
+        import ai_service
+        from llm_backends import get_backend
+
+        name, base_url, model = (args[1:] + [None, None, None])[:3]
+        backend = get_backend(name or settings.LLM_BACKEND, base_url=base_url, model=model,
+                              api_key=settings.MISTRAL_API_KEY)
+        service = ai_service.MistralAI(backend=backend)
+        # Fresh answers only: neither the response cache nor the calamity pool
+        service.response_cache.enabled = False
+        service.calamities.enabled = False
+        service.intents = None
+        for number, (turn, response, seconds) in enumerate(replay(store, args[0], service), 1):
+            print(f"#{number} > {turn['user_input']}")
+            print(f"   was [{turn['source']} via {turn['backend']}]: {turn['response']}")
+            if turn['source'] != 'rules':
+                print(f"   now [{backend.name}:{backend.model}, {seconds * 1000:.0f}ms]: {response}")
+    elif command == 'compact':
+        print(f"Deleted {store.compact()} turns")
+        print(json.dumps(store.summary(), indent=2))
+    else:
+        print(json.dumps(store.summary(), indent=2))
@@ -1,13 +1,29 @@
 from django.urls import path
 from django.conf import settings
-from django.conf.urls.static import static
+from django.contrib.staticfiles.urls import staticfiles_urlpatterns
 import views
 
+# The ASGI deployment (asgi.py) serves the async views so upstream calls
+# don't pin a thread; WSGI workers keep the sync ones.
+if settings.ASYNC_VIEWS:
+    process_input_view = views.process_input_async
+    process_input_stream_view = views.process_input_stream_async
+    speculate_view = views.speculate_async
+else:
+    process_input_view = views.process_input
+    process_input_stream_view = views.process_input_stream
+    speculate_view = views.speculate
+
 urlpatterns = [
     path('', views.index, name='index'),
-    path('process-input/', views.process_input, name='process_input'),
+    path('state/', views.state, name='state'),
+    path('process-input/', process_input_view, name='process_input'),
+    path('process-input/stream/', process_input_stream_view, name='process_input_stream'),
+    path('speculate/', speculate_view, name='speculate'),
+    path('status/ai/', views.ai_status, name='ai_status'),
+    path('metrics', views.metrics_view, name='metrics'),
 ]
 
-# Serve static files during development
-if settings.DEBUG:
-    urlpatterns += static(settings.STATIC_URL, document_root=settings.STATICFILES_DIRS[0])
+# Serve static files during development (through the finders, so the
+# bundles rebuild on change)
+urlpatterns += staticfiles_urlpatterns()
@@ -1,36 +1,155 @@
-from django.http import JsonResponse
-from django.shortcuts import render
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.template.loader import get_template, render_to_string
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 import ai_service
+import frontend
+import functools
+import hashlib
+import hmac
 import json
+import logging
 import os
+import time
+from game_state import GameState, GameStateStore
+from instrumentation import metrics, span
+from profiling import RequestProfiler
+from singleflight import TurnGate
+from speculation import Speculator
+from transcripts import TranscriptStore
 
+logger = logging.getLogger(__name__)
+
+# The rules of a turn (engine.py), shared with MistralAI
+engine = ai_service.mistral_ai.engine
+
+# Game states live in their own store; the session only carries the game ID
+game_store = GameStateStore(
+    settings.GAME_STATE_PATH,
+    flush_interval=settings.GAME_STATE_FLUSH_INTERVAL,
+    batch_size=settings.GAME_STATE_BATCH_SIZE,
+    max_age=settings.SESSION_COOKIE_AGE,
+)
+
+# Every played turn, appended in the background for analysis and replay
+transcript_store = TranscriptStore(
+    settings.TRANSCRIPTS_PATH,
+    flush_interval=settings.TRANSCRIPTS_FLUSH_INTERVAL,
+    retention=settings.TRANSCRIPTS_RETENTION_DAYS * 86400,
+    max_turns=settings.TRANSCRIPTS_MAX_TURNS,
+    enabled=settings.TRANSCRIPTS_ENABLED,
+)
+
+# Serializes each game's turns across threads and worker processes. A lease
+# outlives the longest possible upstream call, then expires on its own.
+turn_gate = TurnGate(
+    game_store,
+    wait_timeout=settings.TURN_WAIT_TIMEOUT,
+    lease_ttl=settings.MISTRAL_CONNECT_TIMEOUT + settings.MISTRAL_READ_TIMEOUT + 15,
+)
+
+# Commands played while the player is still typing them (opt-in); the
+# rate limits are host-wide buckets in the admission controller's store
+speculator = Speculator(
+    ai_service.mistral_ai.admission.take_token,
+    max_in_flight=settings.SPECULATION_MAX_IN_FLIGHT,
+    rate=settings.SPECULATION_RATE,
+    burst=settings.SPECULATION_BURST,
+    session_rate=settings.SPECULATION_SESSION_RATE,
+    session_burst=settings.SPECULATION_SESSION_BURST,
+    max_wait=settings.MISTRAL_BUDGET_MAX,
+    ttl=settings.SPECULATION_TTL,
+    enabled=settings.SPECULATION_ENABLED,
+)
+
+# Sampling profiler for single requests or a fraction of them (profiling.py)
+profiler = RequestProfiler(
+    settings.PROFILE_DIR,
+    token=settings.PROFILE_TOKEN,
+    sample_rate=settings.PROFILE_SAMPLE_RATE,
+    interval=settings.PROFILE_INTERVAL_MS / 1000,
+    keep=settings.PROFILE_KEEP,
+    format=settings.PROFILE_FORMAT,
+)
+
+@profiler.wrap
+@require_http_methods(["GET", "HEAD"])
 def index(request):
-    """Serve the main game page with initial game state"""
-    
-    # Initialize game state in session if not exists
-    if 'game_state' not in request.session:
-        request.session['game_state'] = {
-            'current_area': 'dark_forest',
-            'items': [],
-            'escape_attempts': 0,
-            'recent_actions': [],
-            'discovered_areas': ['dark_forest'],
-            'game_over': False,
-            'victory': False
+    """Serve the game page: the same static shell for every player
+    
+    Nothing here reads the session, so the page carries no cookie and
+    browsers and proxies may cache it (for INDEX_MAX_AGE seconds, then
+    revalidated with its ETag or Last-Modified). The player's game is
+    fetched from ``state`` once the page has loaded.
+    """
+    
+    shell = index_shell()
+    response = get_conditional_response(request, etag=shell['etag'], last_modified=shell['last_modified'])
+    if response is None:
+        response = HttpResponse(shell['html'])
+    response['ETag'] = shell['etag']
+    response['Last-Modified'] = http_date(shell['last_modified'])
+    patch_cache_control(response, public=True, max_age=settings.INDEX_MAX_AGE)
+    return response
+
+_index_shell = None
+
+def index_shell():
+    """The rendered page with its validators, built once per worker
+    
+    The shell only changes with a deploy: the ETag is a hash of the HTML
+    (which names the fingerprinted bundles) and Last-Modified the
+    template's modification time, so every worker answers alike.
+    """
+    
+    global _index_shell
+    if _index_shell is None:
+        html = render_to_string('index.html', {
+            'fonts': frontend.preload_fonts(),
+            'speculate_after': settings.SPECULATION_DEBOUNCE_MS if settings.SPECULATION_ENABLED else 0,
+        })
+        template = get_template('index.html').origin.name
+        _index_shell = {
+            'html': html,
+            'etag': quote_etag(hashlib.sha1(html.encode('utf-8')).hexdigest()),
+            'last_modified': int(os.path.getmtime(template)),
         }
+    return _index_shell
+
+@require_http_methods(["GET", "HEAD"])
+def state(request):
+    """The player's game as JSON; 304 when it hasn't changed since last fetched
     
-    # Debug: Check if API key is available
-    api_key_present = bool(os.environ.get('MISTRAL_API_KEY'))
-    print(f"DEBUG: Mistral API key present: {api_key_present}")
-    if api_key_present:
-        print(f"DEBUG: API key starts with: {os.environ.get('MISTRAL_API_KEY', '')[:10]}...")
+    Only reads the session: a visitor without a game gets a new game's
+    state, and the game itself starts with the first command.
+    """
     
-    return render(request, 'index.html', {
-        'game_state': request.session['game_state']
+    game_id = request.session.get('game_id')
+    with span('session_load'):
+        game_state = game_store.load(game_id) if game_id is not None else GameState()
+    
+    body = json.dumps({
+        'escape_attempts': game_state.get('escape_attempts', 0),
+        'max_attempts': engine.rules.max_escape_attempts,
+        'items': game_state.get('items', []),
+        'game_over': game_state.get('game_over', False),
+        'victory': game_state.get('victory', False),
     })
+    etag = quote_etag(hashlib.sha1(body.encode('utf-8')).hexdigest())
+    
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    # Cached per player, and always revalidated before use
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
 
+@profiler.wrap
 @csrf_exempt
 @require_http_methods(["POST"])
 def process_input(request):
@@ -44,137 +163,525 @@ def process_input(request):
             'error': 'Please enter a command.'
         })
     
+    game_id = get_game_id(request)
+    
+    # One turn per game at a time: duplicates share the result, other
+    # commands wait their turn (or are told the forest is still busy)
+    turn = turn_gate.enter(game_id, user_input)
+    if not turn.leader:
+        metrics.inc('wonderofu_turns_total', source='shared')
+        return JsonResponse(turn.result)
+    
+    payload = None
+    try:
+        payload = play_turn(game_id, user_input)
+    finally:
+        turn_gate.finish(turn, payload)
+    
+    return JsonResponse(payload)
+
+def play_turn(game_id, user_input):
+    """Load the game, play one command, save it and return the JSON payload"""
+    
+    started = time.perf_counter()
+    
     # Get or initialize game state
-    game_state = request.session.get('game_state', {})
+    with span('session_load'):
+        game_state = game_store.load(game_id)
+    before = game_state.encode()
     game_state['last_input'] = user_input
+    was_over = game_state.get('game_over', False)
+    
+    # The turn may already have been played while the player was typing
+    with span('speculation'):
+        speculated = speculator.claim(game_id, user_input, before)
     
-    # Check if game is over
-    if game_state.get('game_over', False):
-        if game_state.get('victory', False):
-            response_text = "You have escaped the forest! Your creativity triumphed over the malevolent forces. Congratulations!"
+    # Game over, creative victory and exhausted attempts never reach the AI
+    resolved = None if speculated else resolve_without_ai(user_input, game_state)
+    if resolved is not None:
+        with span('session_save'):
+            game_store.save(game_id, game_state)
+        count_turn('rules', game_state, was_over)
+        record_turn(game_id, user_input, resolved['response'], 'rules', before, game_state, started)
+        return resolved
+    
+    # Generate AI response
+    source = 'ai'
+    try:
+        if speculated:
+            response_text = adopt_speculation(speculated, user_input, game_state)
         else:
-            response_text = "The forest has claimed you. Your escape attempts have been exhausted. Game Over."
+            response_text = ai_service.mistral_ai.generate_response(user_input, game_state, player=game_id)
+            
+            # Update items based on certain actions
+            update_player_items(user_input, game_state)
         
-        return JsonResponse({
-            'success': True,
-            'response': response_text,
-            'game_over': True,
-            'victory': game_state.get('victory', False)
-        })
+    except Exception as e:
+        logger.warning("AI Service Error: %s", e)
+        response_text = get_fallback_response(user_input, game_state)
+        source = 'error'
     
-    # Special win condition check
-    victory_achieved = check_victory_condition(user_input, game_state)
+    # Save updated game state
+    with span('session_save'):
+        game_store.save(game_id, game_state)
+    count_turn(source, game_state, was_over)
+    record_turn(game_id, user_input, response_text, source, before, game_state, started)
     
-    if victory_achieved:
-        game_state['victory'] = True
-        game_state['game_over'] = True
-        response_text = "Against all odds, your creative solution has outsmarted the forest's malevolent influence! The trees part, revealing a clear path home. You've won through wit and imagination!"
-        
-        request.session['game_state'] = game_state
+    return {
+        'success': True,
+        'response': response_text,
+        'user_input': user_input,
+        'escape_attempts': game_state.get('escape_attempts', 0),
+        'max_attempts': engine.rules.max_escape_attempts,
+        'items': game_state.get('items', [])
+    }
+
+@profiler.wrap
+@csrf_exempt
+@require_http_methods(["POST"])
+def process_input_stream(request):
+    """Handle user input, streaming the forest's response as server-sent events
+    
+    The body is an event stream of ``token`` events followed by a single
+    ``done`` event carrying the same JSON payload ``process_input`` returns.
+    Turns that never reach the AI (game over, victory, a duplicate of the
+    command already being answered) consist of the ``done`` event alone.
+    """
+    
+    user_input = request.POST.get('user_input', '').strip()
+    
+    if not user_input:
         return JsonResponse({
-            'success': True,
-            'response': response_text,
-            'game_over': True,
-            'victory': True
+            'success': False,
+            'error': 'Please enter a command.'
         })
     
-    # Check if too many escape attempts
-    if game_state.get('escape_attempts', 0) >= 10:
-        game_state['game_over'] = True
-        response_text = "The forest's influence has grown too strong. Your repeated direct escape attempts have only made it more powerful. You are now permanently lost in its depths."
+    # Put the game ID in the session now, so the middleware sets the cookie
+    # before the body starts streaming
+    game_id = get_game_id(request)
+    
+    response = StreamingHttpResponse(
+        _stream_turn(game_id, user_input),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+def _stream_turn(game_id, user_input):
+    """Play a turn, relaying AI tokens as SSE events, then save the game
+    
+    The turn gate is entered inside the generator so that a response which
+    is never iterated (client gone) never holds the game's turn.
+    """
+    
+    turn = turn_gate.enter(game_id, user_input)
+    if not turn.leader:
+        metrics.inc('wonderofu_turns_total', source='shared')
+        yield _sse_event('done', turn.result)
+        return
+    
+    payload = None
+    try:
+        started = time.perf_counter()
+        with span('session_load'):
+            game_state = game_store.load(game_id)
+        before = game_state.encode()
+        game_state['last_input'] = user_input
+        was_over = game_state.get('game_over', False)
+        
+        with span('speculation'):
+            speculated = speculator.claim(game_id, user_input, before)
         
-        request.session['game_state'] = game_state
+        source = 'rules'
+        payload = None if speculated else resolve_without_ai(user_input, game_state)
+        if payload is None:
+            response_text = None
+            source = 'ai'
+            try:
+                if speculated:
+                    # Already answered: the done event alone carries it
+                    response_text = adopt_speculation(speculated, user_input, game_state)
+                else:
+                    for kind, text in ai_service.mistral_ai.stream_response(user_input, game_state, player=game_id):
+                        if kind == 'token':
+                            yield _sse_event('token', {'text': text})
+                        else:
+                            response_text = text
+                    
+                    update_player_items(user_input, game_state)
+                
+            except Exception as e:
+                logger.warning("AI Service Error: %s", e)
+                response_text = get_fallback_response(user_input, game_state)
+                source = 'error'
+            
+            payload = _stream_payload(user_input, response_text, game_state)
+        
+        with span('session_save'):
+            game_store.save(game_id, game_state)
+        count_turn(source, game_state, was_over)
+        record_turn(game_id, user_input, payload['response'], source, before, game_state, started)
+        yield _sse_event('done', payload)
+    finally:
+        turn_gate.finish(turn, payload)
+
+def _stream_payload(user_input, response_text, game_state):
+    """The ``done`` event payload; also reports game over, which can happen mid-stream"""
+    
+    return {
+        'success': True,
+        'response': response_text,
+        'user_input': user_input,
+        'escape_attempts': game_state.get('escape_attempts', 0),
+        'max_attempts': engine.rules.max_escape_attempts,
+        'items': game_state.get('items', []),
+        'game_over': game_state.get('game_over', False),
+        'victory': game_state.get('victory', False)
+    }
+
+def _sse_event(event, data):
+    """Encode a single server-sent event"""
+    
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@profiler.wrap
+@csrf_exempt
+@require_http_methods(["POST"])
+async def process_input_async(request):
+    """Async ``process_input`` for the ASGI deployment (same JSON contract)
+    
+    Game state storage and the turn gate block on SQLite, so they run in a
+    worker thread via ``sync_to_async``; the upstream call itself awaits
+    without holding a thread, letting one worker serve many players at once.
+    """
+    
+    user_input = request.POST.get('user_input', '').strip()
+    
+    if not user_input:
         return JsonResponse({
-            'success': True,
-            'response': response_text,
-            'game_over': True,
-            'victory': False
+            'success': False,
+            'error': 'Please enter a command.'
         })
     
-    # Generate AI response
+    game_id = await sync_to_async(get_game_id)(request)
+    
+    turn = await turn_gate.aenter(game_id, user_input)
+    if not turn.leader:
+        metrics.inc('wonderofu_turns_total', source='shared')
+        return JsonResponse(turn.result)
+    
+    payload = None
     try:
-        response_text = ai_service.mistral_ai.generate_response(user_input, game_state)
-        
-        # Update items based on certain actions
-        update_player_items(user_input, game_state)
+        payload = await aplay_turn(game_id, user_input)
+    finally:
+        await turn_gate.afinish(turn, payload)
+    
+    return JsonResponse(payload)
+
+async def aplay_turn(game_id, user_input):
+    """Async ``play_turn``"""
+    
+    started = time.perf_counter()
+    game_state = await aload_game(game_id)
+    before = game_state.encode()
+    game_state['last_input'] = user_input
+    was_over = game_state.get('game_over', False)
+    
+    with span('speculation'):
+        speculated = await speculator.aclaim(game_id, user_input, before)
+    
+    resolved = None if speculated else resolve_without_ai(user_input, game_state)
+    if resolved is not None:
+        await asave_game(game_id, game_state)
+        count_turn('rules', game_state, was_over)
+        record_turn(game_id, user_input, resolved['response'], 'rules', before, game_state, started)
+        return resolved
+    
+    source = 'ai'
+    try:
+        if speculated:
+            response_text = adopt_speculation(speculated, user_input, game_state)
+        else:
+            response_text = await ai_service.mistral_ai.agenerate_response(user_input, game_state, player=game_id)
+            
+            update_player_items(user_input, game_state)
         
     except Exception as e:
-        print(f"AI Service Error: {e}")
+        logger.warning("AI Service Error: %s", e)
         response_text = get_fallback_response(user_input, game_state)
+        source = 'error'
     
-    # Save updated game state
-    request.session['game_state'] = game_state
+    await asave_game(game_id, game_state)
+    count_turn(source, game_state, was_over)
+    record_turn(game_id, user_input, response_text, source, before, game_state, started)
     
-    return JsonResponse({
+    return {
         'success': True,
         'response': response_text,
         'user_input': user_input,
         'escape_attempts': game_state.get('escape_attempts', 0),
-        'max_attempts': 10,
+        'max_attempts': engine.rules.max_escape_attempts,
         'items': game_state.get('items', [])
-    })
+    }
 
-def check_victory_condition(user_input, game_state):
-    """Check for creative victory conditions that outsmart the AI"""
+@profiler.wrap
+@csrf_exempt
+@require_http_methods(["POST"])
+async def process_input_stream_async(request):
+    """Async ``process_input_stream``; streams through an async iterator
     
-    creative_solutions = [
-        # Psychological/philosophical approaches
-        ('embrace the forest', 'accept being lost', 'become one with forest'),
-        ('thank the forest', 'appreciate the forest', 'respect the forest'),
-        ('ask forest what it wants', 'communicate with forest', 'talk to forest'),
-        
-        # Meta-gaming approaches
-        ('close my eyes and think of home', 'meditate on home', 'visualize escape'),
-        ('refuse to play the game', 'ignore the forest', 'pretend forest isn\'t real'),
+    Under ASGI Django buffers synchronous streaming iterators in full, so
+    the ASGI deployment needs this variant to stream tokens as they arrive.
+    """
+    
+    user_input = request.POST.get('user_input', '').strip()
+    
+    if not user_input:
+        return JsonResponse({
+            'success': False,
+            'error': 'Please enter a command.'
+        })
+    
+    game_id = await sync_to_async(get_game_id)(request)
+    
+    response = StreamingHttpResponse(
+        _astream_turn(game_id, user_input),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+async def _astream_turn(game_id, user_input):
+    """Async counterpart of ``_stream_turn``"""
+    
+    turn = await turn_gate.aenter(game_id, user_input)
+    if not turn.leader:
+        metrics.inc('wonderofu_turns_total', source='shared')
+        yield _sse_event('done', turn.result)
+        return
+    
+    payload = None
+    try:
+        started = time.perf_counter()
+        game_state = await aload_game(game_id)
+        before = game_state.encode()
+        game_state['last_input'] = user_input
+        was_over = game_state.get('game_over', False)
         
-        # Reverse psychology
-        ('decide to stay forever', 'make this my home', 'never want to leave'),
-        ('plant a tree', 'help the forest grow', 'nurture the forest'),
+        with span('speculation'):
+            speculated = await speculator.aclaim(game_id, user_input, before)
         
-        # Unexpected creative actions
-        ('sing to the forest', 'dance with the trees', 'tell forest a story'),
-        ('apologize for intruding', 'ask for forgiveness', 'show humility'),
-    ]
-    
-    user_lower = user_input.lower()
-    
-    for solution_group in creative_solutions:
-        if any(solution in user_lower for solution in solution_group):
-            # Require multiple creative attempts before victory
-            creative_count = game_state.get('creative_attempts', 0) + 1
-            game_state['creative_attempts'] = creative_count
+        source = 'rules'
+        payload = None if speculated else resolve_without_ai(user_input, game_state)
+        if payload is None:
+            response_text = None
+            source = 'ai'
+            try:
+                if speculated:
+                    response_text = adopt_speculation(speculated, user_input, game_state)
+                else:
+                    async for kind, text in ai_service.mistral_ai.astream_response(user_input, game_state, player=game_id):
+                        if kind == 'token':
+                            yield _sse_event('token', {'text': text})
+                        else:
+                            response_text = text
+                    
+                    update_player_items(user_input, game_state)
+                
+            except Exception as e:
+                logger.warning("AI Service Error: %s", e)
+                response_text = get_fallback_response(user_input, game_state)
+                source = 'error'
             
-            if creative_count >= 2:  # Need at least 2 creative solutions
-                return True
+            payload = _stream_payload(user_input, response_text, game_state)
+        
+        await asave_game(game_id, game_state)
+        count_turn(source, game_state, was_over)
+        record_turn(game_id, user_input, payload['response'], source, before, game_state, started)
+        yield _sse_event('done', payload)
+    finally:
+        await turn_gate.afinish(turn, payload)
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def speculate(request):
+    """Start playing the command the player is still typing (see speculation.py)
+    
+    Nothing is saved: submitting the same command picks the turn up, any
+    other command drops it. Answers whether a speculation is running.
+    """
     
-    return False
+    draft = request.POST.get('user_input', '').strip()
+    game_id = get_game_id(request)
+    with span('session_load'):
+        game_state = game_store.load(game_id)
+    return JsonResponse({'speculating': start_speculation(game_id, draft, game_state)})
 
-def update_player_items(user_input, game_state):
-    """Update player inventory based on actions"""
+@csrf_exempt
+@require_http_methods(["POST"])
+async def speculate_async(request):
+    """Async ``speculate`` for the ASGI deployment"""
     
-    items = game_state.get('items', [])
-    user_lower = user_input.lower()
+    draft = request.POST.get('user_input', '').strip()
+    game_id = await sync_to_async(get_game_id)(request)
+    game_state = await aload_game(game_id)
+    # Its rate checks write to the admission store
+    speculating = await sync_to_async(start_speculation, thread_sensitive=False)(game_id, draft, game_state)
+    return JsonResponse({'speculating': speculating})
+
+def start_speculation(game_id, draft, game_state):
+    """Play ``draft`` on a copy of the game in the background; False if not worth it"""
     
-    # Find items
-    if 'search' in user_lower or 'look for' in user_lower:
-        if 'flashlight' not in items and 'pocket' in user_lower:
-            items.append('flashlight')
-        elif 'stick' not in items and ('ground' in user_lower or 'branch' in user_lower):
-            items.append('stick')
+    if not draft or not speculator.enabled or not ai_service.mistral_ai.can_speculate():
+        return False
     
-    # Use items (they might break due to forest influence)
-    if 'use flashlight' in user_lower and 'flashlight' in items:
-        if game_state.get('escape_attempts', 0) > 3:
-            items.remove('flashlight')  # Forest breaks it
+    fingerprint = game_state.encode()
+    draft_state = GameState.decode(fingerprint)
+    draft_state['last_input'] = draft
     
-    game_state['items'] = items
+    # Turns the rules answer are instant anyway
+    if resolve_without_ai(draft, draft_state) is not None:
+        return False
+    return speculator.start(game_id, draft, fingerprint, draft_state, speculate_turn)
 
-def get_fallback_response(user_input, game_state):
-    """Fallback response when AI is unavailable"""
+def speculate_turn(draft, game_state):
+    """The speculator's ``play``: the turn ``play_turn`` would play, unsaved
     
-    escape_keywords = ['leave', 'exit', 'escape', 'way out', 'get out']
-    if any(keyword in user_input.lower() for keyword in escape_keywords):
-        game_state['escape_attempts'] = game_state.get('escape_attempts', 0) + 1
-        return "The forest seems to sense your desire to leave. The paths shift and change, leading you in circles. Your direct approach has only made the forest more suspicious of your intentions."
+    No player is passed on, so drafts don't use up the game's admission
+    rate limit (the speculator has its own). A fallback is not worth
+    keeping: the submit gets a fresh chance at the AI instead.
+    """
     
-    return "The forest responds to your action with an eerie silence. Something about this place actively resists your efforts, as if it has a will of its own."
+    response_text = ai_service.mistral_ai.generate_response(draft, game_state)
+    source = ai_service.response_source.get() or 'ai'
+    if source == 'fallback':
+        return None
+    update_player_items(draft, game_state)
+    return {
+        'response': response_text,
+        'state': game_state.encode(),
+        'source': source,
+        'backend': ai_service.response_backend.get() or '',
+    }
+
+def adopt_speculation(speculated, user_input, game_state):
+    """Take over a speculated turn's game state; returns its response
+    
+    The response source and backend are set for ``record_turn`` as if the
+    turn had been played in this request.
+    """
+    
+    for field, value in GameState.decode(speculated['state']).to_dict().items():
+        game_state[field] = value
+    game_state['last_input'] = user_input
+    ai_service.response_source.set(speculated['source'])
+    ai_service.response_backend.set(speculated['backend'])
+    return speculated['response']
+
+def require_status_token(view):
+    """Serve ``view`` only to requests carrying STATUS_TOKEN
+    
+    As an ``Authorization: Bearer`` header (what Prometheus sends) or a
+    ``?token=`` query parameter. Anything else, and every request while
+    STATUS_TOKEN is empty, gets a 404 as if the endpoint did not exist.
+    """
+    
+    @functools.wraps(view)
+    def guarded(request, *args, **kwargs):
+        token = settings.STATUS_TOKEN
+        scheme, _, presented = request.headers.get('Authorization', '').partition(' ')
+        if scheme.lower() != 'bearer':
+            presented = request.GET.get('token', '')
+        if not token or not hmac.compare_digest(presented.encode(), token.encode()):
+            raise Http404()
+        return view(request, *args, **kwargs)
+    return guarded
+
+@require_http_methods(["GET"])
+@require_status_token
+def ai_status(request):
+    """Circuit breaker and latency budget of the worker serving this request"""
+    
+    return JsonResponse({**ai_service.mistral_ai.status(), 'speculation': speculator.snapshot()})
+
+@require_http_methods(["GET"])
+@require_status_token
+def metrics_view(request):
+    """Prometheus text exposition of every worker's counters and histograms"""
+    
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+def get_game_id(request):
+    """Return this player's game ID, starting a new game if needed
+    
+    Every command renews the session cookie, so a game expires
+    SESSION_COOKIE_AGE after its last command rather than its first.
+    """
+    
+    game_id = request.session.get('game_id')
+    if game_id is None:
+        game_id = game_store.new_id()
+        request.session['game_id'] = game_id
+        metrics.inc('wonderofu_games_started_total')
+    else:
+        request.session.modified = True
+    return game_id
+
+def count_turn(source, game_state, was_over):
+    """Count a played turn, and the game's result if this turn ended it"""
+    
+    metrics.inc('wonderofu_turns_total', source=source)
+    if game_state.get('game_over', False) and not was_over:
+        result = 'victory' if game_state.get('victory', False) else 'defeat'
+        metrics.inc('wonderofu_games_finished_total', result=result)
+
+def record_turn(game_id, user_input, response_text, source, before, game_state, started):
+    """Append the turn to the transcripts (queued in memory, never waits on disk)
+    
+    ``before`` is the encoded state as loaded; AI turns are logged by where the
+    answer came from (ai, cache or fallback) and the backend asked.
+    """
+    
+    backend = ''
+    if source == 'ai':
+        source = ai_service.response_source.get() or 'ai'
+        if source == 'ai':
+            backend = ai_service.response_backend.get() or ''
+    queued = transcript_store.append(
+        game_id, user_input, response_text, source, backend,
+        time.perf_counter() - started, before, game_state.encode()
+    )
+    metrics.inc('wonderofu_transcript_turns_total', result='queued' if queued else 'dropped')
+
+async def aload_game(game_id):
+    """Async ``game_store.load``"""
+    
+    with span('session_load'):
+        return await sync_to_async(game_store.load, thread_sensitive=False)(game_id)
+
+async def asave_game(game_id, game_state):
+    """Async ``game_store.save``"""
+    
+    with span('session_save'):
+        await sync_to_async(game_store.save, thread_sensitive=False)(game_id, game_state)
+
+def resolve_without_ai(user_input, game_state):
+    """Return the response payload for turns that never reach the AI, else None"""
+    
+    resolved = engine.resolve(user_input, game_state)
+    if resolved is None:
+        return None
+    
+    return {
+        'success': True,
+        'response': resolved[0],
+        'game_over': True,
+        'victory': game_state.get('victory', False)
+    }
+
+# The rest of a turn's rules, under the names the views use
+check_victory_condition = engine.check_victory_condition
+update_player_items = engine.update_items
+get_fallback_response = engine.error_response
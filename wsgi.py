@@ -13,3 +13,13 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
 
 application = get_wsgi_application()
+
+# Import the views and compile templates now rather than on the first
+# request, and open pooled connections to the AI backend. Under
+# gunicorn.conf.py this module loads in the master, so each forked worker
+# opens its own connections instead (see startup.py).
+import startup
+
+startup.prepare()
+if not startup.preloaded():
+    startup.warm_up()